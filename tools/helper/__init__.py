@@ -3,5 +3,6 @@ Helper utilities for WoT tools
 """
 
 from .progress_display import ProgressDisplay, SimpleProgress
+from .trace import TraceRecorder, NullTraceRecorder
 
-__all__ = ['ProgressDisplay', 'SimpleProgress']
\ No newline at end of file
+__all__ = ['ProgressDisplay', 'SimpleProgress', 'TraceRecorder', 'NullTraceRecorder']
\ No newline at end of file
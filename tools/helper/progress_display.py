@@ -3,38 +3,114 @@ Progress Display Module
 Handles progress bar and status display for tools
 """
 
+import os
+import queue
+import shutil
 import sys
+import threading
 import time
-from typing import Optional
+from typing import Dict
 
 
 class ProgressDisplay:
-    """Handles progress display with a progress bar"""
-
-    def __init__(self, total_items: int):
+    """
+    Progress display with a progress bar, drawn by a background thread.
+
+    Producers only put small tuples on a queue; the renderer thread drains it
+    and redraws at a fixed rate. Events are (kind, lane, name, nbytes):
+      'done'  - an item finished (counted, name shown as the last file)
+      'start' - lane began working on name
+      'end'   - lane went idle; nbytes are added to the byte rate
+      'pkg'   - current PKG changed
+    Lanes (e.g. worker pids) each get their own line under the bar.
+    """
+
+    update_interval = 0.1  # Redraw every 100ms
+    size_interval = 1.0  # Re-read terminal size at most once a second
+
+    def __init__(self, total_items: int, event_queue=None):
         self.total_items = total_items
         self.current_item = 0
         self.current_pkg = ""
+        self.current_file = ""
+        self.total_bytes = 0
+        self.lanes: Dict[object, str] = {}
         self.start_time = time.time()
-        self.last_update_time = 0
-        self.update_interval = 0.1  # Update display every 100ms
+        self.events = event_queue if event_queue is not None else queue.SimpleQueue()
+
+        self._terminal_width = 200
+        self._size_checked = 0.0
+        self._drawn_lines = 0
+        if os.name == 'nt':
+            # Lane lines are redrawn with ANSI cursor movement; enable VT processing
+            os.system('')
+        self._thread = threading.Thread(target=self._render_loop, name="progress", daemon=True)
+        self._thread.start()
 
     def update_current_pkg(self, pkg_name: str):
         """Update the current PKG being processed"""
-        self.current_pkg = pkg_name
+        self.events.put(('pkg', None, pkg_name, 0))
 
-    def update(self, item_name: str):
+    def update(self, item_name: str, nbytes: int = 0):
         """Update progress for a processed item"""
-        self.current_item += 1
+        self.events.put(('done', None, item_name, nbytes))
+
+    def start_item(self, lane, item_name: str):
+        """Mark lane as working on item_name"""
+        self.events.put(('start', lane, item_name, 0))
+
+    def end_item(self, lane, nbytes: int = 0):
+        """Mark lane as idle"""
+        self.events.put(('end', lane, "", nbytes))
+
+    def _apply(self, event) -> bool:
+        """Apply one event to the display state; returns False on the stop sentinel"""
+        kind, lane, name, nbytes = event
+        if kind == 'done':
+            self.current_item += 1
+            self.current_file = name
+            self.total_bytes += nbytes
+        elif kind == 'start':
+            self.lanes[lane] = name
+        elif kind == 'end':
+            self.lanes[lane] = ""
+            self.total_bytes += nbytes
+        elif kind == 'pkg':
+            self.current_pkg = name
+        elif kind == 'stop':
+            return False
+        return True
+
+    def _render_loop(self):
+        """Drain events and redraw at a fixed rate until stopped"""
+        running = True
+        dirty = False
+        next_draw = time.time() + self.update_interval
+        while running:
+            timeout = max(0.0, next_draw - time.time())
+            try:
+                event = self.events.get(timeout=timeout)
+                running = self._apply(event)
+                dirty = True
+                # Drain whatever else is already queued before drawing
+                while running:
+                    running = self._apply(self.events.get_nowait())
+            except queue.Empty:
+                pass
+
+            now = time.time()
+            if now >= next_draw:
+                next_draw = now + self.update_interval
+                if dirty:
+                    dirty = False
+                    self._display_progress(now)
 
-        # Only update display if enough time has passed
-        current_time = time.time()
-        if current_time - self.last_update_time >= self.update_interval or self.current_item == self.total_items:
-            self.last_update_time = current_time
-            self._display_progress(item_name)
+        if self.current_item > 0:
+            self.current_file = "Complete"
+            self._display_progress(time.time())
 
-    def _display_progress(self, current_file: str):
-        """Display the progress bar and current status"""
+    def _display_progress(self, now: float):
+        """Display the progress bar, aggregate rates and one line per lane"""
         # Calculate progress
         if self.total_items == 0:
             percentage = 100
@@ -42,7 +118,7 @@ class ProgressDisplay:
             percentage = (self.current_item / self.total_items) * 100
 
         # Calculate elapsed time and estimated time
-        elapsed_time = time.time() - self.start_time
+        elapsed_time = now - self.start_time
         if self.current_item > 0:
             avg_time_per_item = elapsed_time / self.current_item
             remaining_items = self.total_items - self.current_item
@@ -55,19 +131,17 @@ class ProgressDisplay:
         filled = int(bar_width * percentage / 100)
         bar = '#' * filled + '-' * (bar_width - filled)
 
-        # Format times
+        # Format times and rates
         elapsed_str = self._format_time(elapsed_time)
         remaining_str = self._format_time(estimated_remaining)
-
-        # Truncate file name if too long
-        max_filename_len = 50
-        if len(current_file) > max_filename_len:
-            current_file = "..." + current_file[-(max_filename_len - 3):]
+        files_rate = self.current_item / elapsed_time if elapsed_time > 0 else 0.0
+        bytes_rate = self.total_bytes / elapsed_time if elapsed_time > 0 else 0.0
 
         # Build status line
         status_line = (
             f"[{bar}] {percentage:5.1f}% "
             f"({self.current_item}/{self.total_items}) "
+            f"| {files_rate:.1f} files/s, {self._format_bytes(bytes_rate)}/s "
         )
 
         # Add PKG info if available
@@ -76,24 +150,52 @@ class ProgressDisplay:
 
         status_line += (
             f"| Elapsed: {elapsed_str} "
-            f"| ETA: {remaining_str} "
-            f"| File: {current_file}"
+            f"| ETA: {remaining_str}"
         )
-
-        # Get terminal width for proper clearing
-        try:
-            import shutil
-            terminal_width = shutil.get_terminal_size().columns
-        except:
-            terminal_width = 200
-
-        # Pad with spaces to clear the entire line
-        status_line = status_line[:terminal_width-1].ljust(terminal_width-1)
-
-        # Write status with carriage return
-        sys.stdout.write('\r' + status_line)
+        if not self.lanes:
+            status_line += f" | File: {self._truncate(self.current_file)}"
+
+        lines = [status_line]
+        for lane, item in self.lanes.items():
+            lines.append(f"  [{lane}] {self._truncate(item) if item else 'idle'}")
+
+        # Get terminal width for proper clearing (cached, it is a syscall)
+        if now - self._size_checked >= self.size_interval:
+            self._size_checked = now
+            try:
+                self._terminal_width = shutil.get_terminal_size().columns
+            except:
+                self._terminal_width = 200
+        width = self._terminal_width - 1
+
+        # Move back to the first line of the previous frame; lanes are never
+        # removed, so a frame is never shorter than the one before it
+        output = '\r'
+        if self._drawn_lines > 1:
+            output += f"\x1b[{self._drawn_lines - 1}A"
+        # Pad with spaces to clear each entire line
+        output += '\n'.join(line[:width].ljust(width) for line in lines)
+        self._drawn_lines = len(lines)
+
+        sys.stdout.write(output)
         sys.stdout.flush()
 
+    @staticmethod
+    def _truncate(file_name: str, max_len: int = 50) -> str:
+        """Truncate file name if too long"""
+        if len(file_name) > max_len:
+            return "..." + file_name[-(max_len - 3):]
+        return file_name
+
+    @staticmethod
+    def _format_bytes(num: float) -> str:
+        """Format a byte count to a readable string"""
+        for unit in ('B', 'KB', 'MB'):
+            if num < 1024:
+                return f"{num:.1f} {unit}"
+            num /= 1024
+        return f"{num:.1f} GB"
+
     def _format_time(self, seconds: float) -> str:
         """Format time in seconds to a readable string"""
         if seconds < 60:
@@ -109,8 +211,8 @@ class ProgressDisplay:
 
     def finish(self):
         """Finish the progress display"""
-        if self.current_item > 0:
-            self._display_progress("Complete")
+        self.events.put(('stop', None, "", 0))
+        self._thread.join()
         print()  # New line after progress bar
 
 
@@ -127,11 +229,19 @@ class SimpleProgress:
         self.current_pkg = pkg_name
         print(f"\nProcessing: {pkg_name}")
 
-    def update(self, item_name: str):
+    def update(self, item_name: str, nbytes: int = 0):
         """Update progress for a processed item"""
         self.current_item += 1
         print(f"  [{self.current_item}/{self.total_items}] Extracted: {item_name}")
 
+    def start_item(self, lane, item_name: str):
+        """Lanes are not shown in simple mode"""
+        pass
+
+    def end_item(self, lane, nbytes: int = 0):
+        """Lanes are not shown in simple mode"""
+        pass
+
     def finish(self):
         """Finish the progress display"""
         print(f"\nCompleted: {self.current_item}/{self.total_items} files")
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Trace Recorder Module
+Collects Chrome trace-event spans and writes them as a JSON timeline
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+def now_us() -> int:
+    """Current wall-clock time in microseconds (comparable across processes)"""
+    return int(time.time() * 1000000)
+
+
+class TraceRecorder:
+    """Records trace events and saves them in Chrome trace-event format"""
+
+    def __init__(self, output_path: str, process_name: str = "wot_tools"):
+        self.output_path = output_path
+        self.pid = os.getpid()
+        self.events: List[Dict] = []
+        self.lanes: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.process_name = process_name
+        self.main_tid = threading.get_ident()
+        self.name_lane(self.main_tid, "main")
+
+    def name_lane(self, tid: int, name: str):
+        """Give a lane (thread id) a readable name in the viewer"""
+        self.lanes[tid] = name
+
+    def add_event(self, event: Dict):
+        """Add a raw event; ts/dur are absolute microseconds"""
+        event.setdefault('pid', self.pid)
+        event.setdefault('tid', self.main_tid)
+        event.setdefault('cat', 'run')
+        with self._lock:
+            self.events.append(event)
+
+    def add_events(self, events: List[Dict]):
+        """Add a batch of raw events (e.g. returned from a worker process)"""
+        for event in events:
+            self.add_event(event)
+
+    def complete(self, name: str, start_us: int, end_us: int, tid: Optional[int] = None,
+                 cat: str = 'run', args: Optional[Dict] = None):
+        """Record a finished span"""
+        event = {'name': name, 'ph': 'X', 'ts': start_us, 'dur': max(0, end_us - start_us), 'cat': cat}
+        if tid is not None:
+            event['tid'] = tid
+        if args:
+            event['args'] = args
+        self.add_event(event)
+
+    def async_span(self, name: str, span_id: int, start_us: int, end_us: int,
+                   cat: str = 'queue', args: Optional[Dict] = None):
+        """Record an async span; overlapping spans get their own rows in the viewer"""
+        begin = {'name': name, 'ph': 'b', 'ts': start_us, 'id': span_id, 'cat': cat}
+        if args:
+            begin['args'] = args
+        self.add_event(begin)
+        self.add_event({'name': name, 'ph': 'e', 'ts': end_us, 'id': span_id, 'cat': cat})
+
+    @contextmanager
+    def span(self, name: str, tid: Optional[int] = None, cat: str = 'run', **args):
+        """
+        Context manager recording the enclosed block as one span.
+        Yields the span's args dict so results can be attached before it closes.
+        """
+        start = now_us()
+        try:
+            yield args
+        finally:
+            self.complete(name, start, now_us(), tid=tid, cat=cat, args=args or None)
+
+    def save(self):
+        """Write the timeline; timestamps are rebased to the earliest event"""
+        with self._lock:
+            events = list(self.events)
+        origin = min((e['ts'] for e in events), default=0)
+
+        trace_events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': self.main_tid,
+            'args': {'name': self.process_name}
+        }]
+        for tid, lane_name in self.lanes.items():
+            trace_events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                'args': {'name': lane_name}
+            })
+        for event in events:
+            event = dict(event)
+            event['ts'] = event['ts'] - origin
+            trace_events.append(event)
+
+        with open(self.output_path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+
+class NullTraceRecorder(TraceRecorder):
+    """Trace recorder that records nothing (used when tracing is disabled)"""
+
+    def __init__(self):
+        self.events = []
+        self.lanes = {}
+        self.main_tid = threading.get_ident()
+
+    def name_lane(self, tid: int, name: str):
+        pass
+
+    def add_event(self, event: Dict):
+        pass
+
+    def save(self):
+        pass
+
+    def __bool__(self):
+        return False
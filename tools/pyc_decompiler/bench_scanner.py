@@ -0,0 +1,165 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Scanner Benchmarks
+Times the Python 2.7 scanner (uncompyle6.scanners.scanner27) on
+generated functions that stress its block queries, statement indexing
+and jump target detection, and on disassembling a large module
+"""
+
+from __future__ import print_function
+import os
+import sys
+import timeit
+
+# Add the current directory to path to use the local custom uncompyle6
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from uncompyle6.code import iscode
+from uncompyle6.opcodes.opcode_27 import (
+    JUMP_ABSOLUTE, JUMP_FORWARD, POP_JUMP_IF_FALSE, POP_JUMP_IF_TRUE,
+    RETURN_VALUE, SETUP_EXCEPT, SETUP_LOOP)
+from uncompyle6.scanners.scanner27 import Scanner27
+
+
+def compile_function(body):
+    """The code object of def f(x, y) with the given body lines, then return y"""
+    lines = ['def f(x, y):'] + body + ['    return y']
+    namespace = {}
+    exec(compile('\n'.join(lines), '<bench>', 'exec'), namespace)
+    return namespace['f'].__code__
+
+
+def if_chain(count):
+    """count 'if x == i and y:' statements one after another"""
+    body = []
+    for i in range(count):
+        body.append('    if x == %d and y:' % i)
+        body.append('        y = x + %d' % i)
+    return body
+
+
+def best_of(func, repeat=3):
+    """The fastest of repeat runs of func, in milliseconds"""
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def find_jump_targets(scanner, co):
+    """A find_jump_targets pass over co, with the setup it needs"""
+    n = scanner.setup_code(co)
+    scanner.build_lines_data(co, n)
+    scanner.build_prev_op(n)
+    scanner.find_jump_targets()
+
+
+def bench_block_queries(scanner):
+    """
+    The block queries detect_structure makes, over a ~10k instruction
+    function, with and without the instruction index
+    """
+    co = compile_function(if_chain(910))
+    n = scanner.setup_code(co)
+    index = scanner.insts, scanner.op_offsets
+    jumps = scanner.instr_offsets(0, n, [POP_JUMP_IF_FALSE])
+
+    def queries():
+        results = []
+        for pos in jumps:
+            target = scanner.get_target(pos)
+            results.append(scanner.first_instr(pos, n, RETURN_VALUE))
+            results.append(scanner.first_instr(pos, n, [JUMP_ABSOLUTE, JUMP_FORWARD]))
+            results.append(scanner.last_instr(0, pos, [SETUP_LOOP, SETUP_EXCEPT]))
+            results.append(scanner.all_instr(pos, target, [POP_JUMP_IF_FALSE, POP_JUMP_IF_TRUE]))
+            results.append(scanner.rem_or(pos, target, POP_JUMP_IF_FALSE, target))
+        return results
+
+    print("%d instructions, %d queries" % (len(scanner.insts), 5 * len(jumps)))
+    results = None
+    for name, (insts, op_offsets) in (('indexed', index), ('unindexed', (None, None))):
+        scanner.insts, scanner.op_offsets = insts, op_offsets
+        print("%-10s %8.1f ms" % (name, best_of(queries, repeat=1)))
+        if results is None:
+            results = queries()
+        else:
+            assert results == queries()
+
+
+def bench_stmt_indices(scanner):
+    """Statement indexing should stay linear in the code size"""
+    for count in (2500, 5000, 10000):
+        co = compile_function(if_chain(count))
+        n = scanner.setup_code(co)
+        scanner.build_lines_data(co, n)
+        scanner.build_prev_op(n)
+        print("build_stmt_indices %7d bytes %8.1f ms" %
+              (n, best_of(scanner.build_stmt_indices)))
+
+
+def bench_structures(scanner):
+    """
+    The parent structure lookups of detect_structure should not grow
+    with the number of blocks in the function
+    """
+    for count in (200, 400, 800):
+        body = []
+        for i in range(count):
+            body.append('    for a in x:')
+            body.append('        try:')
+            body.append('            y = a + %d' % i)
+            body.append('        except ValueError:')
+            body.append('            break')
+        co = compile_function(body)
+        seconds = best_of(lambda: find_jump_targets(scanner, co))
+        print("find_jump_targets %5d structures %8.1f ms" % (len(scanner.structs), seconds))
+
+
+def bench_elif_targets(scanner):
+    """
+    Jump target bookkeeping for a loop whose elif branches all jump to
+    the same place
+    """
+    for count in (500, 1000, 2000):
+        body = ['    for a in x:']
+        for i in range(count):
+            body.append('        %s a == %d:' % (i and 'elif' or 'if', i))
+            body.append('            y = %d' % i)
+        body.append('        y = a')
+        co = compile_function(body)
+        seconds = best_of(lambda: find_jump_targets(scanner, co))
+        print("find_jump_targets %5d branches %8.1f ms" % (count, seconds))
+
+
+def bench_disassemble(scanner):
+    """
+    Disassembling every code object of a large module, which spends
+    most of its time classifying opcodes
+    """
+    import decimal
+    source = decimal.__file__
+    if source.endswith('.pyc'):
+        source = source[:-1]
+    with open(source) as fp:
+        co = compile(fp.read(), source, 'exec')
+
+    def disassemble_all():
+        count = 0
+        todo = [co]
+        while todo:
+            code = todo.pop()
+            tokens, customize = scanner.disassemble(code)
+            count += len(tokens)
+            todo.extend(c for c in code.co_consts if iscode(c))
+        return count
+    count = disassemble_all()
+    print("disassemble decimal %6d tokens %8.1f ms" % (count, best_of(disassemble_all)))
+
+
+def main():
+    for bench in (bench_block_queries, bench_stmt_indices, bench_structures,
+                  bench_elif_targets, bench_disassemble):
+        bench(Scanner27())
+        print()
+
+
+if __name__ == '__main__':
+    main()
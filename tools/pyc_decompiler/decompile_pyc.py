@@ -12,6 +12,10 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 from handler import DecompilerHandler
 
+# Add parent directory to path to import helper
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from helper import TraceRecorder, NullTraceRecorder
+
 
 def parse_arguments():
     """Parse command line arguments"""
@@ -48,6 +52,17 @@ def parse_arguments():
         help='Number of worker processes (default: all CPU cores)',
         default=None
     )
+    parser.add_argument(
+        '--probe',
+        action='store_true',
+        help='Only read the .pyc headers and print a summary by version, size and embedded filename'
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Write a Chrome trace-event timeline of the run to FILE (e.g. out.json)',
+        default=None
+    )
     return parser.parse_args()
 
 
@@ -70,12 +85,15 @@ def main():
     print(f"Keep .pyc files: {args.keep_pyc}")
     print()
 
+    trace = TraceRecorder(args.trace, process_name='decompile_pyc') if args.trace else NullTraceRecorder()
+
     try:
         # Initialize handler
         handler = DecompilerHandler(
             python2_path=args.python2,
             verbose=args.verbose,
-            num_workers=args.workers
+            num_workers=args.workers,
+            trace=trace
         )
     except RuntimeError as e:
         print(f"Error: {e}")
@@ -84,26 +102,55 @@ def main():
 
     # Find all .pyc files
     print("Scanning for .pyc files...")
-    pyc_files = handler.find_pyc_files(target_dir, recursive=args.recursive)
+    with trace.span("scan for .pyc", cat='scan'):
+        pyc_files = handler.find_pyc_files(target_dir, recursive=args.recursive)
 
     if not pyc_files:
         print("No .pyc files found.")
         sys.exit(0)
 
     print(f"Found {len(pyc_files)} .pyc files")
+
+    # Probe headers to order the work and set aside files that cannot be decompiled
+    with trace.span("probe", cat='scan', files=len(pyc_files)):
+        probes = handler.probe_files(pyc_files)
+
+    if args.probe:
+        if not probes:
+            sys.exit(1)
+        print()
+        handler.print_triage(probes)
+        sys.exit(0)
+
+    pyc_files, skipped = handler.triage(pyc_files, probes)
+    if skipped:
+        print(f"Skipping {len(skipped)} files with unsupported byte code")
     print()
 
     # Decompile files
-    success_count, failed_count, failed_files = handler.decompile_files(
-        pyc_files,
-        remove_pyc=not args.keep_pyc
-    )
+    try:
+        with trace.span("decompile", cat='decompile', files=len(pyc_files)):
+            success_count, failed_count, failed_files = handler.decompile_files(
+                pyc_files,
+                remove_pyc=not args.keep_pyc
+            )
+    finally:
+        if args.trace:
+            trace.save()
+            print(f"\nTrace written to: {args.trace}")
+
+    failed_count += len(skipped)
+    failed_files = skipped + failed_files
 
     # Print summary
     print(f"\n[DONE] Decompilation complete!")
     print(f"  Successfully decompiled: {success_count} files")
     if failed_count > 0:
         print(f"  Failed: {failed_count} files")
+    deparsed = handler.dedup_hits + handler.dedup_misses
+    if deparsed:
+        print(f"  Function bodies reused: {handler.dedup_hits} of {deparsed} "
+              f"({100.0 * handler.dedup_hits / deparsed:.1f}%)")
 
     if failed_files and args.verbose:
         print("\nFailed files:")
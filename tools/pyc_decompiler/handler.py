@@ -5,25 +5,34 @@ Handler module for decompilation process
 
 import os
 import sys
+import json
+import subprocess
 import multiprocessing
+from collections import Counter
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 # Add parent directory to path to import helper
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from helper import ProgressDisplay, SimpleProgress
+from helper import ProgressDisplay, SimpleProgress, NullTraceRecorder
+from helper.trace import now_us
 
 # Add current directory to path for worker import
 sys.path.insert(0, str(Path(__file__).parent))
-from worker import decompile_worker
+from worker import decompile_worker, init_worker
 
 
 class DecompilerHandler:
     """Handles PYC file decompilation using Python 2.7 subprocess"""
 
-    def __init__(self, python2_path: str = None, verbose: bool = False, num_workers: int = None):
+    def __init__(self, python2_path: str = None, verbose: bool = False, num_workers: int = None,
+                 trace=None):
         self.verbose = verbose
+        self.trace = trace if trace is not None else NullTraceRecorder()
+        # Function bodies reused from the workers' deparse cache vs deparsed
+        self.dedup_hits = 0
+        self.dedup_misses = 0
 
         # Set number of worker processes
         if num_workers is None:
@@ -57,6 +66,100 @@ class DecompilerHandler:
         pyc_files.sort()
         return pyc_files
 
+    def probe_files(self, pyc_files: List[Path]) -> Dict[Path, dict]:
+        """
+        Read the header and top-level code info of every file in one Python 2.7
+        process, without decompiling anything. Each probe has version, magic_int,
+        timestamp, file_size, co_filename, co_name and co_names, or an error.
+        Empty, after a warning, if the probe process fails.
+        """
+        script = Path(__file__).parent / "worker_py2.py"
+        paths = [str(pyc_file.absolute()) for pyc_file in pyc_files]
+        try:
+            result = subprocess.run(
+                [self.python2_exe, str(script), '--probe'],
+                input='\n'.join(paths),
+                capture_output=True,
+                text=True,
+                timeout=60 + len(paths) // 100,
+                cwd=str(script.parent)
+            )
+        except (subprocess.TimeoutExpired, OSError) as e:
+            print(f"  x Probe failed: {e}")
+            return {}
+
+        error = None
+        if result.returncode != 0:
+            error = f"exit code {result.returncode}"
+        else:
+            try:
+                probes = json.loads(result.stdout)
+            except json.JSONDecodeError as e:
+                error = f"bad output: {e}"
+            else:
+                if not isinstance(probes, list) or len(probes) != len(pyc_files):
+                    count = len(probes) if isinstance(probes, list) else 'no'
+                    error = f"got {count} probes for {len(pyc_files)} files"
+        if error:
+            stderr = result.stderr.strip()
+            print(f"  x Probe failed: {error}" + (f"\n{stderr}" if stderr else ''))
+            return {}
+        return dict(zip(pyc_files, probes))
+
+    def triage(self, pyc_files: List[Path], probes: Dict[Path, dict]) -> Tuple[List[Path], List[Tuple[str, str]]]:
+        """
+        Decide what to schedule: files whose byte code version the decompiler
+        does not support (or does not know) are set aside with a reason, the
+        rest are ordered largest first so the longest jobs do not start last.
+        Files without a usable probe are scheduled as-is.
+        """
+        scheduled = []
+        skipped = []
+        for pyc_file in pyc_files:
+            probe = probes.get(pyc_file)
+            if probe and probe['bad_magic']:
+                skipped.append((pyc_file.name, probe['error']))
+                continue
+            if probe and not probe['error']:
+                version = probe['version']
+                if not (2.5 <= version <= 2.7) and not (3.2 <= version <= 3.5):
+                    skipped.append((pyc_file.name, f"Unsupported Python {version} byte code"))
+                    continue
+            scheduled.append(pyc_file)
+
+        def file_size(pyc_file):
+            probe = probes.get(pyc_file)
+            return probe['file_size'] if probe and not probe['error'] else 0
+
+        scheduled.sort(key=file_size, reverse=True)
+        return scheduled, skipped
+
+    def print_triage(self, probes: Dict[Path, dict]):
+        """Print a summary of probed files by version, size and embedded filename"""
+        ok = [probe for probe in probes.values() if not probe['error']]
+        errors = [(pyc_file, probe['error']) for pyc_file, probe in probes.items() if probe['error']]
+
+        print("By version:")
+        for version, count in sorted(Counter(probe['version'] for probe in ok).items()):
+            print(f"  Python {version}: {count} files")
+
+        total_size = sum(probe['file_size'] for probe in ok)
+        print(f"Total size: {total_size / 1024:.1f} KB")
+        print("Largest files:")
+        for probe in sorted(ok, key=lambda probe: probe['file_size'], reverse=True)[:10]:
+            print(f"  {probe['file_size'] / 1024:8.1f} KB  {probe['co_filename']}")
+
+        # Embedded filenames tell where the module lived when it was compiled
+        print("By embedded source directory:")
+        dirs = Counter(os.path.dirname(probe['co_filename'].replace('\\', '/')) or '.' for probe in ok)
+        for directory, count in dirs.most_common(20):
+            print(f"  {count:6d}  {directory}")
+
+        if errors:
+            print(f"Unreadable: {len(errors)} files")
+            for pyc_file, error in errors[:20]:
+                print(f"  - {pyc_file}: {error}")
+
     def decompile_files(self, pyc_files: List[Path], remove_pyc: bool = True) -> Tuple[int, int, List]:
         """Decompile multiple .pyc files using multiprocessing"""
 
@@ -66,21 +169,31 @@ class DecompilerHandler:
 
         total = len(pyc_files)
 
-        # Initialize progress display
-        progress_display = ProgressDisplay(total) if not self.verbose else SimpleProgress(total)
+        # Initialize progress display; workers report which file they are on
+        # through the display's queue (one lane per worker process)
+        if self.verbose:
+            progress_queue = None
+            progress_display = SimpleProgress(total)
+        else:
+            progress_queue = multiprocessing.Queue()
+            progress_display = ProgressDisplay(total, event_queue=progress_queue)
 
         print(f"Decompiling {total} files with {self.num_workers} workers...")
 
         # Prepare arguments for workers
-        worker_args = [(self.python2_exe, str(pyc_file)) for pyc_file in pyc_files]
+        tracing = bool(self.trace)
+        worker_args = [(self.python2_exe, str(pyc_file), tracing) for pyc_file in pyc_files]
 
         # Use ProcessPoolExecutor for parallel processing
-        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+        with ProcessPoolExecutor(max_workers=self.num_workers, initializer=init_worker,
+                                 initargs=(progress_queue,)) as executor:
             # Submit all decompilation tasks
-            future_to_file = {
-                executor.submit(decompile_worker, args): Path(args[1])
-                for args in worker_args
-            }
+            future_to_file = {}
+            submitted_at = {}
+            for args in worker_args:
+                future = executor.submit(decompile_worker, args)
+                future_to_file[future] = Path(args[1])
+                submitted_at[future] = now_us()
 
             # Process completed tasks
             for future in as_completed(future_to_file):
@@ -94,8 +207,13 @@ class DecompilerHandler:
                     pass
 
                 try:
-                    pyc_file_path, success, result = future.result()
+                    pyc_file_path, success, result, events, dedup = future.result()
                     pyc_file = Path(pyc_file_path)
+                    self.dedup_hits += dedup.get('hits', 0)
+                    self.dedup_misses += dedup.get('misses', 0)
+
+                    if events:
+                        self._record_worker_events(future_to_file[future], submitted_at[future], events)
 
                     if success:
                         success_count += 1
@@ -126,4 +244,13 @@ class DecompilerHandler:
         # Finish progress display
         progress_display.finish()
 
-        return success_count, failed_count, failed_files
\ No newline at end of file
+        return success_count, failed_count, failed_files
+
+    def _record_worker_events(self, pyc_file: Path, submitted_us: int, events: List):
+        """Add a worker's events to the trace, plus the time the file waited in the queue"""
+        tid = events[0]['tid']
+        self.trace.name_lane(tid, f"worker {tid}")
+        self.trace.add_events(events)
+        started_us = min(event['ts'] for event in events)
+        self.trace.async_span("queue wait", id(pyc_file), submitted_us, started_us,
+                              args={'file': pyc_file.name})
\ No newline at end of file
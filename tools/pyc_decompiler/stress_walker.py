@@ -0,0 +1,85 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Deparser Stress Test
+Walks trees far deeper than the recursion limit with the deparser
+(uncompyle6.semantics.pysource), which keeps its place on a stack of
+its own, and checks the source it writes
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# Add the current directory to path to use the local custom uncompyle6
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from uncompyle6 import PYTHON_VERSION
+from uncompyle6.parsers.astnode import AST
+from uncompyle6.semantics.pysource import deparse_code, find_globals, find_none
+
+
+def elif_chain(depth):
+    """
+    A walker and an if/elif chain depth deep for it. Parsing a chain that
+    deep takes far longer than walking it, so it is put together from
+    the tree of a single if/else.
+    """
+    co = compile('if x:\n    y = 0\nelse:\n    y = 1\n', '<elif>', 'exec')
+    walker = deparse_code(PYTHON_VERSION, co, out=StringIO())
+    ifelse = walker.ast[0][0][0]
+    assert ifelse == 'ifelsestmt'
+    node = ifelse
+    for i in range(depth - 1):
+        else_suite = AST('else_suite', [AST('suite_stmts', [
+            AST('_stmts', [AST('stmt', [node])])])])
+        node = AST('ifelsestmt', ifelse[:3] + [else_suite] + ifelse[4:])
+    return walker, node
+
+
+def stress_elif(depth=10000):
+    """Walking an elif chain, which took the walker well past the limit when it recursed"""
+    walker, chain = elif_chain(depth)
+    t = time.time()
+    assert find_globals(chain, set()) == set() and not find_none(chain)
+    print("find_globals, find_none %5d deep %6.2f s" % (depth, time.time() - t))
+    t = time.time()
+    text = walker.traverse(chain)
+    print("traverse elif           %5d deep %6.2f s" % (depth, time.time() - t))
+    assert text.count('elif x:') == depth - 1, text[:200]
+
+
+def stress_expressions(depth=400):
+    """
+    Expressions that go through handlers that walk their own parts
+    (n_expr, n_binary_expr) rather than through templates, decompiled
+    from source and compiled back
+    """
+    terms = ['a%d' % i for i in range(depth)]
+    for name, source in (('binop', 'x = ' + ' + '.join(terms)),
+                         ('boolop', 'x = ' + ' and '.join(terms)),
+                         ('attribute chain', 'x = a.' + '.'.join(terms))):
+        co = compile(source, '<%s>' % name, 'exec')
+        out = StringIO()
+        t = time.time()
+        deparse_code(PYTHON_VERSION, co, out=out)
+        text = out.getvalue()
+        print("%-23s %5d deep %6.2f s" % (name, depth, time.time() - t))
+        assert compile(text, '<%s>' % name, 'exec').co_code == co.co_code, text[:200]
+
+
+def main():
+    # At the default limit, which uncompyle6 leaves alone
+    print("recursion limit %d" % sys.getrecursionlimit())
+    stress_elif()
+    stress_expressions()
+
+
+if __name__ == '__main__':
+    main()
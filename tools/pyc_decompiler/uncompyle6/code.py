@@ -1,53 +1,118 @@
+import hashlib
 import inspect
-class Code3:
-    """Class for a Python3 code object used when a Python interpreter less than 3 is
-    working on Python3 bytecode
+# The code object attributes the scanners and walkers use, in the
+# order types.CodeType (and Code3/Code2 below) take them
+CODE_FIELDS = ('co_argcount', 'co_kwonlyargcount', 'co_nlocals', 'co_stacksize',
+               'co_flags', 'co_code', 'co_consts', 'co_names', 'co_varnames',
+               'co_filename', 'co_name', 'co_firstlineno', 'co_lnotab',
+               'co_freevars', 'co_cellvars')
+
+class CodeRecord(object):
+    """Read-only code object built by the unmarshaller, for byte code of a
+    Python version other than the running one. Slotted, so the thousands
+    of nested functions in a large module don't each carry a __dict__.
     """
+    __slots__ = CODE_FIELDS
+
     def __init__(self, co_argcount, co_kwonlyargcount,co_nlocals, co_stacksize, co_flags, co_code,
                  co_consts, co_names, co_varnames, co_filename, co_name,
                  co_firstlineno, co_lnotab, co_freevars, co_cellvars):
-        self.co_argcount = co_argcount
-        self.co_kwonlyargcount = co_kwonlyargcount
-        self.co_nlocals = co_nlocals
-        self.co_stacksize = co_stacksize
-        self.co_flags = co_flags
-        self.co_code = co_code
-        self.co_consts = co_consts
-        self.co_names = co_names
-        self.co_varnames = co_varnames
-        self.co_filename = co_filename
-        self.co_name = co_name
-        self.co_firstlineno = co_firstlineno
-        self.co_lnotab = co_lnotab
-        self.co_freevars = co_freevars
-        self.co_cellvars = co_cellvars
+        for name, value in zip(CODE_FIELDS,
+                               (co_argcount, co_kwonlyargcount, co_nlocals, co_stacksize,
+                                co_flags, co_code, co_consts, co_names, co_varnames,
+                                co_filename, co_name, co_firstlineno, co_lnotab,
+                                co_freevars, co_cellvars)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("readonly attribute")
 
-class Code2:
+    def __delattr__(self, name):
+        raise AttributeError("readonly attribute")
+
+    def __repr__(self):
+        return '<code object %s, file "%s", line %d>' % (
+            self.co_name, self.co_filename, self.co_firstlineno)
+
+class Code3(CodeRecord):
+    """Class for a Python3 code object used when a Python interpreter less than 3 is
+    working on Python3 bytecode
+    """
+    __slots__ = ()
+
+class Code2(CodeRecord):
     """Class for a Python2 code object used when a Python interpreter less than 3 is
     working on Python3 bytecode
     """
-    def __init__(self, co_argcount, co_kwonlyargcount,co_nlocals, co_stacksize, co_flags, co_code,
-                 co_consts, co_names, co_varnames, co_filename, co_name,
-                 co_firstlineno, co_lnotab, co_freevars, co_cellvars):
-        self.co_argcount = co_argcount
-        self.co_kwonlyargcount = co_kwonlyargcount
-        self.co_nlocals = co_nlocals
-        self.co_stacksize = co_stacksize
-        self.co_flags = co_flags
-        self.co_code = co_code
-        self.co_consts = co_consts
-        self.co_names = co_names
-        self.co_varnames = co_varnames
-        self.co_filename = co_filename
+    __slots__ = ()
+
+class LazyCode(object):
+    """Stand-in for a nested code object that has not been unmarshalled yet.
+
+    co_name, co_filename and co_firstlineno are known up front (the scanner
+    only needs co_name of nested code); touching any other attribute, or
+    calling materialize(), decodes the real code object once.
+    """
+    __slots__ = ('co_name', 'co_filename', 'co_firstlineno', '_loader', '_code')
+
+    def __init__(self, co_name, co_filename, co_firstlineno, loader):
         self.co_name = co_name
+        self.co_filename = co_filename
         self.co_firstlineno = co_firstlineno
-        self.co_lnotab = co_lnotab
-        self.co_freevars = co_freevars
-        self.co_cellvars = co_cellvars
+        self._loader = loader
+        self._code = None
+
+    def materialize(self):
+        if self._code is None:
+            self._code = self._loader()
+            self._loader = None
+        return self._code
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __repr__(self):
+        return '<lazy code object %s, file "%s", line %d>' % (
+            self.co_name, self.co_filename, self.co_firstlineno)
+
+def materialize(co):
+    """The real code object for co (which may be a LazyCode)"""
+    if isinstance(co, LazyCode):
+        return co.materialize()
+    return co
 
 def iscode(obj):
     """A replacement for inspect.iscode() which we can't used because we may be
     using a different version of Python than the version of Python used
     in creating the byte-compiled objects. Here, he code types may mismatch.
     """
-    return inspect.iscode(obj) or isinstance(obj, Code3)
+    return inspect.iscode(obj) or isinstance(obj, (CodeRecord, LazyCode))
+
+def has_nested_code(co):
+    """True if co defines functions, classes, lambdas or comprehensions"""
+    return any(iscode(const) for const in co.co_consts)
+
+def _const_key(value):
+    # type-tagged so that 1, 1.0, True and u'1'/'1' do not collide
+    if iscode(value):
+        return ('code', structural_hash(value))
+    if isinstance(value, tuple):
+        return ('tuple',) + tuple(_const_key(v) for v in value)
+    if isinstance(value, frozenset):
+        return ('frozenset',) + tuple(sorted(repr(_const_key(v)) for v in value))
+    return (type(value).__name__, value)
+
+def structural_hash(co):
+    """Digest of everything in a code object that decides how it deparses.
+
+    co_name, co_filename and co_firstlineno are left out (co_lnotab only
+    holds line deltas), so two copies of the same function defined in
+    different places or under different names get the same digest.
+    """
+    co = materialize(co)
+    key = (co.co_argcount, getattr(co, 'co_kwonlyargcount', 0), co.co_flags,
+           co.co_code, _const_key(co.co_consts), co.co_names, co.co_varnames,
+           co.co_freevars, co.co_cellvars, co.co_lnotab)
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
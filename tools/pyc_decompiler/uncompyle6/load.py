@@ -57,7 +57,71 @@ def load_file(filename):
         pass
     return co
 
-def load_module(filename, code_objects={}):
+def read_header(fp, filename):
+    """
+    Read a .pyc header, leaving fp at the start of the marshalled code.
+    Returns version, timestamp, magic_int and source_size (None before 3.3).
+    """
+    magic = fp.read(4)
+    try:
+        version = float(magics.versions[magic])
+    except KeyError:
+        if len(magic) >= 2:
+            raise ImportError("Unknown magic number %s in %s" %
+                            (ord(magic[0])+256*ord(magic[1]), filename))
+        else:
+            raise ImportError("Bad magic number: '%s'" % magic)
+
+    # print version
+    ts = fp.read(4)
+    timestamp = unpack("I", ts)[0]
+    magic_int = magics.magic2int(magic)
+
+    # Note: a higher magic number doesn't necessarily mean a later
+    # release.  At Python 3.0 the magic number decreased
+    # significantly. Hence the range below. Also note inclusion of
+    # the size info, occurred within a Python major/minor
+    # release. Hence the test on the magic value rather than
+    # PYTHON_VERSION, although PYTHON_VERSION would probably work.
+    source_size = None
+    if 3200 <= magic_int < 20121:
+        source_size = unpack("I", fp.read(4))[0] # size mod 2**32
+
+    return version, timestamp, magic_int, source_size
+
+def probe_module(filename):
+    """
+    Triage a byte-code file without loading it: reads the header and walks
+    only the top-level code object of the marshal stream, stepping over
+    nested code objects. Much cheaper than load_module() on big modules
+    when the byte code is not the running interpreter's own.
+
+    Returns a dict with version, magic_int, timestamp, source_size,
+    file_size and the top-level co_filename, co_name and co_names.
+    """
+    with open(filename, 'rb') as fp:
+        version, timestamp, magic_int, source_size = read_header(fp, filename)
+        if imp and magics.magic2int(imp.get_magic()) == magic_int:
+            # the C unmarshaller beats any walk done in Python
+            co = marshal.loads(fp.read())
+            co_filename, co_name, co_names = co.co_filename, co.co_name, co.co_names
+        else:
+            co_filename, co_name, co_firstlineno, co_names = \
+                uncompyle6.marsh.probe_code(fp, magic_int)
+        file_size = os.fstat(fp.fileno()).st_size
+
+    return {
+        'version': version,
+        'magic_int': magic_int,
+        'timestamp': timestamp,
+        'source_size': source_size,
+        'file_size': file_size,
+        'co_filename': co_filename,
+        'co_name': co_name,
+        'co_names': list(co_names),
+    }
+
+def load_module(filename, code_objects=None, lazy=False):
     """
     load a module without importing it.
     load_module(filename: string): version, magic_int, code_object
@@ -69,48 +133,33 @@ def load_module(filename, code_objects={}):
     version: Python major/minor value e.g. 2.7. or 3.4
     magic_int: more specific than version. The actual byte code version of the
                code object
+    code_objects: optional dict the loaded code objects are recorded in
+                  (a fresh one per call when not given)
+    lazy: leave nested code objects undecoded until they are used
+          (only applies when the byte code is not the running interpreter's)
     """
+    if code_objects is None:
+        code_objects = {}
 
     with open(filename, 'rb') as fp:
-        magic = fp.read(4)
-        try:
-            version = float(magics.versions[magic])
-        except KeyError:
-            if len(magic) >= 2:
-                raise ImportError("Unknown magic number %s in %s" %
-                                (ord(magic[0])+256*ord(magic[1]), filename))
-            else:
-                raise ImportError("Bad magic number: '%s'" % magic)
+        version, timestamp, magic_int, source_size = read_header(fp, filename)
 
         if not (2.5 <= version <= 2.7) and not (3.2 <= version <= 3.5):
             raise ImportError("This is a Python %s file! Only "
                               "Python 2.5 to 2.7 and 3.2 to 3.5 files are supported."
                               % version)
 
-        # print version
-        ts = fp.read(4)
-        timestamp = unpack("I", ts)[0]
-        magic_int = magics.magic2int(magic)
         if imp:
             my_magic_int = magics.magic2int(imp.get_magic())
         else:
             # For Python 3.12+, use a default magic number for Python 3.7 (WoT's version)
             my_magic_int = 3394
 
-        # Note: a higher magic number doesn't necessarily mean a later
-        # release.  At Python 3.0 the magic number decreased
-        # significantly. Hence the range below. Also note inclusion of
-        # the size info, occurred within a Python major/minor
-        # release. Hence the test on the magic value rather than
-        # PYTHON_VERSION, although PYTHON_VERSION would probably work.
-        if 3200 <= magic_int < 20121:
-            fp.read(4) # size mod 2**32
-
         if my_magic_int == magic_int:
             bytecode = fp.read()
             co = marshal.loads(bytecode)
         else:
-            co = uncompyle6.marsh.load_code(fp, magic_int, code_objects)
+            co = uncompyle6.marsh.load_code(fp, magic_int, code_objects, lazy=lazy)
         pass
 
     return version, timestamp, magic_int, co
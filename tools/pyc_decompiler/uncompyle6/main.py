@@ -1,5 +1,5 @@
 from __future__ import print_function
-import datetime, os, sys
+import datetime, os, sys, time
 
 from uncompyle6 import verify, PYTHON_VERSION
 from uncompyle6.code import iscode
@@ -55,15 +55,23 @@ def uncompyle(version, co, out=None, showasm=False, showast=False,
 
 
 def uncompyle_file(filename, outstream=None, showasm=False, showast=False,
-                   showgrammar=False):
+                   showgrammar=False, phase=None):
     """
     decompile Python byte-code file (.pyc)
+
+    phase, if given, is called as phase(name, start) when the 'load'
+    and 'deparse' steps finish, start being the step's time.time().
     """
 
+    start = time.time()
     filename = check_object_path(filename)
     code_objects = {}
-    version, timestamp, magic_int, co = load_module(filename, code_objects)
-    
+    # nested code is decoded as the deparser reaches it
+    version, timestamp, magic_int, co = load_module(filename, code_objects, lazy=True)
+    if phase:
+        phase('load', start)
+
+    start = time.time()
     try:
         if type(co) == list:
             for con in co:
@@ -76,6 +84,8 @@ def uncompyle_file(filename, outstream=None, showasm=False, showast=False,
             return co.co_filename
     finally:
         co = None
+        if phase:
+            phase('deparse', start)
 
 # FIXME: combine into an options parameter
 def main(in_base, out_base, files, codes, outfile=None,
@@ -16,23 +16,50 @@ to produce a code object
 from __future__ import print_function
 
 import sys, types
-from struct import unpack
+from struct import Struct, unpack_from
 
 from uncompyle6.magics import PYTHON_MAGIC_INT
-from uncompyle6.code import Code3
-
-internStrings = []
-internObjects = []
+from uncompyle6.code import Code3, LazyCode
 
 PYTHON3 = (sys.version_info >= (3, 0))
 
 if PYTHON3:
     def long(n): return n
 
-def compat_str(s):
-    return s.decode('utf-8', errors='ignore') if PYTHON3 else str(s)
+    def compat_str(s):
+        return s.decode('utf-8', errors='ignore')
+else:
+    compat_str = str
+
+# marshal data is little-endian; compile the formats once
+_int32 = Struct('<i')
+_int64 = Struct('<q')
+_float64 = Struct('<d')
+_complex128 = Struct('<dd')
+
+_STRINGREF, _INTERNED, _STRING, _NONE, _INT, _NULL = [ord(c) for c in 'RtsNi0']
+
+# Type codes by how MarshalReader.skip() steps over them
+_FIXED_SIZES = dict((ord(c), size) for c, size in (
+    ('0', 0), ('N', 0), ('F', 0), ('T', 0), ('S', 0), ('.', 0),
+    ('i', 4), ('I', 8), ('g', 8), ('y', 16), ('R', 4), ('r', 4)))
+_SIZED_STRINGS = frozenset(ord(c) for c in 'sua')  # int32 size + bytes
+_INTERNED_STRINGS = frozenset(ord(c) for c in 'tA')
+_SEQUENCES = frozenset(ord(c) for c in '([<>')
+(_SHORT_ASCII, _SHORT_ASCII_INTERNED, _FLOAT, _LONG, _SMALL_TUPLE, _DICT,
+ _CODE) = [ord(c) for c in 'zZfl){c']
+# skip() phases of a code object: the fields before co_firstlineno, then co_lnotab
+_CODE_FIELDS, _CODE_LNOTAB = 1, 2
+
+def probe_code(fp, magic_int):
+    """
+    Like load_code() but only reads the top-level code object's
+    co_filename, co_name, co_firstlineno and co_names, stepping over
+    everything nested. Returns them as a tuple in that order.
+    """
+    return MarshalReader(fp.read(), magic_int).probe_code()
 
-def load_code(fp, magic_int, code_objects={}):
+def load_code(fp, magic_int, code_objects=None, lazy=False):
     """
     marshal.load() written in Python. When the Python bytecode magic loaded is the
     same magic for the running Python interpreter, we can simply use the
@@ -40,70 +67,507 @@ def load_code(fp, magic_int, code_objects={}):
 
     However we need to use this when versions are different since the internal
     code structures are different. Sigh.
+
+    The rest of fp is read in one go and walked from memory; fp is left
+    positioned just past the code object. All state lives in the
+    MarshalReader made for this call, so loads may run concurrently.
+
+    With lazy=True nested code objects come back as LazyCode and are only
+    decoded when something needs more than their name.
     """
-    global internStrings, internObjects
-    internStrings = []
-    internObjects = []
     seek_pos = fp.tell()
+    data = fp.read()
     # Do a sanity check. Is this a code type?
-    b =  ord(fp.read(1))
+    if not data or chr(bytearray(data[:1])[0] & 0x7f) != 'c':
+        raise TypeError("File %s doesn't smell like Python bytecode" % fp.name)
 
-    if (b & 0x80):
-        b = b & 0x7f
+    reader = MarshalReader(data, magic_int, code_objects, lazy=lazy)
+    code = reader.load()
+    fp.seek(seek_pos + reader.pos)
+    return code
 
-    c = chr(b)
-    if c != 'c':
-        raise TypeError("File %s doesn't smell like Python bytecode" % fp.name)
+class MarshalReader(object):
+    """
+    Walks a marshal byte string by offset. Struct formats and the
+    version-dependent code object header layout are worked out once per
+    reader instead of once per field.
 
-    fp.seek(seek_pos)
-    return load_code_internal(fp, magic_int, code_objects=code_objects)
+    A reader is the context of one load: it owns the intern tables that
+    'R' and 'r' references index into, so separate readers never share
+    state.
+    """
 
-def load_code_type(fp, magic_int, bytes_for_s=False, code_objects={}):
-    # Python [1.3 .. 2.3)
-    # FIXME: find out what magics were for 1.3
-    v13_to_23 = magic_int in (20121, 50428, 50823, 60202, 60717)
+    def __init__(self, data, magic_int, code_objects=None, lazy=False):
+        self.data = data
+        self.view = memoryview(data)
+        # indexing must give ints for the type byte; Python 2 bytes give str
+        self.octets = data if PYTHON3 else bytearray(data)
+        self.pos = 0
+        self.magic_int = magic_int
+        self.code_objects = code_objects if code_objects is not None else {}
+        self.intern_strings = []
+        self.intern_objects = []
+
+        # Python 3.4+ marshal shares objects between code objects through
+        # 'r' references, so a nested code object can't be decoded on its own
+        self.lazy = lazy and not (3250 <= magic_int < 20121)
+        self.code_depth = 0
+
+        # Python [1.3 .. 2.3)
+        # FIXME: find out what magics were for 1.3
+        v13_to_23 = magic_int in (20121, 50428, 50823, 60202, 60717)
+
+        # Python [1.5 .. 2.3)
+        v15_to_23 = magic_int in (20121, 50428, 50823, 60202, 60717)
+
+        self.has_kwonlyargcount = 3020 < magic_int < 20121
+
+        # co_argcount, [kwonlyargcount], co_nlocals, co_stacksize, co_flags
+        self.code_header = Struct('<' +
+                                  ('h' if v13_to_23 else 'i') +
+                                  ('i' if self.has_kwonlyargcount else '') +
+                                  ('h' if v13_to_23 else 'i') +
+                                  ('h' if v15_to_23 else 'i') +
+                                  ('h' if v13_to_23 else 'i'))
+
+    def load(self, bytes_for_s=False):
+        """Read the next object"""
+        pos = self.pos
+        b1 = self.octets[pos]
+        pos += 1
+
+        # The common types are handled inline; the rest go through dispatch
+        if b1 == _STRINGREF:
+            self.pos = pos + 4
+            return self.intern_strings[_int32.unpack_from(self.view, pos)[0]]
+        elif b1 == _INTERNED:
+            end = pos + 4 + _int32.unpack_from(self.view, pos)[0]
+            self.pos = end
+            interned = compat_str(self.data[pos + 4:end])
+            self.intern_strings.append(interned)
+            return interned
+        elif b1 == _STRING:
+            end = pos + 4 + _int32.unpack_from(self.view, pos)[0]
+            self.pos = end
+            # Note: could mean bytes in Python3 processing Python2 bytecode
+            s = self.data[pos + 4:end]
+            if not bytes_for_s:
+                s = compat_str(s)
+            return s
+        elif b1 == _NONE:
+            self.pos = pos
+            return None
+        elif b1 == _INT:
+            self.pos = pos + 4
+            return _int32.unpack_from(self.view, pos)[0]
+
+        self.pos = pos
+        if b1 & 0x80:
+            b1 = b1 & 0x7f
+            code = self.dispatch.get(b1, _load_unknown)(self, b1, False)
+            self.intern_objects.append(code)
+            return code
+        return self.dispatch.get(b1, _load_unknown)(self, b1, bytes_for_s)
 
-    # Python [1.5 .. 2.3)
-    v15_to_23 = magic_int in (20121, 50428, 50823, 60202, 60717)
+    def read_int32(self):
+        pos = self.pos
+        self.pos = pos + 4
+        return _int32.unpack_from(self.view, pos)[0]
 
-    if v13_to_23:
-        co_argcount = unpack('h', fp.read(2))[0]
-    else:
-        co_argcount = unpack('i', fp.read(4))[0]
+    def read_bytes(self, size):
+        pos = self.pos
+        self.pos = pos + size
+        return self.data[pos:pos + size]
 
-    if 3020 < magic_int < 20121:
-        kwonlyargcount = unpack('i', fp.read(4))[0]
-    else:
-        kwonlyargcount = 0
+    def load_none(self, marshalType, bytes_for_s):
+        return None
 
-    if v13_to_23:
-        co_nlocals = unpack('h', fp.read(2))[0]
-    else:
-        co_nlocals = unpack('i', fp.read(4))[0]
+    def load_false(self, marshalType, bytes_for_s):
+        return False
 
-    if v15_to_23:
-        co_stacksize = unpack('h', fp.read(2))[0]
-    else:
-        co_stacksize = unpack('i', fp.read(4))[0]
+    def load_true(self, marshalType, bytes_for_s):
+        return True
 
-    if v13_to_23:
-        co_flags = unpack('h', fp.read(2))[0]
-    else:
-        co_flags = unpack('i', fp.read(4))[0]
+    def load_stopiter(self, marshalType, bytes_for_s):
+        return StopIteration
+
+    def load_ellipsis(self, marshalType, bytes_for_s):
+        return Ellipsis
 
-    co_code = load_code_internal(fp, magic_int, bytes_for_s=True,
-                                 code_objects=code_objects)
+    def load_int(self, marshalType, bytes_for_s):
+        return int(self.read_int32())
+
+    def load_int64(self, marshalType, bytes_for_s):
+        pos = self.pos
+        self.pos = pos + 8
+        return _int64.unpack_from(self.view, pos)[0]
+
+    def load_float(self, marshalType, bytes_for_s):
+        # float stored as its repr
+        n = self.octets[self.pos]
+        self.pos += 1
+        return float(compat_str(self.read_bytes(n)))
+
+    def load_binary_float(self, marshalType, bytes_for_s):
+        pos = self.pos
+        self.pos = pos + 8
+        return float(_float64.unpack_from(self.view, pos)[0])
+
+    def load_binary_complex(self, marshalType, bytes_for_s):
+        pos = self.pos
+        self.pos = pos + 16
+        real, imag = _complex128.unpack_from(self.view, pos)
+        return complex(real, imag)
 
-    co_consts = load_code_internal(fp, magic_int, code_objects=code_objects)
-    co_names = load_code_internal(fp, magic_int, code_objects=code_objects)
-    co_varnames = load_code_internal(fp, magic_int, code_objects=code_objects)
-    co_freevars = load_code_internal(fp, magic_int, code_objects=code_objects)
-    co_cellvars = load_code_internal(fp, magic_int, code_objects=code_objects)
-    co_filename = load_code_internal(fp, magic_int, code_objects=code_objects)
-    co_name = load_code_internal(fp, magic_int)
-    co_firstlineno = unpack('i', fp.read(4))[0]
-    co_lnotab = load_code_internal(fp, magic_int, code_objects=code_objects)
+    def load_long(self, marshalType, bytes_for_s):
+        n = self.read_int32()
+        if n == 0:
+            return long(0)
+        size = abs(n)
+        pos = self.pos
+        self.pos = pos + 2 * size
+        d = long(0)
+        for j, md in enumerate(unpack_from('<%dh' % size, self.view, pos)):
+            d += int(md) << j*15
+        if n < 0:
+            return long(d*-1)
+        return d
+
+    def load_string(self, marshalType, bytes_for_s):
+        # Note: could mean bytes in Python3 processing Python2 bytecode
+        s = self.read_bytes(self.read_int32())
+        if not bytes_for_s:
+            s = compat_str(s)
+        return s
+
+    def load_interned(self, marshalType, bytes_for_s):
+        interned = compat_str(self.read_bytes(self.read_int32()))
+        self.intern_strings.append(interned)
+        return interned
+
+    def load_stringref(self, marshalType, bytes_for_s):
+        return self.intern_strings[self.read_int32()]
+
+    def load_ref(self, marshalType, bytes_for_s):
+        # object reference - new in Python3
+        return self.intern_objects[self.read_int32()-1]
+
+    def load_items(self, size):
+        """Read size objects into a list allocated up front"""
+        items = [None] * size
+        load = self.load
+        for i in range(size):
+            items[i] = load()
+        return items
+
+    def load_tuple(self, marshalType, bytes_for_s):
+        return tuple(self.load_items(self.read_int32()))
+
+    def load_small_tuple(self, marshalType, bytes_for_s):
+        # small tuple - since Python3
+        tuplesize = self.octets[self.pos]
+        self.pos += 1
+        return tuple(self.load_items(tuplesize))
+
+    def load_list(self, marshalType, bytes_for_s):
+        return self.load_items(self.read_int32())
+
+    def load_dict(self, marshalType, bytes_for_s):
+        # key/value pairs up to a NULL ('0') key
+        ret = {}
+        load = self.load
+        octets = self.octets
+        while octets[self.pos] != _NULL:
+            key = load()
+            ret[key] = load()
+        self.pos += 1
+        return ret
+
+    def load_set(self, marshalType, bytes_for_s):
+        return set(self.load_items(self.read_int32()))
+
+    def load_frozenset(self, marshalType, bytes_for_s):
+        return frozenset(self.load_items(self.read_int32()))
+
+    def load_unicode(self, marshalType, bytes_for_s):
+        return self.read_bytes(self.read_int32()).decode('utf-8')
+
+    def load_ascii(self, marshalType, bytes_for_s):
+        # FIXME check
+        return compat_str(self.read_bytes(self.read_int32()))
 
+    def load_short_ascii(self, marshalType, bytes_for_s):
+        # short ascii - since Python3
+        n = self.octets[self.pos]
+        self.pos += 1
+        return compat_str(self.read_bytes(n))
+
+    def load_short_ascii_interned(self, marshalType, bytes_for_s):
+        # short ascii interned - since Python3
+        # FIXME: check
+        n = self.octets[self.pos]
+        self.pos += 1
+        interned = compat_str(self.read_bytes(n))
+        self.intern_strings.append(interned)
+        return interned
+
+    def load_unhandled(self, marshalType, bytes_for_s):
+        if marshalType == ord('C'):
+            raise KeyError("C code is Python 1.0 - 1.2; can't handle yet")
+        raise KeyError(chr(marshalType))
+
+    def load_unknown(self, marshalType, bytes_for_s):
+        sys.stderr.write("Unknown type %i (hex %x) %c\n" %
+                         (marshalType, marshalType, marshalType))
+        return None
+
+    def load_code_type(self, marshalType, bytes_for_s):
+        if self.lazy and self.code_depth:
+            return self.load_lazy_code()
+        magic_int = self.magic_int
+        pos = self.pos
+        self.pos = pos + self.code_header.size
+        header = self.code_header.unpack_from(self.view, pos)
+        if self.has_kwonlyargcount:
+            co_argcount, kwonlyargcount, co_nlocals, co_stacksize, co_flags = header
+        else:
+            co_argcount, co_nlocals, co_stacksize, co_flags = header
+            kwonlyargcount = 0
+
+        load = self.load
+        self.code_depth += 1
+        co_code = load(bytes_for_s=True)
+        co_consts = load()
+        co_names = load()
+        co_varnames = load()
+        co_freevars = load()
+        co_cellvars = load()
+        co_filename = load()
+        co_name = load()
+        co_firstlineno = self.read_int32()
+        co_lnotab = load()
+        self.code_depth -= 1
+
+        code = make_code(magic_int, co_argcount, kwonlyargcount, co_nlocals,
+                         co_stacksize, co_flags, co_code, co_consts, co_names,
+                         co_varnames, co_filename, co_name, co_firstlineno,
+                         co_lnotab, co_freevars, co_cellvars)
+        self.code_objects[str(code)] = code
+        return code
+
+    def skip(self):
+        """
+        Step over the next object without building it. Interned strings are
+        still recorded (later 'R' references index into them) and flagged
+        objects get a None placeholder in the object table.
+
+        Walks iteratively: `pending` counts the objects left at the current
+        level and `stack` holds (pending, phase) for enclosing code objects.
+        """
+        octets = self.octets
+        view = self.view
+        data = self.data
+        intern_strings = self.intern_strings
+        code_header_size = self.code_header.size
+        int32 = _int32.unpack_from
+        pos = self.pos
+        pending = 1
+        stack = []
+        while True:
+            while pending:
+                pending -= 1
+                b1 = octets[pos]
+                if b1 & 0x80:
+                    # the placeholder has to land after the object's own
+                    # contents, which the recursive helper takes care of
+                    self.pos = pos
+                    self.skip_flagged()
+                    pos = self.pos
+                    continue
+                pos += 1
+                if b1 in _FIXED_SIZES:
+                    pos += _FIXED_SIZES[b1]
+                elif b1 in _SIZED_STRINGS:
+                    pos += 4 + int32(view, pos)[0]
+                elif b1 in _INTERNED_STRINGS:
+                    end = pos + 4 + int32(view, pos)[0]
+                    intern_strings.append(compat_str(data[pos + 4:end]))
+                    pos = end
+                elif b1 == _CODE:
+                    # co_code .. co_name, then co_firstlineno and co_lnotab
+                    pos += code_header_size
+                    stack.append(pending)
+                    stack.append(_CODE_FIELDS)
+                    pending = 8
+                elif b1 in _SEQUENCES:
+                    pending += int32(view, pos)[0]
+                    pos += 4
+                elif b1 == _SMALL_TUPLE:
+                    pending += octets[pos]
+                    pos += 1
+                elif b1 == _SHORT_ASCII or b1 == _FLOAT:
+                    pos += 1 + octets[pos]
+                elif b1 == _SHORT_ASCII_INTERNED:
+                    end = pos + 1 + octets[pos]
+                    intern_strings.append(compat_str(data[pos + 1:end]))
+                    pos = end
+                else:
+                    self.pos = pos - 1
+                    self.skip_flagged()
+                    pos = self.pos
+            if not stack:
+                break
+            if stack[-1] == _CODE_FIELDS:
+                # co_firstlineno, then co_lnotab
+                stack[-1] = _CODE_LNOTAB
+                pos += 4
+                pending = 1
+            else:
+                stack.pop()
+                pending = stack.pop()
+        self.pos = pos
+
+    def skip_flagged(self):
+        """skip() for the rarer types and for flagged (referenceable) objects"""
+        octets = self.octets
+        b1 = octets[self.pos]
+        self.pos += 1
+        flagged = b1 & 0x80
+        b1 = b1 & 0x7f
+
+        if b1 in _FIXED_SIZES:
+            self.pos += _FIXED_SIZES[b1]
+        elif b1 in _SIZED_STRINGS:
+            size = self.read_int32()
+            self.pos += size
+        elif b1 in _INTERNED_STRINGS:
+            self.load_interned(b1, False)
+        elif b1 == _SHORT_ASCII or b1 == _FLOAT:
+            self.pos += 1 + octets[self.pos]
+        elif b1 == _SHORT_ASCII_INTERNED:
+            self.load_short_ascii_interned(b1, False)
+        elif b1 == _LONG:
+            size = abs(self.read_int32())
+            self.pos += 2 * size
+        elif b1 in _SEQUENCES:
+            for i in range(self.read_int32()):
+                self.skip()
+        elif b1 == _SMALL_TUPLE:
+            size = octets[self.pos]
+            self.pos += 1
+            for i in range(size):
+                self.skip()
+        elif b1 == _DICT:
+            while octets[self.pos] != _NULL:
+                self.skip()
+                self.skip()
+            self.pos += 1
+        elif b1 == _CODE:
+            self.pos += self.code_header.size
+            # co_code .. co_name, co_firstlineno, co_lnotab
+            for i in range(8):
+                self.skip()
+            self.pos += 4
+            self.skip()
+        elif b1 in self.dispatch:
+            self.dispatch[b1](self, b1, False)
+        else:
+            raise KeyError("Unknown marshal type %i (hex %x)" % (b1, b1))
+
+        if flagged:
+            self.intern_objects.append(None)
+
+    def probe_code(self):
+        """
+        Shallow read of the code object at the current position: the nested
+        code objects in co_consts are stepped over, not built.
+        Returns (co_filename, co_name, co_firstlineno, co_names).
+        """
+        if self.octets[self.pos] & 0x7f != _CODE:
+            raise TypeError("Expected a code object")
+        self.pos += 1
+        return self.read_code_fields()
+
+    def read_code_fields(self):
+        """
+        Shallow read of a code object's fields, from just past its type byte
+        up to co_lnotab (not included).
+        Returns (co_filename, co_name, co_firstlineno, co_names).
+        """
+        self.pos += self.code_header.size
+        self.skip()  # co_code
+        self.skip()  # co_consts
+        co_names = self.load()
+        self.skip()  # co_varnames
+        self.skip()  # co_freevars
+        self.skip()  # co_cellvars
+        co_filename = self.load()
+        co_name = self.load()
+        co_firstlineno = self.read_int32()
+        return co_filename, co_name, co_firstlineno, co_names
+
+    def load_lazy_code(self):
+        """
+        Step over a nested code object, returning a LazyCode that decodes it
+        later from the recorded offset. The intern tables are cut back to
+        what they held at that offset, so references resolve as they would
+        have in a full load.
+        """
+        start = self.pos
+        interned = len(self.intern_strings)
+        objects = len(self.intern_objects)
+        co_filename, co_name, co_firstlineno, co_names = self.read_code_fields()
+        self.skip()  # co_lnotab
+
+        def loader():
+            reader = MarshalReader(self.data, self.magic_int, self.code_objects, lazy=True)
+            reader.pos = start
+            reader.intern_strings = self.intern_strings[:interned]
+            reader.intern_objects = self.intern_objects[:objects]
+            return reader.load_code_type(_CODE, False)
+
+        return LazyCode(co_name, co_filename, co_firstlineno, loader)
+
+# marshal type code -> MarshalReader method
+MarshalReader.dispatch = dict((ord(marshalType), MarshalReader.__dict__[name]) for marshalType, name in (
+    ('0', 'load_none'),
+    ('N', 'load_none'),
+    ('F', 'load_false'),
+    ('T', 'load_true'),
+    ('S', 'load_stopiter'),
+    ('.', 'load_ellipsis'),
+    ('i', 'load_int'),
+    ('I', 'load_int64'),
+    ('f', 'load_float'),
+    ('g', 'load_binary_float'),
+    ('y', 'load_binary_complex'),
+    ('l', 'load_long'),
+    ('s', 'load_string'),
+    ('t', 'load_interned'),
+    ('R', 'load_stringref'),
+    ('r', 'load_ref'),
+    ('(', 'load_tuple'),
+    (')', 'load_small_tuple'),
+    ('<', 'load_set'),
+    ('>', 'load_frozenset'),
+    ('[', 'load_list'),
+    ('{', 'load_dict'),
+    ('c', 'load_code_type'),
+    ('u', 'load_unicode'),
+    ('a', 'load_ascii'),
+    ('A', 'load_interned'),
+    ('z', 'load_short_ascii'),
+    ('Z', 'load_short_ascii_interned'),
+    # 'x' complex, '?' unknown and 'C' code (Python 1.0 - 1.2) are not handled
+    ('x', 'load_unhandled'),
+    ('?', 'load_unhandled'),
+    ('C', 'load_unhandled')))
+_load_unknown = MarshalReader.__dict__['load_unknown']
+
+def make_code(magic_int, co_argcount, kwonlyargcount, co_nlocals, co_stacksize,
+              co_flags, co_code, co_consts, co_names, co_varnames, co_filename,
+              co_name, co_firstlineno, co_lnotab, co_freevars, co_cellvars):
+    """Build a code object for the running interpreter from unmarshalled fields"""
     # The Python3 code object is different than Python2's which
     # we are reading if we get here.
     # Also various parameters which were strings are now
@@ -222,164 +686,22 @@ def load_code_type(fp, magic_int, bytes_for_s=False, code_objects={}):
                          co_firstlineno, co_lnotab, co_freevars, co_cellvars)
             pass
         pass
-    code_objects[str(code)] = code
     return code
 
-def load_code_internal(fp, magic_int, bytes_for_s=False,
-                       code_objects={}, marshalType=None):
-    global internStrings, internObjects
-
-    if marshalType is None:
-        b1 = ord(fp.read(1))
-        if b1 & 0x80:
-            b1 = b1 &0x7f
-            code = load_code_internal(fp, magic_int, bytes_for_s=False,
-                                      code_objects=code_objects,
-                                      marshalType=chr(b1))
-            internObjects.append(code)
-            return code
-        marshalType = chr(b1)
-
-    # print(marshalType) # debug
-    if marshalType == '0':
-        # Null
-        return None
-    elif marshalType == 'N':
-        return None
-    elif marshalType == 'F':
-        return False
-    elif marshalType == 'T':
-        return True
-    elif marshalType == 'S':
-        return StopIteration
-    elif marshalType == '.':
-        return Ellipsis
-    elif marshalType == 'i':
-        # int
-        return int(unpack('i', fp.read(4))[0])
-    elif marshalType == 'I':
-        # int64
-        return unpack('q', fp.read(8))[0]
-    elif marshalType == 'f':
-        # float
-        n = fp.read(1)
-        return float(unpack('d', fp.read(n))[0])
-    elif marshalType == 'g':
-        # binary float
-        return float(unpack('d', fp.read(8))[0])
-    elif marshalType == 'x':
-        # complex
-        raise KeyError(marshalType)
-    elif marshalType == 'y':
-        # binary complex
-        real = unpack('d', fp.read(8))[0]
-        imag = unpack('d', fp.read(8))[0]
-        return complex(real, imag)
-    elif marshalType == 'l':
-        # long
-        n = unpack('i', fp.read(4))[0]
-        if n == 0:
-            return long(0)
-        size = abs(n)
-        d = long(0)
-        for j in range(0, size):
-            md = int(unpack('h', fp.read(2))[0])
-            d += md << j*15
-        if n < 0:
-            return long(d*-1)
-        return d
-    elif marshalType == 's':
-        # string
-        # Note: could mean bytes in Python3 processing Python2 bytecode
-        strsize = unpack('i', fp.read(4))[0]
-        s = fp.read(strsize)
-        if not bytes_for_s:
-            s = compat_str(s)
-        return s
-    elif marshalType == 't':
-        # interned
-        strsize = unpack('i', fp.read(4))[0]
-        interned = compat_str(fp.read(strsize))
-        internStrings.append(interned)
-        return interned
-    elif marshalType == 'R':
-        # string reference
-        refnum = unpack('i', fp.read(4))[0]
-        return internStrings[refnum]
-    elif marshalType == 'r':
-        # object reference - new in Python3
-        refnum = unpack('i', fp.read(4))[0]
-        return internObjects[refnum-1]
-    elif marshalType == '(':
-        tuplesize = unpack('i', fp.read(4))[0]
-        ret = tuple()
-        while tuplesize > 0:
-            ret += load_code_internal(fp, magic_int, code_objects=code_objects),
-            tuplesize -= 1
-        return ret
-    elif marshalType == '[':
-        raise KeyError(marshalType)
-    elif marshalType == '{':
-        # dictionary
-        raise KeyError(marshalType)
-    elif marshalType == 'c':
-        return load_code_type(fp, magic_int, bytes_for_s=False,
-                              code_objects=code_objects)
-    elif marshalType == 'C':
-        # code type used in Python 1.0 - 1.2
-        raise KeyError("C code is Python 1.0 - 1.2; can't handle yet")
-    elif marshalType == 'u':
-        strsize = unpack('i', fp.read(4))[0]
-        unicodestring = fp.read(strsize)
-        return unicodestring.decode('utf-8')
-    elif marshalType == '?':
-        # unknown
-        raise KeyError(marshalType)
-    elif marshalType in ['<', '>']:
-        # set and frozenset
-        setsize = unpack('i', fp.read(4))[0]
-        ret = tuple()
-        while setsize > 0:
-            ret += load_code_internal(fp, magic_int, code_objects=code_objects),
-            setsize -= 1
-        if marshalType == '>':
-            return frozenset(ret)
-        else:
-            return set(ret)
-    elif marshalType == 'a':
-        # ascii
-        # FIXME check
-        strsize = unpack('i', fp.read(4))[0]
-        s = fp.read(strsize)
-        s = compat_str(s)
-        return s
-    elif marshalType == 'A':
-        # ascii interned - since Python3
-        # FIXME: check
-        strsize = unpack('i', fp.read(4))[0]
-        interned = compat_str(fp.read(strsize))
-        internStrings.append(interned)
-        return interned
-    elif marshalType == ')':
-        # small tuple - since Python3
-        tuplesize = unpack('B', fp.read(1))[0]
-        ret = tuple()
-        while tuplesize > 0:
-            ret += load_code_internal(fp, magic_int, code_objects=code_objects),
-            tuplesize -= 1
-        return ret
-    elif marshalType == 'z':
-        # short ascii - since Python3
-        strsize = unpack('B', fp.read(1))[0]
-        return compat_str(fp.read(strsize))
-    elif marshalType == 'Z':
-        # short ascii interned - since Python3
-        # FIXME: check
-        strsize = unpack('B', fp.read(1))[0]
-        interned = compat_str(fp.read(strsize))
-        internStrings.append(interned)
-        return interned
-    else:
-        sys.stderr.write("Unknown type %i (hex %x) %c\n" %
-                         (ord(marshalType), ord(marshalType), ord(marshalType)))
-    return
+if __name__ == '__main__':
+    # Benchmark: per-element load time of large constant tables should stay
+    # flat as the table grows
+    import marshal, timeit
+    magic_int = 62211  # Python 2.7
+    print("%-10s %8s %10s %12s" % ("type", "items", "load ms", "ns/item"))
+    for name, make in (('tuple', tuple), ('list', list), ('frozenset', frozenset),
+                       ('dict', lambda items: dict((i, str(i)) for i in items)),
+                       ('str tuple', lambda items: tuple('key_%d' % i for i in items))):
+        for size in (1000, 10000, 100000):
+            value = make(range(size))
+            data = marshal.dumps(value, 2)
+            assert MarshalReader(data, magic_int).load() == value
+            reps = max(1, 200000 // size)
+            secs = min(timeit.repeat(lambda: MarshalReader(data, magic_int).load(),
+                                     number=reps, repeat=3)) / reps
+            print("%-10s %8d %10.2f %12.1f" % (name, size, secs * 1e3, secs * 1e9 / size))
@@ -0,0 +1,29 @@
+"""
+Opcode tables for the Python versions uncompyle6 handles.
+"""
+
+def opcode_classes(opc):
+    """
+    Frozen copies of the opcode classes in the opcode module globals
+    <opc>, for fast membership tests in the scanners:
+    const_ops, name_ops, jrel_ops, jabs_ops, jump_ops (either kind of
+    jump), local_ops, compare_ops, free_ops and, where the version has
+    it, nargs_ops; and op_sizes, a 256-entry bytearray with the size of
+    each opcode's instruction, its argument included.
+    """
+    classes = {}
+    for name in ('const', 'name', 'jrel', 'jabs', 'local', 'compare',
+                 'free', 'nargs'):
+        if 'has' + name in opc:
+            classes[name + '_ops'] = frozenset(opc['has' + name])
+    classes['jump_ops'] = classes['jrel_ops'] | classes['jabs_ops']
+
+    extended = opc.get('hasArgumentExtended', ())
+    op_sizes = bytearray(256)
+    for op in range(256):
+        if op < opc['HAVE_ARGUMENT'] and op not in extended:
+            op_sizes[op] = 1
+        else:
+            op_sizes[op] = 3
+    classes['op_sizes'] = op_sizes
+    return classes
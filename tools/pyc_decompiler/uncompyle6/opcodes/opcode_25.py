@@ -7,6 +7,8 @@ This is a superset of Python 2.5's opcode.py with some opcodes that simplify
 parsing and semantic interpretation.
 """
 
+from uncompyle6.opcodes import opcode_classes
+
 # FIXME: DRY this along the lines of opcode_3x.
 
 cmp_op = ('<', '<=', '==', '!=', '>', '>=', 'in', 'not in', 'is',
@@ -55,6 +57,8 @@ def updateGlobal():
     globals().update({'JF': opmap['JUMP_FORWARD']})
     globals().update(dict([(k.replace('+', '_'), v) for (k, v) in opmap.items()]))
     globals().update({'JUMP_OPs': map(lambda op: opname[op], hasjrel + hasjabs)})
+    # frozen opcode classes for the scanners' membership tests
+    globals().update(opcode_classes(globals()))
 
 # Instruction opcodes for compiled code
 # Blank lines correspond to available opcodes
@@ -199,4 +203,4 @@ def_op('EXTENDED_ARG', 143) # 114
 EXTENDED_ARG = 143			# 114
 
 updateGlobal()
-del def_op, name_op, jrel_op, jabs_op
+del def_op, name_op, jrel_op, jabs_op, opcode_classes
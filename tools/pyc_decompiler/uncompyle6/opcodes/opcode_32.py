@@ -10,6 +10,7 @@ parsing and semantic interpretation.
 from copy import deepcopy
 
 import uncompyle6.opcodes.opcode_3x as opcode_3x
+from uncompyle6.opcodes import opcode_classes
 from uncompyle6.opcodes.opcode_3x import fields2copy
 
 # FIXME: can we DRY this even more?
@@ -34,6 +35,8 @@ def updateGlobal():
     globals().update({'JF': opmap['JUMP_FORWARD']})
     globals().update(dict([(k.replace('+', '_'), v) for (k, v) in opmap.items()]))
     globals().update({'JUMP_OPs': map(lambda op: opname[op], hasjrel + hasjabs)})
+    # frozen opcode classes for the scanners' membership tests
+    globals().update(opcode_classes(globals()))
 
 updateGlobal()
 
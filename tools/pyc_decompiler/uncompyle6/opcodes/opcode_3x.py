@@ -3,6 +3,8 @@ CPython 3.2 bytecode opcodes to be used as a base for other opcodes including 3.
 If this file changes the other opcode files may have to a adjusted accordingly.
 """
 
+from uncompyle6.opcodes import opcode_classes
+
 cmp_op = ('<', '<=', '==', '!=', '>', '>=', 'in', 'not in', 'is',
         'is not', 'exception match', 'BAD')
 
@@ -191,6 +193,10 @@ def_op('MAP_ADD', 147)
 def_op('EXTENDED_ARG', 144)
 EXTENDED_ARG = 144
 
+# frozen opcode classes for dis3's membership tests
+globals().update(opcode_classes(globals()))
+del opcode_classes
+
 fields2copy = """cmp_op hasconst hasname hasjrel hasjabs haslocal hascompare hasfree hasnargs
 opmap opname HAVE_ARGUMENT EXTENDED_ARG""".split()
 
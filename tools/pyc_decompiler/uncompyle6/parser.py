@@ -8,8 +8,13 @@ Common uncompyle parser routines.
 
 from __future__ import print_function
 
-import sys
+import hashlib, os, stat, sys, tempfile
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
+import spark_parser
 from uncompyle6.code import iscode
 from spark_parser import GenericASTBuilder, DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 
@@ -24,8 +29,211 @@ class ParserError(Exception):
 
 nop_func = lambda self, args: None
 
+# Processed grammars, so that a worker builds the grammar of a parser
+# class once: the rules read from its p_* docstrings, by parser class,
+# and its parse tables with every state built (see
+# PythonParser.load_tables), by grammar. Both are also kept in a file
+# in a directory private to the user (see grammar_cache_path) that
+# later processes load instead.
+GRAMMAR_CACHE_FORMAT = 1
+grammar_rules = {}
+grammar_tables = {}
+
+def grammar_cache_dir():
+    """
+    The directory the grammar cache files go in: one of the user's own
+    in the temp directory, made if it is missing. The files are
+    pickles, so the directory is only used when nobody else can write
+    to it; None otherwise.
+    """
+    if not hasattr(os, 'getuid'):
+        # Windows: the temp directory is already the user's own
+        return tempfile.gettempdir()
+    path = os.path.join(tempfile.gettempdir(), 'uncompyle6-%d' % os.getuid())
+    try:
+        os.mkdir(path, 0o700)
+    except OSError:
+        pass
+    if not is_private(path, stat.S_ISDIR):
+        return None
+    return path
+
+def is_private(path, is_type):
+    """
+    True if path is of the type is_type checks for (not a symlink),
+    is owned by the user and can't be written by anyone else.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (is_type(st.st_mode) and st.st_uid == os.getuid()
+            and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+def grammar_cache_path(parser_class):
+    """
+    The cache file for parser_class's grammar, or None if there is no
+    safe place for it. Its name changes with the grammar's docstrings,
+    spark and the Python version, so a stale file is never read.
+    """
+    cache_dir = grammar_cache_dir()
+    if cache_dir is None:
+        return None
+    digest = hashlib.md5()
+    digest.update(repr((GRAMMAR_CACHE_FORMAT, spark_parser.__version__,
+                        sys.version_info[:2])).encode('utf-8'))
+    for klass in parser_class.__mro__:
+        for name in sorted(klass.__dict__):
+            if name.startswith('p_'):
+                doc = getattr(klass.__dict__[name], '__doc__', None) or ''
+                digest.update(('%s.%s\n%s' % (klass.__name__, name, doc)).encode('utf-8'))
+    return os.path.join(cache_dir, '%s-%s.grammar' %
+                        (parser_class.__name__, digest.hexdigest()[:16]))
+
+def load_grammar(parser_class):
+    """
+    Reads parser_class's grammar from its cache file into grammar_rules
+    and grammar_tables. False if there is no usable file: one that is
+    missing, not the user's own, or whose tables are not for its rules.
+    """
+    path = grammar_cache_path(parser_class)
+    if path is None or (hasattr(os, 'getuid') and not is_private(path, stat.S_ISREG)):
+        return False
+    try:
+        with open(path, 'rb') as fp:
+            rules, key, tables = pickle.load(fp)
+        # the tables' grammar is the rules plus the start rule
+        key_rules = dict(key[1])
+        if key[0] != parser_class.__name__ or any(
+                key_rules.get(lhs) != tuple(lhs_rules)
+                for lhs, lhs_rules in rules[0].items()):
+            return False
+    except Exception:
+        return False
+    grammar_rules[parser_class] = rules
+    grammar_tables[key] = tables
+    return True
+
+def save_grammar(parser_class, key):
+    """
+    Writes parser_class's grammar to its cache file, unless some other
+    process got there first. The cache is only an optimization, so
+    failures are ignored.
+    """
+    path = grammar_cache_path(parser_class)
+    if path is None or os.path.exists(path):
+        return
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump((grammar_rules[parser_class], key, grammar_tables[key]),
+                        fp, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+
 class PythonParser(GenericASTBuilder):
 
+    def __init__(self, AST, start, debug=PARSER_DEFAULT_DEBUG):
+        GenericASTBuilder.__init__(self, AST, start, debug=debug)
+        # when the class's grammar is new, save it for later processes
+        if self.profile_info is None and self.load_tables():
+            save_grammar(self.__class__, self.grammar_key())
+
+    def collectRules(self):
+        """
+        GenericParser.collectRules, but the p_* docstrings are read
+        once per parser class.
+        """
+        parser_class = self.__class__
+        if self.profile_info is not None:
+            # grammar coverage counts the rules as they are added
+            GenericASTBuilder.collectRules(self)
+            return
+        if parser_class not in grammar_rules and not load_grammar(parser_class):
+            GenericASTBuilder.collectRules(self)
+            grammar_rules[parser_class] = (
+                dict((lhs, list(rules)) for lhs, rules in self.rules.items()),
+                dict(self.rule2name), set(self.list_like_nt),
+                set(self.optional_nt))
+            return
+
+        rules, rule2name, list_like_nt, optional_nt = grammar_rules[parser_class]
+        self.rules = dict((lhs, list(rules)) for lhs, rules in rules.items())
+        self.rule2name = dict(rule2name)
+        for rule, name in rule2name.items():
+            self.rule2func[rule] = self.preprocess(rule, getattr(self, 'p_' + name))[1]
+        self.list_like_nt = set(list_like_nt)
+        self.optional_nt = set(optional_nt)
+
+    def grammar_key(self):
+        """What the parse tables depend on: the parser class and its rules"""
+        return (self.__class__.__name__,
+                tuple(sorted((lhs, tuple(rules)) for lhs, rules in self.rules.items())))
+
+    def load_tables(self):
+        """
+        Readies the parse tables of the parser class's own grammar, which
+        GenericParser.parse would otherwise build on first use, taking
+        them from grammar_tables when they are there. Otherwise every
+        state is built, so that no parser ever adds to the shared tables,
+        and they go in grammar_tables. Parsers switch to tables of their
+        own when custom rules change the grammar.
+
+        True if the tables had to be built.
+        """
+        self.ruleschanged = False
+        key = self.grammar_key()
+        tables = grammar_tables.get(key)
+        if tables is not None:
+            (self.nullable, self.newrules, self.new2old,
+             self.edges, self.cores, self.states) = tables
+            return False
+
+        grammar_tables[key] = self.build_tables(expand=True)
+        return True
+
+    def build_tables(self, expand=False):
+        """
+        Builds the parse tables for the current rules, as
+        GenericParser.parse does when the rules have changed, and returns
+        them. With expand, every state is built now rather than when a
+        parse first needs it.
+        """
+        # as in GenericParser.parse
+        self.ruleschanged = False
+        self.computeNull()
+        self.newrules = {}
+        self.new2old = {}
+        self.makeNewRules()
+        self.edges, self.cores = {}, {}
+        self.states = {0: self.makeState0()}
+        self.makeState(0, self._BOF)
+        if expand:
+            # as in GenericParser.__getstate__
+            changes = True
+            while changes:
+                changes = False
+                for k, v in list(self.edges.items()):
+                    if v is None:
+                        state, sym = k
+                        if state in self.states:
+                            self.goto(state, sym)
+                            changes = True
+        return (self.nullable, self.newrules, self.new2old,
+                self.edges, self.cores, self.states)
+
+    def fold_literals(self, tokens, customize):
+        """
+        Pre-parse pass that grammars can use to fold constant displays
+        into single tokens (see Python2Parser.fold_literals). Returns
+        the tokens and customize to parse with.
+        """
+        return tokens, customize
+
     def cleanup(self):
         """
         Remove recursive references to allow garbage
@@ -461,6 +669,29 @@ def parse(p, tokens, customize):
     return ast
 
 
+def parse_chunks(p, tokens, customize, breaks):
+    """
+    Parses tokens in runs of whole statements, cut before the token
+    indexes in breaks, and joins the stmts they parse into. The Earley
+    sets then stay small on very long statement lists. When a run does
+    not parse by itself, all of tokens is parsed in one go instead.
+    """
+    p.add_custom_rules(tokens, customize)
+    ast = None
+    start = 0
+    try:
+        for end in list(breaks) + [len(tokens)]:
+            chunk = p.parse(tokens[start:end])
+            if ast is None:
+                ast = chunk
+            else:
+                ast.extend(chunk)
+            start = end
+    except (ParserError, AssertionError):
+        return p.parse(tokens)
+    return ast
+
+
 def get_python_parser(version, debug_parser, compile_mode='exec'):
     """Returns parser object for Python version 2 or 3, 3.2, 3.5on,
     etc., depending on the parameters passed.  *compile_mode* is either
@@ -473,9 +704,9 @@ def get_python_parser(version, debug_parser, compile_mode='exec'):
     if version < 3.0:
         import uncompyle6.parsers.parse2 as parse2
         if compile_mode == 'exec':
-            p = parse2.Python2Parser(debug_parser)
+            p = parse2.python2_parser(parse2.Python2Parser, debug_parser)
         else:
-            p = parse2.Python2ParserSingle(debug_parser)
+            p = parse2.python2_parser(parse2.Python2ParserSingle, debug_parser)
     else:
         import uncompyle6.parsers.parse3 as parse3
         if version == 3.2:
@@ -17,11 +17,88 @@ that a later phase can tern into a sequence of ASCII text.
 
 from __future__ import print_function
 
+from uncompyle6.code import iscode
 from uncompyle6.parser import PythonParser, PythonParserSingle, nop_func
 from uncompyle6.parsers.astnode import AST
+from uncompyle6.scanners.tok import Token
 from spark_parser import DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 from uncompyle6 import PYTHON3
 
+# Custom rules that many files need stay in the grammar that parsers
+# start each file with (see Python2Parser.reset_rules), so that a worker
+# going through many files doesn't rebuild the grammar for each of them.
+# Only the first COMMON_RULES_MAX of them are kept, so that the grammar
+# stops growing. Workers keep a parser of each class for all their files
+# (see python2_parser).
+COMMON_RULES_MIN_FILES = 3
+COMMON_RULES_MAX = 128
+custom_rule_files = {}
+common_customize = {}
+common_grammars = {}
+python2_parsers = {}
+
+def note_custom_rules(file_customize):
+    """
+    Counts a file that needed the custom rules for the customize
+    entries in file_customize, making those that enough files have
+    needed common.
+    """
+    for key, value in file_customize.items():
+        if key in common_customize:
+            continue
+        files = custom_rule_files[key] = custom_rule_files.get(key, 0) + 1
+        if files >= COMMON_RULES_MIN_FILES and len(common_customize) < COMMON_RULES_MAX:
+            common_customize[key] = value
+
+def python2_parser(parser_class, debug_parser):
+    """
+    A parser of parser_class for the next file: the one the last file
+    used, reset, if there is one.
+    """
+    key = (parser_class, repr(sorted(debug_parser.items())))
+    p = python2_parsers.get(key)
+    if p is None:
+        p = python2_parsers[key] = parser_class(debug_parser)
+    else:
+        p.reset_rules()
+    return p
+
+def is_literal(token):
+    """
+    Whether token pushes a constant, as far as fold_literals goes: a
+    LOAD_CONST other than of code, a LOAD_LITERAL that is complete, or
+    what big modules have instead of a constant, where CPython leaves
+    them unoptimized: None, True or False by name and empty displays.
+    """
+    op = token.type
+    if op == 'LOAD_CONST':
+        return not iscode(token.pattr)
+    elif op == 'LOAD_NAME':
+        return token.pattr in ('None', 'True', 'False')
+    elif op == 'BUILD_MAP':
+        return token.attr == 0
+    elif op == 'LOAD_LITERAL':
+        return not is_open_map(token)
+    return op in ('BUILD_LIST_0', 'BUILD_TUPLE_0')
+
+def is_open_map(token):
+    """Whether token is a LOAD_LITERAL dict still missing entries"""
+    if token.type != 'LOAD_LITERAL':
+        return False
+    build, items, run = token.attr
+    return build.type == 'BUILD_MAP' and len(items) < build.attr
+
+def unfold_maps(out, open_maps):
+    """
+    Puts back the tokens of the LOAD_LITERAL dicts in open_maps, which
+    are in out, in place of them.
+    """
+    i = len(out)
+    while open_maps:
+        i -= 1
+        if out[i] is open_maps[-1]:
+            out[i:i+1] = open_maps.pop().attr[2]
+
 class Python2Parser(PythonParser):
 
     def __init__(self, debug_parser=PARSER_DEFAULT_DEBUG):
@@ -30,6 +107,74 @@ class Python2Parser(PythonParser):
         else:
             super(Python2Parser, self).__init__(AST, 'stmts', debug=debug_parser)
         self.customized = {}
+        self.file_customize = {}
+        self.reset_rules()
+
+    def checkpoint(self):
+        """
+        A copy of the grammar, custom rules included, for restore() to
+        roll the parser back to. It is not tied to this parser, so any
+        parser of the same class can be restored to it.
+        """
+        if self.ruleschanged:
+            tables = None
+        else:
+            tables = (self.nullable, self.newrules, self.new2old,
+                      self.edges, self.cores, self.states)
+        return (dict((lhs, list(rules)) for lhs, rules in self.rules.items()),
+                dict(self.rule2name), set(self.list_like_nt),
+                set(self.optional_nt), dict(self.customized), tables)
+
+    def restore(self, checkpoint):
+        """
+        Rolls the grammar back to checkpoint. Its parse tables, if it
+        has them, are shared rather than rebuilt.
+        """
+        rules, rule2name, list_like_nt, optional_nt, customized, tables = checkpoint
+        self.rules = dict((lhs, list(rules)) for lhs, rules in rules.items())
+        self.rule2name = dict(rule2name)
+        rule2func = self.rule2func
+        self.rule2func = {}
+        for rule in rule2name:
+            if rule in rule2func:
+                self.rule2func[rule] = rule2func[rule]
+            else:
+                self.rule2func[rule] = self.preprocess(rule, nop_func)[1]
+        self.list_like_nt = set(list_like_nt)
+        self.optional_nt = set(optional_nt)
+        self.customized = dict(customized)
+        if tables is None:
+            self.ruleschanged = True
+        else:
+            (self.nullable, self.newrules, self.new2old,
+             self.edges, self.cores, self.states) = tables
+            self.ruleschanged = False
+
+    def reset_rules(self):
+        """
+        Readies the parser for the next file: the custom rules the last
+        file needed are counted, and the grammar goes back to the
+        class's own rules plus the common custom rules, which are
+        brought up to date first. A parser can then be kept for any
+        number of files.
+        """
+        note_custom_rules(self.file_customize)
+        self.file_customize = {}
+        parser_class = self.__class__
+        common = common_grammars.get(parser_class)
+        if common is None:
+            # a new parser has just the class's rules
+            common = common_grammars[parser_class] = (0, self.checkpoint())
+        if common[0] == len(common_customize):
+            self.restore(common[1])
+            return
+
+        # Rules became common since the grammar was last built. Their
+        # tables are built as parses need them and shared from then on.
+        self.restore(common[1])
+        self.add_custom_rules(None, common_customize)
+        self.build_tables()
+        common_grammars[parser_class] = (len(common_customize), self.checkpoint())
 
     def p_list_comprehension2(self, args):
         """
@@ -322,6 +467,7 @@ class Python2Parser(PythonParser):
     def p_expr2(self, args):
         '''
         expr ::= LOAD_LOCALS
+        expr ::= LOAD_LITERAL
 
         slice0 ::= expr SLICE+0
         slice0 ::= expr DUP_TOP SLICE+0
@@ -336,6 +482,66 @@ class Python2Parser(PythonParser):
         binary_subscr2 ::= expr expr DUP_TOPX_2 BINARY_SUBSCR
         '''
 
+    def fold_literals(self, tokens, customize):
+        """
+        Folds the lists, tuples, sets and dicts built from nothing but
+        constants in tokens into single LOAD_LITERAL tokens, so that big
+        data tables don't go through the parser item by item. The attr of
+        a LOAD_LITERAL is (the BUILD_* token, its items, the tokens it
+        replaced), where items are element tokens, or (key, value) token
+        pairs for dicts (see is_literal); the walker prints it (see
+        n_LOAD_LITERAL).
+
+        Returns the new tokens, and customize less the entries that only
+        folded tokens needed.
+        """
+        out = []
+        folded = set()
+        # LOAD_LITERAL dicts still missing entries, innermost last
+        open_maps = []
+        for token in tokens:
+            op = token.type
+            if op == 'STORE_MAP':
+                # A dict display of n entries is BUILD_MAP n (0xFFFF at
+                # most) then n times: value, key, STORE_MAP.
+                if len(out) >= 3:
+                    build, value, key = out[-3:]
+                    if (key.type in ('LOAD_CONST', 'LOAD_NAME') and is_literal(key)
+                        and is_literal(value)):
+                        if build.type == 'BUILD_MAP' and 0 < build.attr < 0xFFFF:
+                            build = Token('LOAD_LITERAL',
+                                          (build, [(key, value)], [build, value, key, token]),
+                                          None, build.offset, build.linestart)
+                            out[-3:] = [build]
+                            if is_open_map(build):
+                                open_maps.append(build)
+                            continue
+                        if open_maps and build is open_maps[-1]:
+                            build.attr[1].append((key, value))
+                            build.attr[2].extend((value, key, token))
+                            del out[-2:]
+                            if not is_open_map(build):
+                                open_maps.pop()
+                            continue
+                # An entry that isn't constant: the dicts still being
+                # built around it aren't constant either.
+                unfold_maps(out, open_maps)
+            elif op.startswith(('BUILD_LIST_', 'BUILD_TUPLE_', 'BUILD_SET_')):
+                n = token.attr
+                if 0 < n <= len(out) and all(is_literal(t) for t in out[-n:]):
+                    items = out[-n:]
+                    out[-n:] = [Token('LOAD_LITERAL', (token, items, items + [token]),
+                                      None, items[0].offset, items[0].linestart)]
+                    folded.add(op)
+                    continue
+            out.append(token)
+        unfold_maps(out, open_maps)
+
+        if folded:
+            folded -= set(t.type for t in out)
+            customize = dict((k, v) for k, v in customize.items() if k not in folded)
+        return out, customize
+
     def add_custom_rules(self, tokens, customize):
         '''
         Special handling for opcodes that take a variable number
@@ -399,6 +605,7 @@ class Python2Parser(PythonParser):
             else:
                 raise Exception('unknown customize token %s' % k)
             self.addRule(rule, nop_func)
+            self.file_customize[k] = v
 
 class Python2ParserSingle(Python2Parser, PythonParserSingle):
     pass
@@ -16,10 +16,15 @@ for later use in deparsing.
 
 from __future__ import print_function
 
-import sys
+import re, sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from heapq import heapify, heappop, heappush
 
 from uncompyle6 import PYTHON3
 from uncompyle6.scanners.tok import Token
+from uncompyle6.code import CODE_FIELDS, materialize
 
 # FIXME: DRY
 if PYTHON3:
@@ -34,6 +39,126 @@ from uncompyle6.opcodes import (opcode_25, opcode_26, opcode_27,
                                 opcode_32, opcode_33, opcode_34, opcode_35)
 
 
+linetuple = namedtuple('linetuple', ['l_no', 'next'])
+
+class LineTable(object):
+    '''
+    Line data for each byte offset of a code object, held as runs of
+    offsets sharing the same entry: table[offset] is the
+    linetuple(l_no, next) a list with one tuple per byte would hold.
+    '''
+    __slots__ = ('starts', 'l_nos', 'nexts', 'length')
+
+    def __init__(self):
+        self.starts = array('i')
+        self.l_nos = array('i')
+        self.nexts = array('i')
+        self.length = 0
+
+    def extend(self, end, l_no, next):
+        '''Give the offsets from the current length up to end the entry (l_no, next)'''
+        if end <= self.length:
+            return
+        if not (self.l_nos and self.l_nos[-1] == l_no and self.nexts[-1] == next):
+            self.starts.append(self.length)
+            self.l_nos.append(l_no)
+            self.nexts.append(next)
+        self.length = end
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, offset):
+        if offset < 0:
+            offset += self.length
+        if not 0 <= offset < self.length:
+            raise IndexError('line table index out of range')
+        run = bisect_right(self.starts, offset) - 1
+        return linetuple(self.l_nos[run], self.nexts[run])
+
+class Structs(list):
+    '''
+    The block structures detect_structure has found, dicts with 'type',
+    'start' and 'end', in the order they were added; the first is the
+    root. Besides the list they are indexed by start and end offset, so
+    that parent() only revisits the structures that opened or closed
+    since the previous offset, as long as the offsets asked for don't
+    decrease.
+    '''
+
+    def __init__(self, root):
+        list.__init__(self)
+        self.reset()
+        self.append(root)
+
+    def reset(self):
+        # (start, index) of the structures parent() hasn't reached yet
+        self.pending = [(struct['start'], i) for i, struct in enumerate(self)]
+        heapify(self.pending)
+        # the structures around the last offset: (end, index) and the
+        # indices in ascending order
+        self.ending = []
+        self.open = []
+        # indices of the open structures parent() picked, ascending
+        self.picked = []
+        self.pos = -1
+
+    def append(self, struct):
+        heappush(self.pending, (struct['start'], len(self)))
+        list.append(self, struct)
+
+    def parent(self, pos):
+        '''
+        The structure enclosing pos: going through the structures in the
+        order they were added, the last one containing pos that also lies
+        within the one picked before it.
+        '''
+        if pos < self.pos:
+            self.reset()
+        self.pos = pos
+        pending, ending, open, picked = self.pending, self.ending, self.open, self.picked
+
+        # Picks only depend on the picks before them, so they stand up
+        # to the first structure that opened or a picked one that closed.
+        changed = len(self)
+        while pending and pending[0][0] <= pos:
+            i = heappop(pending)[1]
+            end = self[i]['end']
+            if end > pos:
+                heappush(ending, (end, i))
+                insort(open, i)
+                changed = min(changed, i)
+        while ending and ending[0][0] <= pos:
+            i = heappop(ending)[1]
+            del open[bisect_left(open, i)]
+            k = bisect_left(picked, i)
+            if k < len(picked) and picked[k] == i:
+                changed = min(changed, i)
+
+        if changed < len(self):
+            del picked[bisect_left(picked, changed):]
+            parent = self[picked[-1]] if picked else self[0]
+            start = parent['start']
+            end = parent['end']
+            for i in open[bisect_left(open, changed):]:
+                struct = self[i]
+                if start <= struct['start'] and struct['end'] <= end:
+                    start = struct['start']
+                    end = struct['end']
+                    picked.append(i)
+        return self[picked[-1]] if picked else self[0]
+
+# opcode sequences -> compiled matcher, see Scanner.sequence_ends
+sequence_patterns = {}
+
+def sequence_pattern(seqs):
+    pattern = sequence_patterns.get(seqs)
+    if pattern is None:
+        # the lookahead lets matches overlap
+        alternatives = b'|'.join(re.escape(bytes(bytearray(seq))) for seq in seqs)
+        pattern = sequence_patterns[seqs] = re.compile(b'(?=' + alternatives + b')')
+    return pattern
+
 class Code(object):
     '''
     Class for representing code-objects.
@@ -41,14 +166,30 @@ class Code(object):
     This is similar to the original code object, but additionally
     the diassembled code is stored in the attribute '_tokens'.
     '''
+    __slots__ = CODE_FIELDS + ('_tokens', '_customize')
+
     def __init__(self, co, scanner, classname=None):
-        for i in dir(co):
-            if i.startswith('co_'):
-                setattr(self, i, getattr(co, i))
+        # nested code may still be undecoded (see marsh lazy loading)
+        co = materialize(co)
+        for name in CODE_FIELDS:
+            # co_kwonlyargcount only exists for Python 3 code
+            value = getattr(co, name, self)
+            if value is not self:
+                setattr(self, name, value)
         self._tokens, self._customize = scanner.disassemble(co, classname)
 
 class Scanner(object):
 
+    # Offsets of every instruction in self.code, and per opcode, in
+    # ascending order (see build_instr_index). None while the scanner
+    # has no index for the current code, e.g. because it rewrites it.
+    insts = None
+    op_offsets = None
+    # Jump offset -> target, and target -> jump offsets (ascending),
+    # built with the instruction index
+    jumps = None
+    jump_sources = None
+
     def __init__(self, version):
         self.version = version
         # FIXME: DRY
@@ -82,10 +223,14 @@ class Scanner(object):
         return self.setTokenClass(Token)
 
     def get_target(self, pos, op=None):
+        if self.insts is not None and (op is None or op == self.code[pos]):
+            target = self.jumps.get(pos)
+            if target is not None:
+                return target
         if op is None:
             op = self.code[pos]
         target = self.get_argument(pos)
-        if op in self.opc.hasjrel:
+        if op in self.opc.jrel_ops:
             target += pos + 3
         return target
 
@@ -96,7 +241,7 @@ class Scanner(object):
     def print_bytecode(self):
         for i in self.op_range(0, len(self.code)):
             op = self.code[i]
-            if op in self.opc.hasjabs+self.opc.hasjrel:
+            if op in self.opc.jump_ops:
                 dest = self.get_target(i, op)
                 print('%i\t%s\t%i' % (i, self.opname[op], dest))
             else:
@@ -121,21 +266,24 @@ class Scanner(object):
         except:
             instr = [instr]
 
+        if target is not None and exact:
+            offsets = self.jumps_to(start, end, instr, target)
+            if offsets is not None:
+                return offsets[0] if offsets else None
+
         result_offset = None
         current_distance = len(code)
-        for offset in self.op_range(start, end):
-            op = code[offset]
-            if op in instr:
-                if target is None:
-                    return offset
-                dest = self.get_target(offset)
-                if dest == target:
-                    return offset
-                elif not exact:
-                    new_distance = abs(target - dest)
-                    if new_distance < current_distance:
-                        current_distance = new_distance
-                        result_offset = offset
+        for offset in self.instr_offsets(start, end, instr):
+            if target is None:
+                return offset
+            dest = self.get_target(offset)
+            if dest == target:
+                return offset
+            elif not exact:
+                new_distance = abs(target - dest)
+                if new_distance < current_distance:
+                    current_distance = new_distance
+                    result_offset = offset
         return result_offset
 
     def last_instr(self, start, end, instr, target=None, exact=True):
@@ -161,23 +309,26 @@ class Scanner(object):
         except:
             instr = [instr]
 
+        if target is not None and exact:
+            offsets = self.jumps_to(start, end, instr, target)
+            if offsets is not None:
+                return offsets[-1] if offsets else None
+
         result_offset = None
         current_distance = len(code)
-        for offset in self.op_range(start, end):
-            op = code[offset]
-            if op in instr:
-                if target is None:
+        for offset in self.instr_offsets(start, end, instr):
+            if target is None:
+                result_offset = offset
+            else:
+                dest = self.get_target(offset)
+                if dest == target:
+                    current_distance = 0
                     result_offset = offset
-                else:
-                    dest = self.get_target(offset)
-                    if dest == target:
-                        current_distance = 0
+                elif not exact:
+                    new_distance = abs(target - dest)
+                    if new_distance <= current_distance:
+                        current_distance = new_distance
                         result_offset = offset
-                    elif not exact:
-                        new_distance = abs(target - dest)
-                        if new_distance <= current_distance:
-                            current_distance = new_distance
-                            result_offset = offset
         return result_offset
 
     def all_instr(self, start, end, instr, target=None, include_beyond_target=False):
@@ -197,18 +348,20 @@ class Scanner(object):
         except:
             instr = [instr]
 
+        if target is None:
+            return self.instr_offsets(start, end, instr)
+        if not include_beyond_target:
+            offsets = self.jumps_to(start, end, instr, target)
+            if offsets is not None:
+                return offsets
+
         result = []
-        for offset in self.op_range(start, end):
-            op = code[offset]
-            if op in instr:
-                if target is None:
-                    result.append(offset)
-                else:
-                    t = self.get_target(offset)
-                    if include_beyond_target and t >= target:
-                        result.append(offset)
-                    elif t == target:
-                        result.append(offset)
+        for offset in self.instr_offsets(start, end, instr):
+            t = self.get_target(offset)
+            if include_beyond_target and t >= target:
+                result.append(offset)
+            elif t == target:
+                result.append(offset)
         return result
 
     def op_size(self, op):
@@ -216,23 +369,147 @@ class Scanner(object):
         Return size of operator with its arguments
         for given opcode <op>.
         """
-        if op < self.opc.HAVE_ARGUMENT and op not in self.opc.hasArgumentExtended:
-            return 1
-        else:
-            return 3
+        return self.opc.op_sizes[op]
 
     def op_hasArgument(self, op):
         return self.op_size(op) > 1
 
+    def build_instr_index(self, n):
+        """
+        Index the instructions in self.code[:n] for first_instr,
+        last_instr, all_instr and rem_or: self.insts holds every
+        instruction offset and self.op_offsets maps each opcode to
+        the offsets where it occurs, both in ascending order.
+
+        Jumps are resolved once here too: self.jumps maps each jump's
+        offset to its target (what get_target returns) and
+        self.jump_sources maps each target to the jumps to it.
+        """
+        code = self.code
+        jrel_ops = self.opc.jrel_ops
+        jump_ops = self.opc.jump_ops
+        insts = list(self.op_range(0, n))
+        op_offsets = {}
+        jumps = {}
+        jump_sources = {}
+        for offset in insts:
+            op = code[offset]
+            if op in op_offsets:
+                op_offsets[op].append(offset)
+            else:
+                op_offsets[op] = [offset]
+            if op in jump_ops:
+                target = code[offset+1] + code[offset+2] * 256
+                if op in jrel_ops:
+                    target += offset + 3
+                jumps[offset] = target
+                if target in jump_sources:
+                    jump_sources[target].append(offset)
+                else:
+                    jump_sources[target] = [offset]
+        self.insts = insts
+        self.op_offsets = op_offsets
+        self.insts_end = n
+        self.jumps = jumps
+        self.jump_sources = jump_sources
+        self.jump_ops = jump_ops
+
+    def indexed(self, start, end):
+        """True if the instruction index can answer queries on start..end"""
+        insts = self.insts
+        if insts is None or end > self.insts_end:
+            return False
+        # a start inside an instruction is walked the slow way
+        i = bisect_left(insts, start)
+        return i == len(insts) or insts[i] == start
+
+    def instr_offsets(self, start, end, instr):
+        """
+        Offsets of the <instr> opcodes (a list of opcodes) in the block
+        from start to end, in ascending order.
+        """
+        if self.indexed(start, end):
+            op_offsets = self.op_offsets
+            result = []
+            for op in set(instr):
+                offsets = op_offsets.get(op)
+                if offsets:
+                    result.extend(offsets[bisect_left(offsets, start):
+                                          bisect_left(offsets, end)])
+            result.sort()
+            return result
+
+        code = self.code
+        return [offset for offset in self.op_range(start, end)
+                if code[offset] in instr]
+
+    def sequence_ends(self, start, end, seqs):
+        """
+        Offsets of the last instruction of every run of consecutive
+        instructions in the block from start to end whose opcodes
+        spell one of <seqs> (a tuple of opcode tuples of the same
+        length), in ascending order.
+
+        With the instruction index this is one regular expression pass
+        over the opcodes at the instruction starts.
+        """
+        code = self.code
+        last = len(seqs[0]) - 1
+        if self.indexed(start, end):
+            insts = self.insts
+            lo, hi = bisect_left(insts, start), bisect_left(insts, end)
+            ops = bytearray([code[offset] for offset in insts[lo:hi]])
+            return [insts[lo + m.start() + last]
+                    for m in sequence_pattern(seqs).finditer(ops)]
+
+        insts = list(self.op_range(start, end))
+        return [insts[i + last] for i in range(len(insts) - last)
+                if tuple(code[offset] for offset in insts[i:i+last+1]) in seqs]
+
+    def jumps_to(self, start, end, instr, target):
+        """
+        Offsets of the <instr> jumps in the block from start to end
+        whose target is <target>, in ascending order; None if the jump
+        table can't answer (no index, or <instr> has non-jump opcodes).
+        """
+        if not self.indexed(start, end):
+            return None
+        if not self.jump_ops.issuperset(instr):
+            return None
+        code = self.code
+        return [offset for offset in self.jump_sources.get(target, ())
+                if start <= offset < end and code[offset] in instr]
+
     def op_range(self, start, end):
         """
         Iterate through positions of opcodes, skipping
         arguments.
         """
+        code = self.code
+        op_sizes = self.opc.op_sizes
         while start < end:
             yield start
-            start += self.op_size(self.code[start])
-    
+            start += op_sizes[code[start]]
+
+    def disassemble_with_breaks(self, co, classname=None, code_objects={},
+                                showast=False):
+        """
+        disassemble(), returning also the offsets in co where its tokens
+        can be cut into runs of whole statements (see stmt_breaks).
+        """
+        tokens, customize = self.disassemble(co, classname, code_objects=code_objects,
+                                             showast=showast)
+        return tokens, customize, self.stmt_breaks()
+
+    def stmt_breaks(self):
+        """
+        Offsets where the code disassembled last can be cut into runs of
+        whole statements that parse on their own; none unless the
+        scanner knows better. Use disassemble_with_breaks to get them
+        together with the tokens they belong to.
+        """
+        return []
+
     def remove_mid_line_ifs(self, ifs):
         filtered = []
         for i in ifs:
@@ -261,19 +538,17 @@ class Scanner(object):
         except: instr = [instr]
 
         result = []
-        for i in self.op_range(start, end):
-            op = code[i]
-            if op in instr:
-                if target is None:
+        for i in self.instr_offsets(start, end, instr):
+            if target is None:
+                result.append(i)
+            else:
+                t = self.get_target(i)
+                if include_beyond_target and t >= target:
                     result.append(i)
-                else:
-                    t = self.get_target(i, op)
-                    if include_beyond_target and t >= target:
-                        result.append(i)
-                    elif t == target:
-                        result.append(i)
-                    elif break_if_not_target:
-                        break
+                elif t == target:
+                    result.append(i)
+                elif break_if_not_target:
+                    break
 
         pjits = self.all_instr(start, end, self.opc.PJIT)
         filtered = []
@@ -292,6 +567,9 @@ class Scanner(object):
             target = parent['end']
         return target
 
+# A new scanner for each caller, since a scanner holds the state of the
+# code it disassembled last. Building one is cheap: the opcode tables
+# are class attributes of the scanner classes.
 def get_scanner(version):
     # Pick up appropriate scanner
     # from trepan.api import debug;
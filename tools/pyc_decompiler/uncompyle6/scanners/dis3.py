@@ -8,18 +8,8 @@ from uncompyle6.opcodes.opcode_3x import *
 
 from dis import findlinestarts
 import types
-import collections
 import io
 
-from uncompyle6 import PYTHON3
-
-if PYTHON3:
-    def code2num(code, i):
-        return code[i]
-else:
-    def code2num(code, i):
-        return ord(code[i])
-
 _have_code = (types.MethodType, types.FunctionType, types.CodeType, type)
 
 def _try_compile(source, name):
@@ -149,10 +139,7 @@ def show_code(co):
     """
     print(code_info(co))
 
-_Instruction = collections.namedtuple("_Instruction",
-     "opname opcode arg argval argrepr offset starts_line is_jump_target")
-
-class Instruction3(_Instruction):
+class Instruction3(object):
     """Details for a bytecode operation
 
        Defined fields:
@@ -160,11 +147,40 @@ class Instruction3(_Instruction):
          opcode - numeric code for operation
          arg - numeric argument to operation (if any), otherwise None
          argval - resolved arg value (if known), otherwise same as arg
-         argrepr - human readable description of operation argument
+         argrepr - human readable description of operation argument;
+                   None when created means repr(argval), worked out
+                   the first time it is asked for
          offset - start index of operation within bytecode sequence
          starts_line - line started by this opcode (if any), otherwise None
          is_jump_target - True if other code jumps to here, otherwise False
     """
+    __slots__ = ('opname', 'opcode', 'arg', 'argval', '_argrepr',
+                 'offset', 'starts_line', 'is_jump_target')
+
+    def __init__(self, opname, opcode, arg, argval, argrepr,
+                 offset, starts_line, is_jump_target):
+        self.opname = opname
+        self.opcode = opcode
+        self.arg = arg
+        self.argval = argval
+        self._argrepr = argrepr
+        self.offset = offset
+        self.starts_line = starts_line
+        self.is_jump_target = is_jump_target
+
+    @property
+    def argrepr(self):
+        # The repr of a large constant can cost more than decoding the
+        # whole code object, and the scanners rarely need it.
+        if self._argrepr is None:
+            self._argrepr = repr(self.argval)
+        return self._argrepr
+
+    def __repr__(self):
+        return ('Instruction3(opname=%r, opcode=%r, arg=%r, argval=%r, argrepr=%r, '
+                'offset=%r, starts_line=%r, is_jump_target=%r)' %
+                (self.opname, self.opcode, self.arg, self.argval, self.argrepr,
+                 self.offset, self.starts_line, self.is_jump_target))
 
     def _disassemble(self, lineno_width=3, mark_as_current=False):
         """Format instruction details for inclusion in disassembly output
@@ -229,15 +245,15 @@ def get_instructions(x, opnames, first_line=None):
 def _get_const_info(const_index, const_list):
     """Helper to get optional details about const references
 
-       Returns the dereferenced constant and its repr if the constant
-       list is defined.
-       Otherwise returns the constant index and its repr().
+       Returns the dereferenced constant if the constant list is
+       defined, otherwise the constant index. The repr is returned
+       as None, for Instruction3 to work out when asked.
     """
     argval = const_index
     if const_list is not None:
         argval = const_list[const_index]
 
-    return argval, repr(argval)
+    return argval, None
 
 def _get_name_info(name_index, name_list):
     """Helper to get optional details about named references
@@ -264,7 +280,9 @@ def _get_instructions_bytes(code, opnames, varnames=None, names=None, constants=
     arguments.
 
     """
-    labels = findlabels(code)
+    labels = set(findlabels(code))
+    # indexing a bytearray gives the opcodes as ints in Python 2 and 3
+    code = bytearray(code)
     extended_arg = 0
     starts_line = None
     # enumerate() is not an option, since we sometimes process
@@ -272,7 +290,7 @@ def _get_instructions_bytes(code, opnames, varnames=None, names=None, constants=
     n = len(code)
     i = 0
     while i < n:
-        op = code2num(code, i)
+        op = code[i]
         offset = i
         if linestarts is not None:
             starts_line = linestarts.get(i, None)
@@ -284,7 +302,7 @@ def _get_instructions_bytes(code, opnames, varnames=None, names=None, constants=
         argval = None
         argrepr = ''
         if op >= HAVE_ARGUMENT:
-            arg = code2num(code, i) + code2num(code, i+1)*256 + extended_arg
+            arg = code[i] + code[i+1]*256 + extended_arg
             extended_arg = 0
             i = i+2
             if op == EXTENDED_ARG:
@@ -294,23 +312,23 @@ def _get_instructions_bytes(code, opnames, varnames=None, names=None, constants=
             #    _disassemble_bytes needs the string repr of the
             #    raw name index for LOAD_GLOBAL, LOAD_CONST, etc.
             argval = arg
-            if op in hasconst:
+            if op in const_ops:
                 argval, argrepr = _get_const_info(arg, constants)
-            elif op in hasname:
+            elif op in name_ops:
                 argval, argrepr = _get_name_info(arg, names)
-            elif op in hasjrel:
+            elif op in jrel_ops:
                 argval = i + arg
                 argrepr = "to " + repr(argval)
-            elif op in haslocal:
+            elif op in local_ops:
                 argval, argrepr = _get_name_info(arg, varnames)
-            elif op in hascompare:
+            elif op in compare_ops:
                 argval = cmp_op[arg]
                 argrepr = argval
-            elif op in hasfree:
+            elif op in free_ops:
                 argval, argrepr = _get_name_info(arg, cells)
-            elif op in hasnargs:
+            elif op in nargs_ops:
                 argrepr = ("%d positional, %d keyword pair" %
-                               (code2num(code, i-2), code2num(code, i-1)))
+                               (code[i-2], code[i-1]))
         opname = opnames[op]
         yield Instruction3(opname, op,
                           arg, argval, argrepr,
@@ -323,23 +341,26 @@ def findlabels(code):
 
     """
     labels = []
+    seen = set()
+    code = bytearray(code)
     # enumerate() is not an option, since we sometimes process
     # multiple elements on a single pass through the loop
     n = len(code)
     i = 0
     while i < n:
-        op = code2num(code, i)
+        op = code[i]
         i = i+1
         if op >= HAVE_ARGUMENT:
-            arg = code2num(code, i) + code2num(code, i+1)*256
+            arg = code[i] + code[i+1]*256
             i = i+2
             label = -1
-            if op in hasjrel:
+            if op in jrel_ops:
                 label = i+arg
-            elif op in hasjabs:
+            elif op in jabs_ops:
                 label = arg
             if label >= 0:
-                if label not in labels:
+                if label not in seen:
+                    seen.add(label)
                     labels.append(label)
     return labels
 
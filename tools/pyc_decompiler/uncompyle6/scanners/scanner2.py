@@ -0,0 +1,477 @@
+#  Copyright (c) 2015, 2016 by Rocky Bernstein
+#  Copyright (c) 2005 by Dan Pascu <dan@windowmaker.org>
+#  Copyright (c) 2000-2002 by hartmut Goebel <h.goebel@crazy-compilers.com>
+#  Copyright (c) 1999 John Aycock
+"""
+Python 2 Generic bytecode scanner/deparser
+
+The parts of scanning Python 2.5, 2.6 and 2.7 bytecode that do not
+depend on the version: setting up and indexing the code, the
+instruction and line tables, finding statement boundaries and turning
+instructions into tokens. Opcodes are looked up in the scanner's opcode
+module (self.opc) and the opcode classes in the stmt_opcodes,
+stmt_opcode_seqs, designator_ops, block_setup_ops and extra_build_ops
+class attributes, so the version-specific scanners only keep what
+really differs between versions: detect_structure, find_jump_targets
+and a few hooks.
+"""
+
+from __future__ import print_function
+
+import dis
+from array import array
+
+from uncompyle6.code import iscode
+import uncompyle6.scanner as scan
+
+class Scanner2(scan.Scanner):
+    # Opcode classes used to find statement boundaries; the
+    # version-specific scanners fill these in.
+    stmt_opcodes = frozenset()
+    stmt_opcode_seqs = ()
+    designator_ops = frozenset()
+    # Opcodes that set up a block ended by END_FINALLY
+    block_setup_ops = frozenset()
+    # Opcodes that take a count, besides those all versions share
+    extra_build_ops = ()
+
+    # Jumps that disassemble() turns into other tokens. 2.7's
+    # find_jump_targets fills these in; earlier versions leave them empty.
+    continue_oneline = frozenset()
+    JA_to_shortJF = frozenset()
+    JA_to_RV = frozenset()
+    return_end_ifs_rep_to_JF = frozenset()
+    add_additional_PB = frozenset()
+
+    # Whether self.lines[offset].l_no is the line number of offset. When
+    # false, after the first line, the offset where the line starts
+    # stands for it.
+    lines_by_line_no = False
+
+    def __init__(self, version):
+        scan.Scanner.__init__(self, version)
+        self.showast = False
+
+    def disassemble(self, co, classname=None, code_objects={}, showast=False):
+        """
+        Disassemble a Python 2 code object, returning a list of 'Token'.
+        Various tranformations are made to assist the deparsing grammar.
+        For example:
+           -  various types of LOAD_CONST's are categorized in terms of what they load
+           -  COME_FROM instructions are added to assist parsing control structures
+           -  MAKE_FUNCTION and FUNCTION_CALLS append the number of positional aruments
+        The main part of this procedure is modelled after
+        dis.disassemble().
+        """
+        self.showast = showast
+        opc = self.opc
+        JA = opc.JA
+        # import dis; dis.disassemble(co) # DEBUG
+
+        # Container for tokens
+        tokens = []
+
+        customize = {}
+        Token = self.Token # shortcut
+
+        # setup_code has restructure() convert 2.5 and 2.6 bytecode to
+        # match 2.7's before it is indexed
+        n = self.setup_code(co)
+        self.build_lines_data(co, n)
+        self.build_prev_op(n)
+
+        # self.lines contains (block,addrLastInstr)
+        if classname:
+            classname = '_' + classname.lstrip('_') + '__'
+
+            def unmangle(name):
+                if name.startswith(classname) and name[-2:] != '__':
+                    return name[len(classname) - 2:]
+                return name
+
+            free = [ unmangle(name) for name in (co.co_cellvars + co.co_freevars) ]
+            names = [ unmangle(name) for name in co.co_names ]
+            varnames = [ unmangle(name) for name in co.co_varnames ]
+        else:
+            free = co.co_cellvars + co.co_freevars
+            names = co.co_names
+            varnames = co.co_varnames
+
+        self.load_asserts = set()
+        for i in self.op_range(0, n):
+            if self.code[i] == opc.PJIT and self.code[i+3] == opc.LOAD_GLOBAL:
+                if names[self.get_argument(i+3)] == 'AssertionError':
+                    self.load_asserts.add(i+3)
+
+        cf = self.find_jump_targets()
+        # contains (code, [addrRefToCode])
+        last_stmt = self.next_stmt[0]
+        i = self.next_stmt[last_stmt]
+        replace = {}
+        while i < n-1:
+            if self.lines[last_stmt].next > i:
+                if self.code[last_stmt] == opc.PRINT_ITEM:
+                    if self.code[i] == opc.PRINT_ITEM:
+                        replace[i] = 'PRINT_ITEM_CONT'
+                    elif self.code[i] == opc.PRINT_NEWLINE:
+                        replace[i] = 'PRINT_NEWLINE_CONT'
+            last_stmt = i
+            i = self.next_stmt[i]
+
+        imports = self.all_instr(0, n, (opc.IMPORT_NAME, opc.IMPORT_FROM, opc.IMPORT_STAR))
+        if len(imports) > 1:
+            last_import = imports[0]
+            for i in imports[1:]:
+                if self.lines[last_import].next > i:
+                    if self.code[last_import] == opc.IMPORT_NAME == self.code[i]:
+                        replace[i] = 'IMPORT_NAME_CONT'
+                last_import = i
+
+        build_ops = (opc.BUILD_LIST, opc.BUILD_TUPLE, opc.BUILD_SLICE,
+                     opc.UNPACK_SEQUENCE,
+                     opc.MAKE_FUNCTION, opc.CALL_FUNCTION, opc.MAKE_CLOSURE,
+                     opc.CALL_FUNCTION_VAR, opc.CALL_FUNCTION_KW,
+                     opc.CALL_FUNCTION_VAR_KW, opc.DUP_TOPX, opc.RAISE_VARARGS
+                     ) + self.extra_build_ops
+
+        if self.showast:
+            print('\n--- Original code modification during disassembly: ---\n')
+
+        extended_arg = 0
+        for offset in self.op_range(0, n):
+            if offset in cf:
+                k = 0
+                for j in cf[offset]:
+                    tokens.append(Token('COME_FROM', None, repr(j),
+                                    offset="%s_%d" % (offset, k)))
+                    k += 1
+
+            op = self.code[offset]
+            op_name = self.opname[op]
+
+            oparg = None; pattr = None
+            if op >= opc.HAVE_ARGUMENT:
+                oparg = self.get_argument(offset) + extended_arg
+                extended_arg = 0
+                if op == opc.EXTENDED_ARG:
+                    extended_arg = oparg * scan.L65536
+                    continue
+                if op in opc.const_ops:
+                    const = co.co_consts[oparg]
+                    if iscode(const):
+                        oparg = const
+                        if const.co_name == '<lambda>':
+                            assert op_name == 'LOAD_CONST'
+                            op_name = 'LOAD_LAMBDA'
+                        elif const.co_name == '<genexpr>':
+                            op_name = 'LOAD_GENEXPR'
+                        elif const.co_name == '<dictcomp>':
+                            op_name = 'LOAD_DICTCOMP'
+                        elif const.co_name == '<setcomp>':
+                            op_name = 'LOAD_SETCOMP'
+                        # verify() uses 'pattr' for comparison, since 'attr'
+                        # now holds Code(const) and thus can not be used
+                        # for comparison (todo: think about changing this)
+                        # pattr = 'code_object @ 0x%x %s->%s' %\
+                        # (id(const), const.co_filename, const.co_name)
+                        pattr = '<code_object ' + const.co_name + '>'
+                    else:
+                        pattr = const
+                elif op in opc.name_ops:
+                    pattr = names[oparg]
+                elif op in opc.jrel_ops:
+                    pattr = repr(offset + 3 + oparg)
+                elif op in opc.jabs_ops:
+                    pattr = repr(oparg)
+                elif op in opc.local_ops:
+                    pattr = varnames[oparg]
+                elif op in opc.compare_ops:
+                    pattr = opc.cmp_op[oparg]
+                elif op in opc.free_ops:
+                    pattr = free[oparg]
+                op_name = self.rename_op(offset, op_name, oparg, cf)
+
+            if op in build_ops:
+                # CE - Hack for >= 2.5
+                #      Now all values loaded via LOAD_CLOSURE are packed into
+                #      a tuple before calling MAKE_CLOSURE.
+                if op == opc.BUILD_TUPLE and \
+                    self.code[self.prev[offset]] == opc.LOAD_CLOSURE:
+                    continue
+                else:
+                    op_name = '%s_%d' % (op_name, oparg)
+                    if op != opc.BUILD_SLICE:
+                        customize[op_name] = oparg
+            elif op == JA:
+                target = self.get_target(offset)
+                if self.backward_jump_is_continue(offset, target):
+                    if (offset in self.stmts and self.code[offset+3] not in (opc.END_FINALLY, opc.POP_BLOCK) \
+                        and offset not in self.not_continue) or offset in self.continue_oneline:
+                        #0 JUMP_ABSOLUTE ---^
+                        #1 NOT END_FINALLY, POP_BLOCK
+                        if self.showast: print('%d %s --> CONTINUE' % (offset, op_name))
+                        op_name = 'CONTINUE'
+                    elif offset in self.JA_to_shortJF:
+                        #0 JUMP_ABSOLUTE --+
+                        #1 XXX          <--+
+                        if self.showast: print('%d %s --> short JUMP_FORWARD' % (offset, op_name))
+                        op_name = 'JUMP_FORWARD'
+                        oparg = 0
+                        pattr = repr(offset + 3 + oparg)
+                    else:
+                        #0 JUMP_ABSOLUTE ---^
+                        if self.showast: print('%d %s --> JUMP_BACK' % (offset, op_name))
+                        op_name = 'JUMP_BACK'
+                elif offset in self.JA_to_RV:
+                    #0 COMPARE_OP
+                    #1 JUMP_ABSOLUTE/FORWARD --> RETURN_VEALUE
+                    if self.showast: print('%d %s --> RETURN_VALUE' % (offset, op_name))
+                    op_name = 'RETURN_VALUE'
+                    oparg = None; pattr = None
+
+            elif op == opc.LOAD_GLOBAL:
+                if offset in self.load_asserts:
+                    if self.showast: print('%d %s --> LOAD_ASSERT' % (offset, op_name))
+                    op_name = 'LOAD_ASSERT'
+            elif op == opc.RETURN_VALUE:
+                if offset in self.return_end_ifs:
+                    if self.showast: print('%d %s --> RETURN_END_IF' % (offset, op_name))
+                    op_name = 'RETURN_END_IF'
+                elif offset in self.return_end_ifs_rep_to_JF:
+                    if self.showast: print('%d %s --> JUMP_FORWARD' % (offset, op_name))
+                    op_name = 'JUMP_FORWARD'
+                    pattr = self.JF_links[offset]
+
+            if offset in self.linestartoffsets:
+                linestart = self.linestartoffsets[offset]
+            else:
+                linestart = None
+
+            if offset not in replace:
+                tokens.append(Token(op_name, oparg, pattr, offset, linestart))
+            else:
+                tokens.append(Token(replace[offset], oparg, pattr, offset, linestart))
+
+            if offset in self.add_additional_PB:
+                if self.showast: print('%d %s + POP_BLOCK' % (offset, op_name))
+                tokens.append(Token('POP_BLOCK', None, None, offset="%s_1" % offset))
+        return tokens, customize
+
+    def rename_op(self, offset, op_name, oparg, cf):
+        """
+        The token name for the instruction at offset, which takes oparg,
+        before the renames all versions share. A scanner whose
+        restructure() rewrote an instruction names it here, and may add
+        to the jump targets cf.
+        """
+        return op_name
+
+    def backward_jump_is_continue(self, offset, target):
+        """
+        Whether the JUMP_ABSOLUTE at offset to target jumps back, and so
+        is a CONTINUE or JUMP_BACK rather than a forward jump
+        """
+        return target <= offset
+
+    def next_except_jump(self, start):
+        '''
+        Return the next jump that was generated by an except SomeException:
+        construct in a try...except...else clause or None if not found.
+        '''
+        opc = self.opc
+
+        if self.code[start] == opc.DUP_TOP:
+            except_match = self.first_instr(start, len(self.code), opc.PJIF)
+            if except_match:
+                jmp = self.prev[self.get_target(except_match)]
+                self.ignore_if.add(except_match)
+                self.not_continue.add(jmp)
+                return jmp
+
+        count_END_FINALLY = 0
+        count_SETUP_ = 0
+        for i in self.op_range(start, len(self.code)):
+            op = self.code[i]
+            if op == opc.END_FINALLY:
+                if count_END_FINALLY == count_SETUP_:
+                    if self.code[self.prev[i]] == opc.NOP:
+                        i = self.prev[i]
+                    assert self.code[self.prev[i]] in (opc.JA, opc.JF, opc.RETURN_VALUE)
+                    self.not_continue.add(self.prev[i])
+                    return self.prev[i]
+                count_END_FINALLY += 1
+            elif op in self.block_setup_ops:
+                count_SETUP_ += 1
+
+    def setup_code(self, co):
+        """
+        Creates Python-independent bytecode structure (byte array) in
+        self.code, lets restructure() adjust it and then indexes its
+        instructions (see build_instr_index).
+        The size of self.code is returned
+        """
+        opc = self.opc
+        self.code = array('B', co.co_code)
+
+        n = -1
+        for i in self.op_range(0, len(self.code)):
+            if self.code[i] in (opc.RETURN_VALUE, opc.END_FINALLY):
+                n = i + 1
+                pass
+            pass
+        assert n > -1, "Didn't find RETURN_VALUE or END_FINALLY FINALLY"
+        self.code = array('B', co.co_code[:n])
+        # restructure() may rewrite the code, so it isn't indexed yet
+        self.insts = None
+        # linestarts is a list of (offset, line number)
+        self.linestarts = list(dis.findlinestarts(co))
+        self.restructure()
+
+        n = len(self.code)
+        self.build_instr_index(n)
+        return n
+
+    def restructure(self):
+        """
+        Adjusts self.code and self.linestarts before they are indexed.
+        Nothing needs to change for 2.7 bytecode.
+        """
+        pass
+
+    def build_prev_op(self, n):
+        HAVE_ARGUMENT = self.opc.HAVE_ARGUMENT
+        self.prev = array('i', [0])
+        # mapping addresses of instruction & argument
+        for i in self.op_range(0, n):
+            op = self.code[i]
+            self.prev.append(i)
+            if op >= HAVE_ARGUMENT:
+                self.prev.append(i)
+                self.prev.append(i)
+                pass
+            pass
+
+    def build_lines_data(self, co, n):
+        """
+        Initializes self.lines and self.linesstartoffsets
+        """
+        self.lines = lines = scan.LineTable()
+
+        # linestarts is a tuple of (offset, line number).
+        # Turn that in a has that we can index
+        linestarts = self.linestarts
+        self.linestartoffsets = {}
+        for offset, lineno in linestarts:
+            self.linestartoffsets[offset] = lineno
+
+        by_line_no = self.lines_by_line_no
+        (prev_start_byte, prev_line_no) = linestarts[0]
+        for (start_byte, line_no) in linestarts[1:]:
+            lines.extend(start_byte, prev_line_no, start_byte)
+            if by_line_no:
+                prev_line_no = line_no
+            else:
+                prev_line_no = start_byte
+        lines.extend(n, prev_line_no, n)
+        return
+
+    def build_stmt_indices(self):
+        code = self.code
+        start = 0
+        end = len(code)
+
+        opc = self.opc
+        JA = opc.JA
+        opname = opc.opname
+        stmt_opcodes = self.stmt_opcodes
+        stmt_opcode_seqs = self.stmt_opcode_seqs
+        designator_ops = self.designator_ops
+
+        prelim = self.all_instr(start, end, stmt_opcodes)
+
+        self.stmts_full = set(prelim)
+        stmts = self.stmts = set(prelim)
+        pass_stmts = set()
+        for i in self.sequence_ends(start, end, stmt_opcode_seqs):
+            stmts.add(i)
+            pass_stmts.add(i)
+
+        if pass_stmts:
+            stmt_list = list(stmts)
+            stmt_list.sort()
+        else:
+            stmt_list = prelim
+        last_stmt = -1
+        # next_stmt[offset] is the first statement after offset, or end
+        slist = self.next_stmt = array('i', [end]) * end
+
+        if self.showast:
+            print('\n--- Build stmts list: ---\n')
+
+        i = 0
+        for s in stmt_list:
+            if code[s] == JA and s not in pass_stmts:
+                #JUMP_ABSOLUTE (s)
+                target = self.get_target(s)
+                if target > s or self.lines[last_stmt].l_no == self.lines[s].l_no:
+                    #...                             0 last_stmt...
+                    #JUMP_ABSOLUTE (s)  ---+  or       JUMP_ABSOLUTE (s)
+                    #target...         <---+
+                    stmts.remove(s)
+                    if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
+                    continue
+                j = self.prev[s]
+                while code[j] == JA:
+                    j = self.prev[j]
+                if code[j] == opc.LIST_APPEND: # list comprehension
+                    stmts.remove(s)
+                    if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
+                    continue
+            elif code[s] == opc.POP_TOP and code[self.prev[s]] == opc.ROT_TWO:
+                stmts.remove(s)
+                if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
+                continue
+            elif code[s] in designator_ops:
+                j = self.prev[s]
+                while code[j] in designator_ops:
+                    j = self.prev[j]
+                if code[j] == opc.FOR_ITER:
+                    stmts.remove(s)
+                    if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
+                    continue
+            if self.showast: print('%s %s' % (s, opname[code[s]]))
+            last_stmt = s
+            slist[i:s] = array('i', [s]) * (s-i)
+            i = s
+
+    def stmt_breaks(self):
+        """
+        Offsets where the code disassembled last can be cut into runs of
+        whole statements that parse on their own: line starts right
+        after a statement that no jump crosses, in either direction.
+        """
+        n = len(self.code)
+
+        # Offsets lo < o <= hi are inside a jump between lo and hi. Jumps
+        # that detect_structure redirected count with both targets; -1
+        # marks those it dropped.
+        spans = []
+        for jumps in (self.jumps, self.fixed_jumps):
+            for i, target in jumps.items():
+                if target >= 0:
+                    spans.append((min(i, target), max(i, target)))
+        spans.sort()
+
+        breaks = []
+        stmts = self.stmts
+        prev = self.prev
+        j, covered = 0, -1
+        for offset in sorted(self.linestartoffsets):
+            if offset == 0 or offset >= n or prev[offset] not in stmts:
+                continue
+            while j < len(spans) and spans[j][0] < offset:
+                covered = max(covered, spans[j][1])
+                j += 1
+            if covered < offset:
+                breaks.append(offset)
+        return breaks
@@ -11,234 +11,61 @@ other versions of Python. Also, we save token information for later
 use in deparsing.
 """
 
-from collections import namedtuple
-from array import array
-
 from uncompyle6.opcodes.opcode_26 import *
-import dis
 import uncompyle6.scanner as scan
+from uncompyle6.scanners.scanner2 import Scanner2
+
+class Scanner26(Scanner2):
+    # Opcode classes used to find statement boundaries. They are fixed
+    # per version, so they are built once with the class.
+    stmt_opcodes = frozenset([
+        SETUP_LOOP, BREAK_LOOP, CONTINUE_LOOP,
+        SETUP_FINALLY, END_FINALLY, SETUP_EXCEPT,
+        POP_BLOCK, STORE_FAST, DELETE_FAST, STORE_DEREF,
+        STORE_GLOBAL, DELETE_GLOBAL, STORE_NAME, DELETE_NAME,
+        STORE_ATTR, DELETE_ATTR, STORE_SUBSCR, DELETE_SUBSCR,
+        RETURN_VALUE, RAISE_VARARGS, POP_TOP,
+        PRINT_EXPR, PRINT_ITEM, PRINT_NEWLINE, PRINT_ITEM_TO, PRINT_NEWLINE_TO,
+        JUMP_ABSOLUTE, EXEC_STMT,
+    ])
+
+    stmt_opcode_seqs = ((PJIF, JF), (PJIF, JA), (PJIT, JF), (PJIT, JA))
+
+    designator_ops = frozenset([
+        STORE_FAST, STORE_NAME, STORE_GLOBAL, STORE_DEREF, STORE_ATTR,
+        STORE_SLICE_0, STORE_SLICE_1, STORE_SLICE_2, STORE_SLICE_3,
+        STORE_SUBSCR, UNPACK_SEQUENCE, JA
+    ])
+
+    block_setup_ops = frozenset([SETUP_EXCEPT, SETUP_FINALLY])
+
+    # 2.6 has always numbered lines by their line number
+    lines_by_line_no = True
 
-class Scanner26(scan.Scanner):
     def __init__(self):
-        scan.Scanner.__init__(self, 2.6)
-        self.showast = False
-
-    def disassemble(self, co, classname=None, code_objects={}, showast=False):
+        Scanner2.__init__(self, 2.6)
+
+    def rename_op(self, offset, op_name, oparg, cf):
+        """
+        Names the jumps restructBytecode made out of with statements
+        SETUP_WITH, as 2.7 has it
+        """
+        if offset in self.toChange:
+            if self.code[offset] == JA and self.code[oparg] == WITH_CLEANUP:
+                op_name = 'SETUP_WITH'
+                cf.setdefault(oparg, []).append(offset)
+        return op_name
+
+    def backward_jump_is_continue(self, offset, target):
+        return target < offset
+
+    def restructure(self):
         '''
-        Disassemble a code object, returning a list of 'Token'.
-
-        The main part of this procedure is modelled after
-        dis.disassemble().
+        Converts the bytecode to match 2.7's (see restructBytecode)
         '''
-
-        # import dis; dis.disassemble(co) # DEBUG
-
-        # Container for tokens
-        tokens = []
-
-        customize = {}
-        Token = self.Token # shortcut
-        self.code = array('B', co.co_code)
-        for i in self.op_range(0, len(self.code)):
-            if self.code[i] in (RETURN_VALUE, END_FINALLY):
-                n = i + 1
-        self.code = array('B', co.co_code[:n])
-        # linestarts contains block code adresses (addr,block)
-        self.linestarts = list(dis.findlinestarts(co))
-        self.prev = [0]
-        # class and names
-        if classname:
-            classname = '_' + classname.lstrip('_') + '__'
-
-            def unmangle(name):
-                if name.startswith(classname) and name[-2:] != '__':
-                    return name[len(classname) - 2:]
-                return name
-
-            free = [ unmangle(name) for name in (co.co_cellvars + co.co_freevars) ]
-            names = [ unmangle(name) for name in co.co_names ]
-            varnames = [ unmangle(name) for name in co.co_varnames ]
-        else:
-            free = co.co_cellvars + co.co_freevars
-            names = co.co_names
-            varnames = co.co_varnames
-        self.names = names
-
         # list of instruction to remove/add or change to match with bytecode 2.7
         self.toChange = []
         self.restructBytecode()
-        codelen = len(self.code)
-        # mapping adresses of prev instru
-        for i in self.op_range(0, codelen):
-            op = self.code[i]
-            self.prev.append(i)
-            if self.op_hasArgument(op):
-                self.prev.append(i)
-                self.prev.append(i)
-        j = 0
-        linestarts = self.linestarts
-        self.lines = []
-        linetuple = namedtuple('linetuple', ['l_no', 'next'])
-
-        # linestarts is a tuple of (offset, line number).
-        # Turn that in a has that we can index
-        linestartoffsets = {}
-        for offset, lineno in linestarts:
-            linestartoffsets[offset] = lineno
-
-        (prev_start_byte, prev_line_no) = linestarts[0]
-        for (start_byte, line_no) in linestarts[1:]:
-            while j < start_byte:
-                self.lines.append(linetuple(prev_line_no, start_byte))
-                j += 1
-            prev_line_no = line_no
-        while j < codelen:
-            self.lines.append(linetuple(prev_line_no, codelen))
-            j+=1
-        # self.lines contains (block,addrLastInstr)
-
-        self.load_asserts = set()
-        for i in self.op_range(0, codelen):
-            if self.code[i] == PJIT and self.code[i+3] == LOAD_GLOBAL:
-                if names[self.get_argument(i+3)] == 'AssertionError':
-                    self.load_asserts.add(i+3)
-
-        cf = self.find_jump_targets(self.code)
-        # contains (code, [addrRefToCode])
-
-        last_stmt = self.next_stmt[0]
-        i = self.next_stmt[last_stmt]
-        replace = {}
-        while i < codelen-1:
-            if self.lines[last_stmt].next > i:
-                if self.code[last_stmt] == PRINT_ITEM:
-                    if self.code[i] == PRINT_ITEM:
-                        replace[i] = 'PRINT_ITEM_CONT'
-                    elif self.code[i] == PRINT_NEWLINE:
-                        replace[i] = 'PRINT_NEWLINE_CONT'
-            last_stmt = i
-            i = self.next_stmt[i]
-
-        imports = self.all_instr(0, codelen, (IMPORT_NAME, IMPORT_FROM, IMPORT_STAR))
-        if len(imports) > 1:
-            last_import = imports[0]
-            for i in imports[1:]:
-                if self.lines[last_import].next > i:
-                    if self.code[last_import] == IMPORT_NAME == self.code[i]:
-                        replace[i] = 'IMPORT_NAME_CONT'
-                last_import = i
-
-        extended_arg = 0
-        for offset in self.op_range(0, codelen):
-            op = self.code[offset]
-            op_name = self.opname[op]
-            oparg = None; pattr = None
-
-            if offset in cf:
-                k = 0
-                for j in cf[offset]:
-                    tokens.append(Token('COME_FROM', None, repr(j),
-                                    offset="%s_%d" % (offset, k) ))
-                    k += 1
-            if self.op_hasArgument(op):
-                oparg = self.get_argument(offset) + extended_arg
-                extended_arg = 0
-                if op == EXTENDED_ARG:
-                    raise NotImplementedError
-                    extended_arg = oparg * scan.L65536
-                    continue
-                if op in hasconst:
-                    const = co.co_consts[oparg]
-                    # We can't use inspect.iscode() because we may be
-                    # using a different version of Python than the
-                    # one that this was byte-compiled on. So the code
-                    # types may mismatch.
-                    if hasattr(const, 'co_name'):
-                        oparg = const
-                        if const.co_name == '<lambda>':
-                            assert op_name == 'LOAD_CONST'
-                            op_name = 'LOAD_LAMBDA'
-                        elif const.co_name == '<genexpr>':
-                            op_name = 'LOAD_GENEXPR'
-                        elif const.co_name == '<dictcomp>':
-                            op_name = 'LOAD_DICTCOMP'
-                        elif const.co_name == '<setcomp>':
-                            op_name = 'LOAD_SETCOMP'
-                        # verify uses 'pattr' for comparison, since 'attr'
-                        # now holds Code(const) and thus can not be used
-                        # for comparison (todo: think about changing this)
-                        # pattr = 'code_object @ 0x%x %s->%s' %\
-                        # (id(const), const.co_filename, const.co_name)
-                        pattr = '<code_object ' + const.co_name + '>'
-                    else:
-                        pattr = const
-                elif op in hasname:
-                    pattr = names[oparg]
-                elif op in hasjrel:
-                    pattr = repr(offset + 3 + oparg)
-                elif op in hasjabs:
-                    pattr = repr(oparg)
-                elif op in haslocal:
-                    pattr = varnames[oparg]
-                elif op in hascompare:
-                    try:
-                        pattr = cmp_op[oparg]
-                    except:
-                        from trepan.api import debug; debug()
-                elif op in hasfree:
-                    pattr = free[oparg]
-            if offset in self.toChange:
-                if self.code[offset] == JA and self.code[oparg] == WITH_CLEANUP:
-                    op_name = 'SETUP_WITH'
-                    cf[oparg] = cf.get(oparg, []) + [offset]
-            if op in (BUILD_LIST, BUILD_TUPLE, BUILD_SLICE,
-                            UNPACK_SEQUENCE,
-                            MAKE_FUNCTION, CALL_FUNCTION, MAKE_CLOSURE,
-                            CALL_FUNCTION_VAR, CALL_FUNCTION_KW,
-                            CALL_FUNCTION_VAR_KW, DUP_TOPX, RAISE_VARARGS
-                            ):
-                # CE - Hack for >= 2.5
-                #      Now all values loaded via LOAD_CLOSURE are packed into
-                #      a tuple before calling MAKE_CLOSURE.
-                if op == BUILD_TUPLE and \
-                    self.code[self.prev[offset]] == LOAD_CLOSURE:
-                    continue
-                else:
-                    op_name = '%s_%d' % (op_name, oparg)
-                    if op != BUILD_SLICE:
-                        customize[op_name] = oparg
-            elif op == JA:
-                target = self.get_target(offset)
-                if target < offset:
-                    if offset in self.stmts and self.code[offset+3] not in (END_FINALLY, POP_BLOCK) \
-                     and offset not in self.not_continue:
-                        op_name = 'CONTINUE'
-                    else:
-                        op_name = 'JUMP_BACK'
-
-            elif op == LOAD_GLOBAL:
-                if offset in self.load_asserts:
-                    op_name = 'LOAD_ASSERT'
-            elif op == RETURN_VALUE:
-                if offset in self.return_end_ifs:
-                    op_name = 'RETURN_END_IF'
-
-            if offset in linestartoffsets:
-                linestart = linestartoffsets[offset]
-            else:
-                linestart = None
-
-            if offset not in replace:
-                tokens.append(Token(op_name, oparg, pattr, offset, linestart))
-            else:
-                tokens.append(Token(replace[offset], oparg, pattr, offset, linestart))
-                pass
-            pass
-
-        # Debug
-        # for t in tokens:
-        #     print t
-        return tokens, customize
 
     def getOpcodeToDel(self, i):
         '''
@@ -413,24 +240,24 @@ class Scanner26(scan.Scanner):
         if listDel:
             for jmp in self.op_range(0, len(self.code)):
                 op = self.code[jmp]
-                if op in hasjrel+hasjabs:
+                if op in jump_ops:
                     offset = 0
                     jmpTarget = self.get_target(jmp)
                     for toDel in listDel:
                         if toDel < jmpTarget:
-                            if op in hasjabs or jmp < toDel:
+                            if op in jabs_ops or jmp < toDel:
                                 offset-=self.op_size(self.code[toDel])
                     self.restructJump(jmp, jmpTarget+offset)
         if listExp:
             jmp = 0
             while jmp < len(self.code): # we can't use op_range for the moment
                 op = self.code[jmp]
-                if op in hasjrel+hasjabs:
+                if op in jump_ops:
                     offset = 0
                     jmpTarget = self.get_target(jmp)
                     for toExp in listExp:
                         if toExp < jmpTarget:
-                            if op in hasjabs or jmp < toExp:
+                            if op in jabs_ops or jmp < toExp:
                                 offset+=2
                     self.restructJump(jmp, jmpTarget+offset)
                 if self.op_hasArgument(op) and op not in self.opc.hasArgumentExtended:
@@ -509,7 +336,7 @@ class Scanner26(scan.Scanner):
             else: i += 1
 
     def restructJump(self, pos, newTarget):
-        if not (self.code[pos] in hasjabs+hasjrel):
+        if not (self.code[pos] in jump_ops):
             raise 'Can t change this argument. Opcode is not a jump'
         if newTarget > 0xFFFF:
             raise NotImplementedError
@@ -520,114 +347,6 @@ class Scanner26(scan.Scanner):
         self.code[pos+2] = (target >> 8) & 0xFF
         self.code[pos+1] = target & 0xFF
 
-    def build_stmt_indices(self):
-        code = self.code
-        start = 0
-        end = len(code)
-
-        stmt_opcodes = set([
-            SETUP_LOOP, BREAK_LOOP, CONTINUE_LOOP,
-            SETUP_FINALLY, END_FINALLY, SETUP_EXCEPT,
-            POP_BLOCK, STORE_FAST, DELETE_FAST, STORE_DEREF,
-            STORE_GLOBAL, DELETE_GLOBAL, STORE_NAME, DELETE_NAME,
-            STORE_ATTR, DELETE_ATTR, STORE_SUBSCR, DELETE_SUBSCR,
-            RETURN_VALUE, RAISE_VARARGS, POP_TOP,
-            PRINT_EXPR, PRINT_ITEM, PRINT_NEWLINE, PRINT_ITEM_TO, PRINT_NEWLINE_TO,
-            JUMP_ABSOLUTE, EXEC_STMT,
-        ])
-
-        stmt_opcode_seqs = [(PJIF, JF), (PJIF, JA), (PJIT, JF), (PJIT, JA)]
-
-        designator_ops = set([
-            STORE_FAST, STORE_NAME, STORE_GLOBAL, STORE_DEREF, STORE_ATTR,
-            STORE_SLICE_0, STORE_SLICE_1, STORE_SLICE_2, STORE_SLICE_3,
-            STORE_SUBSCR, UNPACK_SEQUENCE, JA
-        ])
-
-        prelim = self.all_instr(start, end, stmt_opcodes)
-
-        stmts = self.stmts = set(prelim)
-        pass_stmts = set()
-        for seq in stmt_opcode_seqs:
-            for i in self.op_range(start, end-(len(seq)+1)):
-                match = True
-                for elem in seq:
-                    if elem != code[i]:
-                        match = False
-                        break
-                    i += self.op_size(code[i])
-
-                if match:
-                    i = self.prev[i]
-                    stmts.add(i)
-                    pass_stmts.add(i)
-
-        if pass_stmts:
-            stmt_list = list(stmts)
-            stmt_list.sort()
-        else:
-            stmt_list = prelim
-        last_stmt = -1
-        self.next_stmt = []
-        slist = self.next_stmt = []
-        i = 0
-        for s in stmt_list:
-            if code[s] == JA and s not in pass_stmts:
-                target = self.get_target(s)
-                if target > s or self.lines[last_stmt].l_no == self.lines[s].l_no:
-                    stmts.remove(s)
-                    continue
-                j = self.prev[s]
-                while code[j] == JA:
-                    j = self.prev[j]
-                if code[j] == LIST_APPEND: # list comprehension
-                    stmts.remove(s)
-                    continue
-            elif code[s] == POP_TOP and code[self.prev[s]] == ROT_TWO:
-                stmts.remove(s)
-                continue
-            elif code[s] in designator_ops:
-                j = self.prev[s]
-                while code[j] in designator_ops:
-                    j = self.prev[j]
-                if code[j] == FOR_ITER:
-                    stmts.remove(s)
-                    continue
-            last_stmt = s
-            slist += [s] * (s-i)
-            i = s
-        slist += [end] * (end-len(slist))
-
-    def next_except_jump(self, start):
-        '''
-        Return the next jump that was generated by an except SomeException:
-        construct in a try...except...else clause or None if not found.
-        '''
-
-        if self.code[start] == DUP_TOP:
-            except_match = self.first_instr(start, len(self.code), (PJIF))
-            if except_match:
-                jmp = self.prev[self.get_target(except_match)]
-                self.ignore_if.add(except_match)
-                self.not_continue.add(jmp)
-                return jmp
-
-        count_END_FINALLY = 0
-        count_SETUP_ = 0
-        for i in self.op_range(start, len(self.code)):
-            op = self.code[i]
-            if op == END_FINALLY:
-                if count_END_FINALLY == count_SETUP_:
-                    if self.code[self.prev[i]] == NOP:
-                        i = self.prev[i]
-                    assert self.code[self.prev[i]] in (JA, JF, RETURN_VALUE)
-                    self.not_continue.add(self.prev[i])
-                    return self.prev[i]
-                count_END_FINALLY += 1
-            elif op in (SETUP_EXCEPT, SETUP_FINALLY):
-                count_SETUP_ += 1
-        # return self.lines[start].next
-
     def detect_structure(self, pos, op=None):
         '''
         Detect type of block structures and their boundaries to fix optimizied jumps
@@ -642,16 +361,9 @@ class Scanner26(scan.Scanner):
             op = code[pos]
 
         # Detect parent structure
-        parent = self.structs[0]
+        parent = self.structs.parent(pos)
         start  = parent['start']
         end    = parent['end']
-        for s in self.structs:
-            _start = s['start']
-            _end   = s['end']
-            if (_start <= pos < _end) and (_start >= start and _end <= end):
-                start  = _start
-                end    = _end
-                parent = s
 
         if op == SETUP_LOOP:
             start = pos+3
@@ -702,7 +414,7 @@ class Scanner26(scan.Scanner):
                     test = self.prev[next_line_byte]
                     if test == pos:
                         loop_type = 'while 1'
-                    elif self.code[test] in hasjabs+hasjrel:
+                    elif self.code[test] in jump_ops:
                         self.ignore_if.add(test)
                         test_target = self.get_target(test)
                         if test_target > (jump_back+3):
@@ -875,7 +587,7 @@ class Scanner26(scan.Scanner):
                                        'end':   rtarget})
                 self.return_end_ifs.add(pre[rtarget])
 
-    def find_jump_targets(self, code):
+    def find_jump_targets(self):
         '''
         Detect all offsets in a byte code which are jump targets.
 
@@ -885,10 +597,11 @@ class Scanner26(scan.Scanner):
         for each target the number of jumps are counted.
         '''
 
+        code = self.code
         n = len(code)
-        self.structs = [{'type':  'root',
-                           'start': 0,
-                           'end':   n-1}]
+        self.structs = scan.Structs({'type':  'root',
+                                       'start': 0,
+                                       'end':   n-1})
         self.loops = []  # All loop entry points
         self.fixed_jumps = {} # Map fixed jumps to their real destination
         self.ignore_if = set()
@@ -907,17 +620,23 @@ class Scanner26(scan.Scanner):
                 label = self.fixed_jumps.get(i)
                 oparg = self.get_argument(i)
                 if label is None:
-                    if op in hasjrel and op != FOR_ITER:
+                    if op in jrel_ops and op != FOR_ITER:
                         label = i + 3 + oparg
                     # elif op in hasjabs:
                     #     if op in (JUMP_IF_FALSE, JUMP_IF_TRUE):
                     #         if (oparg > i):
                     #             label = oparg
                 if label is not None and label != -1:
-                    targets[label] = targets.get(label, []) + [i]
+                    if label in targets:
+                        targets[label].append(i)
+                    else:
+                        targets[label] = [i]
             elif op == END_FINALLY and i in self.fixed_jumps:
                 label = self.fixed_jumps[i]
-                targets[label] = targets.get(label, []) + [i]
+                if label in targets:
+                    targets[label].append(i)
+                else:
+                    targets[label] = [i]
         return targets
 
 if __name__ == "__main__":
@@ -13,216 +13,42 @@ for later use in deparsing.
 
 from __future__ import print_function
 
-import dis, inspect
-from collections import namedtuple
-from array import array
+import inspect
 
-from uncompyle6.code import iscode
 from uncompyle6.opcodes.opcode_27 import * # NOQA
 import uncompyle6.scanner as scan
+from uncompyle6.scanners.scanner2 import Scanner2
+
+class Scanner27(Scanner2):
+    # Opcode classes used to find statement boundaries. They are fixed
+    # per version, so they are built once with the class.
+    stmt_opcodes = frozenset([
+        SETUP_LOOP, BREAK_LOOP, CONTINUE_LOOP,
+        SETUP_FINALLY, END_FINALLY, SETUP_EXCEPT, SETUP_WITH,
+        POP_BLOCK, STORE_FAST, DELETE_FAST, STORE_DEREF,
+        STORE_GLOBAL, DELETE_GLOBAL, STORE_NAME, DELETE_NAME,
+        STORE_ATTR, DELETE_ATTR, STORE_SUBSCR, DELETE_SUBSCR,
+        RETURN_VALUE, RAISE_VARARGS, POP_TOP,
+        PRINT_EXPR, PRINT_ITEM, PRINT_NEWLINE, PRINT_ITEM_TO, PRINT_NEWLINE_TO,
+        STORE_SLICE_0, STORE_SLICE_1, STORE_SLICE_2, STORE_SLICE_3,
+        DELETE_SLICE_0, DELETE_SLICE_1, DELETE_SLICE_2, DELETE_SLICE_3,
+        JUMP_ABSOLUTE, EXEC_STMT,
+    ])
+
+    stmt_opcode_seqs = ((PJIF, JF), (PJIF, JA), (PJIT, JF), (PJIT, JA))
+
+    designator_ops = frozenset([
+        STORE_FAST, STORE_NAME, STORE_GLOBAL, STORE_DEREF, STORE_ATTR,
+        STORE_SLICE_0, STORE_SLICE_1, STORE_SLICE_2, STORE_SLICE_3,
+        STORE_SUBSCR, UNPACK_SEQUENCE, JA
+    ])
+
+    block_setup_ops = frozenset([SETUP_EXCEPT, SETUP_WITH, SETUP_FINALLY])
+
+    extra_build_ops = (BUILD_SET,)
 
-class Scanner27(scan.Scanner):
     def __init__(self):
-        scan.Scanner.__init__(self, 2.7)
-        self.showast = False
-
-    def disassemble(self, co, classname=None, code_objects={}, showast=False):
-        """
-        Disassemble a Python 3 ode object, returning a list of 'Token'.
-        Various tranformations are made to assist the deparsing grammar.
-        For example:
-           -  various types of LOAD_CONST's are categorized in terms of what they load
-           -  COME_FROM instructions are added to assist parsing control structures
-           -  MAKE_FUNCTION and FUNCTION_CALLS append the number of positional aruments
-        The main part of this procedure is modelled after
-        dis.disassemble().
-        """
-        self.showast = showast
-        # import dis; dis.disassemble(co) # DEBUG
-
-        # Container for tokens
-        tokens = []
-
-        customize = {}
-        Token = self.Token # shortcut
-
-        n = self.setup_code(co)
-        self.build_lines_data(co, n)
-        self.build_prev_op(n)
-
-        # self.lines contains (block,addrLastInstr)
-        if classname:
-            classname = '_' + classname.lstrip('_') + '__'
-
-            def unmangle(name):
-                if name.startswith(classname) and name[-2:] != '__':
-                    return name[len(classname) - 2:]
-                return name
-
-            free = [ unmangle(name) for name in (co.co_cellvars + co.co_freevars) ]
-            names = [ unmangle(name) for name in co.co_names ]
-            varnames = [ unmangle(name) for name in co.co_varnames ]
-        else:
-            free = co.co_cellvars + co.co_freevars
-            names = co.co_names
-            varnames = co.co_varnames
-
-        self.load_asserts = set()
-        for i in self.op_range(0, n):
-            if self.code[i] == PJIT and self.code[i+3] == LOAD_GLOBAL:
-                if names[self.get_argument(i+3)] == 'AssertionError':
-                    self.load_asserts.add(i+3)
-
-        cf = self.find_jump_targets()
-        # contains (code, [addrRefToCode])
-        last_stmt = self.next_stmt[0]
-        i = self.next_stmt[last_stmt]
-        replace = {}
-        while i < n-1:
-            if self.lines[last_stmt].next > i:
-                if self.code[last_stmt] == PRINT_ITEM:
-                    if self.code[i] == PRINT_ITEM:
-                        replace[i] = 'PRINT_ITEM_CONT'
-                    elif self.code[i] == PRINT_NEWLINE:
-                        replace[i] = 'PRINT_NEWLINE_CONT'
-            last_stmt = i
-            i = self.next_stmt[i]
-
-        imports = self.all_instr(0, n, (IMPORT_NAME, IMPORT_FROM, IMPORT_STAR))
-        if len(imports) > 1:
-            last_import = imports[0]
-            for i in imports[1:]:
-                if self.lines[last_import].next > i:
-                    if self.code[last_import] == IMPORT_NAME == self.code[i]:
-                        replace[i] = 'IMPORT_NAME_CONT'
-                last_import = i
-
-        if self.showast:
-            print('\n--- Original code modification during disassembly: ---\n')
-
-        extended_arg = 0
-        for offset in self.op_range(0, n):
-            if offset in cf:
-                k = 0
-                for j in cf[offset]:
-                    tokens.append(Token('COME_FROM', None, repr(j),
-                                    offset="%s_%d" % (offset, k)))
-                    k += 1
-
-            op = self.code[offset]
-            op_name = opname[op]
-
-            oparg = None; pattr = None
-            if op >= HAVE_ARGUMENT:
-                oparg = self.get_argument(offset) + extended_arg
-                extended_arg = 0
-                if op == EXTENDED_ARG:
-                    extended_arg = oparg * scan.L65536
-                    continue
-                if op in hasconst:
-                    const = co.co_consts[oparg]
-                    if iscode(const):
-                        oparg = const
-                        if const.co_name == '<lambda>':
-                            assert op_name == 'LOAD_CONST'
-                            op_name = 'LOAD_LAMBDA'
-                        elif const.co_name == '<genexpr>':
-                            op_name = 'LOAD_GENEXPR'
-                        elif const.co_name == '<dictcomp>':
-                            op_name = 'LOAD_DICTCOMP'
-                        elif const.co_name == '<setcomp>':
-                            op_name = 'LOAD_SETCOMP'
-                        # verify() uses 'pattr' for comparison, since 'attr'
-                        # now holds Code(const) and thus can not be used
-                        # for comparison (todo: think about changing this)
-                        # pattr = 'code_object @ 0x%x %s->%s' %\
-                        # (id(const), const.co_filename, const.co_name)
-                        pattr = '<code_object ' + const.co_name + '>'
-                    else:
-                        pattr = const
-                elif op in hasname:
-                    pattr = names[oparg]
-                elif op in hasjrel:
-                    pattr = repr(offset + 3 + oparg)
-                elif op in hasjabs:
-                    pattr = repr(oparg)
-                elif op in haslocal:
-                    pattr = varnames[oparg]
-                elif op in hascompare:
-                    pattr = cmp_op[oparg]
-                elif op in hasfree:
-                    pattr = free[oparg]
-
-            if op in (BUILD_LIST, BUILD_TUPLE, BUILD_SET, BUILD_SLICE,
-                            UNPACK_SEQUENCE,
-                            MAKE_FUNCTION, CALL_FUNCTION, MAKE_CLOSURE,
-                            CALL_FUNCTION_VAR, CALL_FUNCTION_KW,
-                            CALL_FUNCTION_VAR_KW, DUP_TOPX, RAISE_VARARGS
-                            ):
-                # CE - Hack for >= 2.5
-                #      Now all values loaded via LOAD_CLOSURE are packed into
-                #      a tuple before calling MAKE_CLOSURE.
-                if op == BUILD_TUPLE and \
-                    self.code[self.prev[offset]] == LOAD_CLOSURE:
-                    continue
-                else:
-                    op_name = '%s_%d' % (op_name, oparg)
-                    if op != BUILD_SLICE:
-                        customize[op_name] = oparg
-            elif op == JA:
-                target = self.get_target(offset)
-                if target <= offset:
-                    if (offset in self.stmts and self.code[offset+3] not in (END_FINALLY, POP_BLOCK) \
-                        and offset not in self.not_continue) or offset in self.continue_oneline:
-                        #0 JUMP_ABSOLUTE ---^
-                        #1 NOT END_FINALLY, POP_BLOCK
-                        if self.showast: print('%d %s --> CONTINUE' % (offset, op_name))
-                        op_name = 'CONTINUE'
-                    elif offset in self.JA_to_shortJF:
-                        #0 JUMP_ABSOLUTE --+
-                        #1 XXX          <--+
-                        if self.showast: print('%d %s --> short JUMP_FORWARD' % (offset, op_name))
-                        op_name = 'JUMP_FORWARD'
-                        oparg = 0
-                        pattr = repr(offset + 3 + oparg)
-                    else:
-                        #0 JUMP_ABSOLUTE ---^
-                        if self.showast: print('%d %s --> JUMP_BACK' % (offset, op_name))
-                        op_name = 'JUMP_BACK'
-                elif offset in self.JA_to_RV:
-                    #0 COMPARE_OP
-                    #1 JUMP_ABSOLUTE/FORWARD --> RETURN_VEALUE
-                    if self.showast: print('%d %s --> RETURN_VALUE' % (offset, op_name))
-                    op_name = 'RETURN_VALUE'
-                    oparg = None; pattr = None
-
-            elif op == LOAD_GLOBAL:
-                if offset in self.load_asserts:
-                    if self.showast: print('%d %s --> LOAD_ASSERT' % (offset, op_name))
-                    op_name = 'LOAD_ASSERT'
-            elif op == RETURN_VALUE:
-                if offset in self.return_end_ifs:
-                    if self.showast: print('%d %s --> RETURN_END_IF' % (offset, op_name))
-                    op_name = 'RETURN_END_IF'
-                elif offset in self.return_end_ifs_rep_to_JF:
-                    if self.showast: print('%d %s --> JUMP_FORWARD' % (offset, op_name))
-                    op_name = 'JUMP_FORWARD'
-                    pattr = self.JF_links[offset]
-
-            if offset in self.linestartoffsets:
-                linestart = self.linestartoffsets[offset]
-            else:
-                linestart = None
-
-            if offset not in replace:
-                tokens.append(Token(op_name, oparg, pattr, offset, linestart))
-            else:
-                tokens.append(Token(replace[offset], oparg, pattr, offset, linestart))
-            
-            if offset in self.add_additional_PB:
-                if self.showast: print('%d %s + POP_BLOCK' % (offset, op_name))
-                tokens.append(Token('POP_BLOCK', None, None, offset="%s_1" % offset))
-        return tokens, customize
+        Scanner2.__init__(self, 2.7)
 
     def disassemble_native(self, co, classname=None, code_objects={}):
         """
@@ -267,19 +93,19 @@ class Scanner27(scan.Scanner):
                 if op == EXTENDED_ARG:
                     extended_arg = oparg * scan.L65536
                     continue
-                if op in hasconst:
+                if op in const_ops:
                     pattr = co.co_consts[oparg]
-                elif op in hasname:
+                elif op in name_ops:
                     pattr = names[oparg]
-                elif op in hasjrel:
+                elif op in jrel_ops:
                     pattr = repr(offset + 3 + oparg)
-                elif op in hasjabs:
+                elif op in jabs_ops:
                     pattr = repr(oparg)
-                elif op in haslocal:
+                elif op in local_ops:
                     pattr = varnames[oparg]
-                elif op in hascompare:
+                elif op in compare_ops:
                     pattr = cmp_op[oparg]
-                elif op in hasfree:
+                elif op in free_ops:
                     pattr = free[oparg]
 
             if offset in self.linestartoffsets:
@@ -291,184 +117,6 @@ class Scanner27(scan.Scanner):
             pass
         return tokens, customize
 
-    def setup_code(self, co):
-        """
-        Creates Python-independent bytecode structure (byte array) in
-        self.code and records previous instruction in self.prev
-        The size of self.code is returned
-        """
-        self.code = array('B', co.co_code)
-
-        n = -1
-        for i in self.op_range(0, len(self.code)):
-            if self.code[i] in (RETURN_VALUE, END_FINALLY):
-                n = i + 1
-                pass
-            pass
-        assert n > -1, "Didn't find RETURN_VALUE or END_FINALLY FINALLY"
-        self.code = array('B', co.co_code[:n])
-
-        return n
-
-    def build_prev_op(self, n):
-        self.prev = [0]
-        # mapping addresses of instruction & argument
-        for i in self.op_range(0, n):
-            op = self.code[i]
-            self.prev.append(i)
-            if op >= HAVE_ARGUMENT:
-                self.prev.append(i)
-                self.prev.append(i)
-                pass
-            pass
-
-    def build_lines_data(self, co, n):
-        """
-        Initializes self.lines and self.linesstartoffsets
-        """
-        self.lines = []
-        linetuple = namedtuple('linetuple', ['l_no', 'next'])
-
-        # linestarts is a tuple of (offset, line number).
-        # Turn that in a has that we can index
-        linestarts = list(dis.findlinestarts(co))
-        self.linestartoffsets = {}
-        for offset, lineno in linestarts:
-            self.linestartoffsets[offset] = lineno
-
-        j = 0
-        (prev_start_byte, prev_line_no) = linestarts[0]
-        for (start_byte, line_no) in linestarts[1:]:
-            while j < start_byte:
-                self.lines.append(linetuple(prev_line_no, start_byte))
-                j += 1
-            prev_line_no = start_byte
-        while j < n:
-            self.lines.append(linetuple(prev_line_no, n))
-            j+=1
-        return
-
-    def build_stmt_indices(self):
-        code = self.code
-        start = 0
-        end = len(code)
-
-        stmt_opcodes = set([
-            SETUP_LOOP, BREAK_LOOP, CONTINUE_LOOP,
-            SETUP_FINALLY, END_FINALLY, SETUP_EXCEPT, SETUP_WITH,
-            POP_BLOCK, STORE_FAST, DELETE_FAST, STORE_DEREF,
-            STORE_GLOBAL, DELETE_GLOBAL, STORE_NAME, DELETE_NAME,
-            STORE_ATTR, DELETE_ATTR, STORE_SUBSCR, DELETE_SUBSCR,
-            RETURN_VALUE, RAISE_VARARGS, POP_TOP,
-            PRINT_EXPR, PRINT_ITEM, PRINT_NEWLINE, PRINT_ITEM_TO, PRINT_NEWLINE_TO,
-            STORE_SLICE_0, STORE_SLICE_1, STORE_SLICE_2, STORE_SLICE_3,
-            DELETE_SLICE_0, DELETE_SLICE_1, DELETE_SLICE_2, DELETE_SLICE_3,
-            JUMP_ABSOLUTE, EXEC_STMT,
-        ])
-
-        stmt_opcode_seqs = [(PJIF, JF), (PJIF, JA), (PJIT, JF), (PJIT, JA)]
-
-        designator_ops = set([
-            STORE_FAST, STORE_NAME, STORE_GLOBAL, STORE_DEREF, STORE_ATTR,
-            STORE_SLICE_0, STORE_SLICE_1, STORE_SLICE_2, STORE_SLICE_3,
-            STORE_SUBSCR, UNPACK_SEQUENCE, JA
-        ])
-
-        prelim = self.all_instr(start, end, stmt_opcodes)
-        
-        self.stmts_full = set(prelim)
-        stmts = self.stmts = set(prelim)
-        pass_stmts = set()
-        for seq in stmt_opcode_seqs:
-            for i in self.op_range(start, end-(len(seq)+1)):
-                match = True
-                for elem in seq:
-                    if elem != code[i]:
-                        match = False
-                        break
-                    i += self.op_size(code[i])
-
-                if match:
-                    i = self.prev[i]
-                    stmts.add(i)
-                    pass_stmts.add(i)
-
-        if pass_stmts:
-            stmt_list = list(stmts)
-            stmt_list.sort()
-        else:
-            stmt_list = prelim
-        last_stmt = -1
-        self.next_stmt = []
-        slist = self.next_stmt = []
-        
-        if self.showast:
-            print('\n--- Build stmts list: ---\n')
-        
-        i = 0 
-        for index, s in enumerate(stmt_list):
-            if code[s] == JA and s not in pass_stmts:
-                #JUMP_ABSOLUTE (s)
-                target = self.get_target(s)
-                if target > s or self.lines[last_stmt].l_no == self.lines[s].l_no:
-                    #...                             0 last_stmt...
-                    #JUMP_ABSOLUTE (s)  ---+  or       JUMP_ABSOLUTE (s)
-                    #target...         <---+
-                    stmts.remove(s)
-                    if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
-                    continue
-                j = self.prev[s]
-                while code[j] == JA:
-                    j = self.prev[j]
-                if code[j] == LIST_APPEND: # list comprehension
-                    stmts.remove(s)
-                    if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
-                    continue
-            elif code[s] == POP_TOP and code[self.prev[s]] == ROT_TWO:
-                stmts.remove(s)
-                if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
-                continue
-            elif code[s] in designator_ops:
-                j = self.prev[s]
-                while code[j] in designator_ops:
-                    j = self.prev[j]
-                if code[j] == FOR_ITER:
-                    stmts.remove(s)
-                    if self.showast: print('%s %s (removed)' % (s, opname[code[s]]))
-                    continue
-            if self.showast: print('%s %s' % (s, opname[code[s]]))
-            last_stmt = s
-            slist += [s] * (s-i)
-            i = s
-        slist += [end] * (end-len(slist))
-
-    def next_except_jump(self, start):
-        '''
-        Return the next jump that was generated by an except SomeException:
-        construct in a try...except...else clause or None if not found.
-        '''
-
-        if self.code[start] == DUP_TOP:
-            except_match = self.first_instr(start, len(self.code), POP_JUMP_IF_FALSE)
-            if except_match:
-                jmp = self.prev[self.get_target(except_match)]
-                self.ignore_if.add(except_match)
-                self.not_continue.add(jmp)
-                return jmp
-
-        count_END_FINALLY = 0
-        count_SETUP_ = 0
-        for i in self.op_range(start, len(self.code)):
-            op = self.code[i]
-            if op == END_FINALLY:
-                if count_END_FINALLY == count_SETUP_:
-                    assert self.code[self.prev[i]] in (JA, JF, RETURN_VALUE)
-                    self.not_continue.add(self.prev[i])
-                    return self.prev[i]
-                count_END_FINALLY += 1
-            elif op in (SETUP_EXCEPT, SETUP_WITH, SETUP_FINALLY):
-                count_SETUP_ += 1
-
     def detect_structure(self, pos, op=None):
         '''
         Detect type of block structures and their boundaries to fix optimized jumps
@@ -485,19 +133,9 @@ class Scanner27(scan.Scanner):
             op = code[pos]
 
         # Detect parent structure
-        parent = self.structs[0]
+        parent = self.structs.parent(pos)
         start  = parent['start']
         end    = parent['end']
-        for s in self.structs:
-            _start = s['start']
-            _end   = s['end']
-            #_start...
-            #pos
-            #_end
-            if (_start <= pos < _end) and (start <= _start and _end <= end):
-                start  = _start
-                end    = _end
-                parent = s
 
         if op == SETUP_LOOP:
             #0 SETUP_LOOP     --+
@@ -678,7 +316,7 @@ class Scanner27(scan.Scanner):
                                 #    test_target             <--+
                                 if self.showast: print('###17_1')
                                 self.add_additional_PB.add(jump_back)
-                        elif code[test] in hasjabs+hasjrel:
+                        elif code[test] in jump_ops:
                             #    POP_JUMP_IF_FALSE/TRUE/JF/JA... (test)
                             #1   (next_line_byte) 
                             if self.showast: print('###18')
@@ -1156,9 +794,9 @@ class Scanner27(scan.Scanner):
         '''
 
         n = len(self.code)
-        self.structs = [{'type':  'root',
-                           'start': 0,
-                           'end':   n-1}]
+        self.structs = scan.Structs({'type':  'root',
+                                       'start': 0,
+                                       'end':   n-1})
         self.loops = []  # All loop entry points
         self.fixed_jumps = {} # Map fixed jumps to their real destination
         self.ignore_if = set()
@@ -1179,6 +817,7 @@ class Scanner27(scan.Scanner):
             print('\n--- Detect structure and jumps targets: ---\n')
 
         targets = {}
+        jumps = self.jumps
         for i in self.op_range(0, n):
             op = self.code[i]
 
@@ -1193,20 +832,25 @@ class Scanner27(scan.Scanner):
                         print(x)
             if op >= HAVE_ARGUMENT:
                 label = self.fixed_jumps.get(i)
-                oparg = self.code[i+1] + self.code[i+2] * 256
                 if label is None:
-                    if op in hasjrel and op != FOR_ITER:
-                        label = i + 3 + oparg
-                    elif op in hasjabs:
+                    if op in jrel_ops and op != FOR_ITER:
+                        label = jumps[i]
+                    elif op in jabs_ops:
                         if op in (JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP):
-                            if (oparg > i):
-                                label = oparg
+                            if (jumps[i] > i):
+                                label = jumps[i]
 
                 if label is not None and label != -1:
-                    targets[label] = targets.get(label, []) + [i]
+                    if label in targets:
+                        targets[label].append(i)
+                    else:
+                        targets[label] = [i]
             elif op == END_FINALLY and i in self.fixed_jumps:
                 label = self.fixed_jumps[i]
-                targets[label] = targets.get(label, []) + [i]
+                if label in targets:
+                    targets[label].append(i)
+                else:
+                    targets[label] = [i]
         for x,y in self.JF_links.items():
             if not y in targets:
                 targets[y] = [x]
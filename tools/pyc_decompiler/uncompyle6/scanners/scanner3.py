@@ -26,7 +26,6 @@ from __future__ import print_function
 import dis
 import uncompyle6.scanners.dis3 as dis3
 
-from collections import namedtuple
 from array import array
 
 from uncompyle6.code import iscode
@@ -45,6 +44,26 @@ import uncompyle6.scanner as scan
 
 class Scanner3(scan.Scanner):
 
+    # Opcode classes used to find statement boundaries. They are fixed
+    # per version, so they are built once with the class.
+    statement_opcodes = frozenset([
+        SETUP_LOOP, BREAK_LOOP, CONTINUE_LOOP,
+        SETUP_FINALLY, END_FINALLY, SETUP_EXCEPT, SETUP_WITH,
+        POP_BLOCK, STORE_FAST, DELETE_FAST, STORE_DEREF,
+        STORE_GLOBAL, DELETE_GLOBAL, STORE_NAME, DELETE_NAME,
+        STORE_ATTR, DELETE_ATTR, STORE_SUBSCR, DELETE_SUBSCR,
+        RETURN_VALUE, RAISE_VARARGS, POP_TOP, PRINT_EXPR,
+        JUMP_ABSOLUTE
+    ])
+
+    statement_opcode_sequences = ((POP_JUMP_IF_FALSE, JUMP_FORWARD), (POP_JUMP_IF_FALSE, JUMP_ABSOLUTE),
+                                  (POP_JUMP_IF_TRUE, JUMP_FORWARD), (POP_JUMP_IF_TRUE, JUMP_ABSOLUTE))
+
+    designator_ops = frozenset([
+        STORE_FAST, STORE_NAME, STORE_GLOBAL, STORE_DEREF, STORE_ATTR,
+        STORE_SUBSCR, UNPACK_SEQUENCE, JUMP_ABSOLUTE
+    ])
+
     def __init__(self, version):
         if PYTHON3:
             super().__init__(version)
@@ -69,6 +88,7 @@ class Scanner3(scan.Scanner):
         tokens = []
 
         self.code = array('B', co.co_code)
+        self.build_instr_index(len(self.code))
         self.build_lines_data(co)
         self.build_prev_op()
 
@@ -93,7 +113,7 @@ class Scanner3(scan.Scanner):
         # Format: {target offset: [jump offsets]}
         jump_targets = self.find_jump_targets()
 
-        for inst in bytecode:
+        for inst in bs:
             if inst.offset in jump_targets:
                 jump_idx = 0
                 for jump_offset in jump_targets[inst.offset]:
@@ -103,8 +123,12 @@ class Scanner3(scan.Scanner):
                     pass
                 pass
 
-            pattr =  inst.argrepr
             opname = inst.opname
+            if opname == 'LOAD_CONST':
+                # pattr is set below; the repr of a big constant is costly
+                pattr = None
+            else:
+                pattr = inst.argrepr
 
             if opname in ['LOAD_CONST']:
                 const = inst.argval
@@ -191,6 +215,7 @@ class Scanner3(scan.Scanner):
         tokens = []
 
         self.code = array('B', co.co_code)
+        self.insts = None
 
         bytecode = dis3.Bytecode(co, self.opname)
 
@@ -222,6 +247,7 @@ class Scanner3(scan.Scanner):
         customize = {}
         self.code = code = array('B', co.co_code)
         codelen = len(code)
+        self.build_instr_index(codelen)
         self.build_lines_data(co)
         self.build_prev_op()
         self.code_objects = code_objects
@@ -298,7 +324,7 @@ class Scanner3(scan.Scanner):
                 if op == op3.EXTENDED_ARG:
                     extended_arg = oparg * scan.L65536
                     continue
-                if op in op3.hasconst:
+                if op in op3.const_ops:
                     const = co.co_consts[oparg]
                     if not PYTHON3 and isinstance(const, str):
                         if const in code_objects:
@@ -324,17 +350,17 @@ class Scanner3(scan.Scanner):
                         pattr = '<code_object ' + const.co_name + '>'
                     else:
                         pattr = const
-                elif op in op3.hasname:
+                elif op in op3.name_ops:
                     pattr = names[oparg]
-                elif op in op3.hasjrel:
+                elif op in op3.jrel_ops:
                     pattr = repr(offset + 3 + oparg)
-                elif op in op3.hasjabs:
+                elif op in op3.jabs_ops:
                     pattr = repr(oparg)
-                elif op in op3.haslocal:
+                elif op in op3.local_ops:
                     pattr = varnames[oparg]
-                elif op in op3.hascompare:
+                elif op in op3.compare_ops:
                     pattr = op3.cmp_op[oparg]
-                elif op in op3.hasfree:
+                elif op in op3.free_ops:
                     pattr = free[oparg]
 
             if op_name == 'MAKE_FUNCTION':
@@ -427,24 +453,18 @@ class Scanner3(scan.Scanner):
         self.linestart_offsets = set(a for (a, _) in linestarts)
         # 'List-map' which shows line number of current op and offset of
         # first op on following line, given offset of op as index
-        self.lines = lines = []
-        LineTuple = namedtuple('LineTuple', ['l_no', 'next'])
+        self.lines = lines = scan.LineTable()
         # Iterate through available linestarts, and fill
         # the data for all code offsets encountered until
         # last linestart offset
         _, prev_line_no = linestarts[0]
-        offset = 0
         for start_offset, line_no in linestarts[1:]:
-            while offset < start_offset:
-                lines.append(LineTuple(prev_line_no, start_offset))
-                offset += 1
+            lines.extend(start_offset, prev_line_no, start_offset)
             prev_line_no = line_no
         # Fill remaining offsets with reference to last line number
         # and code length as start offset of following non-existing line
         codelen = len(self.code)
-        while offset < codelen:
-            lines.append(LineTuple(prev_line_no, codelen))
-            offset += 1
+        lines.extend(codelen, prev_line_no, codelen)
 
     def build_prev_op(self):
         """
@@ -453,22 +473,12 @@ class Scanner3(scan.Scanner):
         """
         code = self.code
         codelen = len(code)
-        self.prev_op = [0]
+        self.prev_op = array('i', [0])
         for offset in self.op_range(0, codelen):
             op = code[offset]
             for _ in range(self.op_size(op)):
                 self.prev_op.append(offset)
 
-    def op_size(self, op):
-        """
-        Return size of operator with its arguments
-        for given opcode <op>.
-        """
-        if op < dis.HAVE_ARGUMENT:
-            return 1
-        else:
-            return 3
-
     def find_jump_targets(self):
         """
         Detect all offsets in a byte code which are jump targets.
@@ -480,9 +490,9 @@ class Scanner3(scan.Scanner):
         """
         code = self.code
         n = len(code)
-        self.structs = [{'type':  'root',
-                         'start': 0,
-                         'end':   n-1}]
+        self.structs = scan.Structs({'type':  'root',
+                                     'start': 0,
+                                     'end':   n-1})
 
         # All loop entry points
         self.loops = []
@@ -506,21 +516,26 @@ class Scanner3(scan.Scanner):
 
             if op >= op3.HAVE_ARGUMENT:
                 label = self.fixed_jumps.get(offset)
-                oparg = code[offset+1] + code[offset+2] * 256
 
                 if label is None:
-                    if op in op3.hasjrel and op != FOR_ITER:
-                        label = offset + self.op_size(op) + oparg
-                    elif op in op3.hasjabs:
+                    if op in op3.jrel_ops and op != FOR_ITER:
+                        label = self.jumps[offset]
+                    elif op in op3.jabs_ops:
                         if op in (JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP):
-                            if oparg > offset:
-                                label = oparg
+                            if self.jumps[offset] > offset:
+                                label = self.jumps[offset]
 
                 if label is not None and label != -1:
-                    targets[label] = targets.get(label, []) + [offset]
+                    if label in targets:
+                        targets[label].append(offset)
+                    else:
+                        targets[label] = [offset]
             elif op == END_FINALLY and offset in self.fixed_jumps:
                 label = self.fixed_jumps[offset]
-                targets[label] = targets.get(label, []) + [offset]
+                if label in targets:
+                    targets[label].append(offset)
+                else:
+                    targets[label] = [offset]
         return targets
 
     def build_statement_indices(self):
@@ -528,23 +543,9 @@ class Scanner3(scan.Scanner):
         start = 0
         end = codelen = len(code)
 
-        statement_opcodes = set([
-            SETUP_LOOP, BREAK_LOOP, CONTINUE_LOOP,
-            SETUP_FINALLY, END_FINALLY, SETUP_EXCEPT, SETUP_WITH,
-            POP_BLOCK, STORE_FAST, DELETE_FAST, STORE_DEREF,
-            STORE_GLOBAL, DELETE_GLOBAL, STORE_NAME, DELETE_NAME,
-            STORE_ATTR, DELETE_ATTR, STORE_SUBSCR, DELETE_SUBSCR,
-            RETURN_VALUE, RAISE_VARARGS, POP_TOP, PRINT_EXPR,
-            JUMP_ABSOLUTE
-        ])
-
-        statement_opcode_sequences = [(POP_JUMP_IF_FALSE, JUMP_FORWARD), (POP_JUMP_IF_FALSE, JUMP_ABSOLUTE),
-                                      (POP_JUMP_IF_TRUE, JUMP_FORWARD), (POP_JUMP_IF_TRUE, JUMP_ABSOLUTE)]
-
-        designator_ops = set([
-            STORE_FAST, STORE_NAME, STORE_GLOBAL, STORE_DEREF, STORE_ATTR,
-            STORE_SUBSCR, UNPACK_SEQUENCE, JUMP_ABSOLUTE
-        ])
+        statement_opcodes = self.statement_opcodes
+        statement_opcode_sequences = self.statement_opcode_sequences
+        designator_ops = self.designator_ops
 
         # Compose preliminary list of indices with statements,
         # using plain statement opcodes
@@ -625,9 +626,13 @@ class Scanner3(scan.Scanner):
         """
         Get target offset for op located at given <offset>.
         """
+        if self.insts is not None:
+            target = self.jumps.get(offset)
+            if target is not None:
+                return target
         op = self.code[offset]
         target = self.code[offset+1] + self.code[offset+2] * 256
-        if op in op3.hasjrel:
+        if op in op3.jrel_ops:
             target += offset + 3
         return target
 
@@ -643,19 +648,10 @@ class Scanner3(scan.Scanner):
         op = code[offset]
 
         # Detect parent structure
-        parent = self.structs[0]
+        parent = self.structs.parent(offset)
         start = parent['start']
         end = parent['end']
 
-        # Pick inner-most parent for our offset
-        for struct in self.structs:
-            curent_start = struct['start']
-            curent_end   = struct['end']
-            if (curent_start <= offset < curent_end) and (curent_start >= start and curent_end <= end):
-                start = curent_start
-                end = curent_end
-                parent = struct
-
         if op == SETUP_LOOP:
             start = offset+3
             target = self.get_target(offset)
@@ -702,7 +698,7 @@ class Scanner3(scan.Scanner):
                     test = self.prev_op[next_line_byte]
                     if test == offset:
                         loop_type = 'while 1'
-                    elif self.code[test] in op3.hasjabs+op3.hasjrel:
+                    elif self.code[test] in op3.jump_ops:
                         self.ignore_if.add(test)
                         test_target = self.get_target(test)
                         if test_target > (jump_back+3):
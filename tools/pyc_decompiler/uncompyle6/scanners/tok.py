@@ -8,22 +8,27 @@ from uncompyle6 import PYTHON3
 if PYTHON3:
     intern = sys.intern
 
-class Token:
+class Token(object):
     """
     Class representing a byte-code instruction.
 
     A byte-code token is equivalent to Python 3's dis.instruction or
     the contents of one line as output by dis.dis().
     """
+    # A large module holds hundreds of thousands of these, so no
+    # per-instance dict. 'parent', 'start' and 'finish' are only set by
+    # the fragments walker.
+    __slots__ = ('type', 'kind', 'attr', 'pattr', 'offset', 'linestart',
+                 'parent', 'start', 'finish')
+
     # FIXME: match Python 3.4's terms:
     #    type_ should be opname
     #    linestart = starts_line
     #    attr = argval
     #    pattr = argrepr
     def __init__(self, type_, attr=None, pattr=None, offset=-1, linestart=None):
-        self.type = intern(type_)
-        # Add 'kind' as an alias for 'type' for compatibility
-        self.kind = self.type
+        # 'kind' is an alias for 'type' for compatibility
+        self.type = self.kind = intern(type_)
         self.attr = attr
         self.pattr = pattr
         self.offset = offset
@@ -57,6 +62,12 @@ class Token:
     def __hash__(self):
         return hash(self.type)
 
+    @property
+    def __dict__(self):
+        """The attributes that are set, for the walkers' %{...} escapes"""
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if hasattr(self, name))
+
     def __getitem__(self, i):
         raise IndexError
 
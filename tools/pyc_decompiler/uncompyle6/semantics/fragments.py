@@ -46,8 +46,7 @@ else:
     from StringIO import StringIO
 
 
-from spark_parser import GenericASTTraversal, GenericASTTraversalPruningException, \
-     DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
+from spark_parser import GenericASTTraversal, DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 
 from collections import namedtuple
 NodeInfo = namedtuple("NodeInfo", "node start finish")
@@ -91,6 +90,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.classes = []
         self.pending_newlines = 0
         self.hide_internal = False
+        self.pending_template = None
 
         self.offsets = {}
         self.last_finish = -1
@@ -130,55 +130,27 @@ class FragmentsWalker(pysource.SourceWalker, object):
         node.finish = finish
         self.last_finish = finish
 
-    def preorder(self, node=None):
-
-        if node is None:
-            node = self.ast
-
+    def visit(self, node):
+        """SourceWalker.visit, recording node's text range once walked"""
         start = len(self.f.getvalue())
-
-        try:
-            name = 'n_' + self.typestring(node)
-            if hasattr(self, name):
-                func = getattr(self, name)
-                func(node)
-            else:
-                self.default(node)
-        except GenericASTTraversalPruningException:
-            # All leaf nodes, those with the offset method among others
-            # seems to fit under this exception. If this is not true
-            # we would need to dupllicate the below code before the
-            # return outside of this block
-            self.set_pos_info(node, start, len(self.f.getvalue()))
-            # print self.f.getvalue()[start:]
-            return
-
-        for kid in node:
-            self.preorder(kid)
-
-        name = name + '_exit'
-        if hasattr(self, name):
-            func = getattr(self, name)
-            func(node)
+        for n in pysource.SourceWalker.visit(self, node):
+            yield n
         self.set_pos_info(node, start, len(self.f.getvalue()))
 
-        return
-
     def n_return_stmt(self, node):
         start = len(self.f.getvalue()) + len(self.indent)
         if self.params['isLambda']:
-            self.preorder(node[0])
+            yield node[0]
             if hasattr(node[-1], 'offset'):
                 self.set_pos_info(node[-1], start,
                 len(self.f.getvalue()))
-            self.prune()
         else:
             start = len(self.f.getvalue()) + len(self.indent)
             self.write(self.indent, 'return')
             if self.return_none or node != AST('return_stmt', [AST('ret_expr', [NONE]), Token('RETURN_VALUE')]):
                 self.write(' ')
                 self.last_finish = len(self.f.getvalue())
-                self.preorder(node[0])
+                yield node[0]
                 if hasattr(node[-1], 'offset'):
                     self.set_pos_info(node[-1], start, len(self.f.getvalue()))
                     pass
@@ -190,25 +162,23 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 pass
             self.set_pos_info(node, start, len(self.f.getvalue()))
             self.println()
-            self.prune() # stop recursing
 
     def n_return_if_stmt(self, node):
 
         start = len(self.f.getvalue()) + len(self.indent)
         if self.params['isLambda']:
             node[0].parent = node
-            self.preorder(node[0])
+            yield node[0]
         else:
             start = len(self.f.getvalue()) + len(self.indent)
             self.write(self.indent, 'return')
             if self.return_none or node != AST('return_stmt', [AST('ret_expr', [NONE]), Token('RETURN_END_IF')]):
                 self.write(' ')
-                self.preorder(node[0])
+                yield node[0]
                 if hasattr(node[-1], 'offset'):
                     self.set_pos_info(node[-1], start, len(self.f.getvalue()))
             self.println()
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune() # stop recursing
 
     def n_yield(self, node):
         start = len(self.f.getvalue())
@@ -216,9 +186,8 @@ class FragmentsWalker(pysource.SourceWalker, object):
         if node != AST('yield', [NONE, Token('YIELD_VALUE')]):
             self.write(' ')
             node[0].parent = node
-            self.preorder(node[0])
+            yield node[0]
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune() # stop recursing
 
     # In Python 3.3+ only
     def n_yield_from(self, node):
@@ -226,25 +195,23 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.write('yield from')
         self.write(' ')
         node[0].parent = node
-        self.preorder(node[0][0][0][0])
+        yield node[0][0][0][0]
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune() # stop recursing
 
     def n_buildslice3(self, node):
         start = len(self.f.getvalue())
         p = self.prec
         self.prec = 100
         if node[0] != NONE:
-            self.preorder(node[0])
+            yield node[0]
         self.write(':')
         if node[1] != NONE:
-            self.preorder(node[1])
+            yield node[1]
         self.write(':')
         if node[2] != NONE:
-            self.preorder(node[2])
+            yield node[2]
         self.prec = p
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune() # stop recursing
 
     def n_buildslice2(self, node):
         start = len(self.f.getvalue())
@@ -252,14 +219,13 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.prec = 100
         if node[0] != NONE:
             node[0].parent = node
-            self.preorder(node[0])
+            yield node[0]
         self.write(':')
         if node[1] != NONE:
             node[1].parent = node
-            self.preorder(node[1])
+            yield node[1]
         self.prec = p
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune() # stop recursing
 
     def n_expr(self, node):
         start = len(self.f.getvalue())
@@ -277,40 +243,36 @@ class FragmentsWalker(pysource.SourceWalker, object):
             self.write('(')
             node[0].parent = node
             self.last_finish = len(self.f.getvalue())
-            self.preorder(node[0])
+            yield node[0]
             self.write(')')
             self.last_finish = len(self.f.getvalue())
         else:
             node[0].parent = node
-            self.preorder(node[0])
+            yield node[0]
         self.prec = p
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune()
 
     def n_ret_expr(self, node):
-        start = len(self.f.getvalue())
         if len(node) == 1 and node[0] == 'expr':
             node[0].parent = node
-            self.n_expr(node[0])
+            return self.n_expr(node[0])
         else:
-            self.n_expr(node)
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+            return self.n_expr(node)
 
     def n_binary_expr(self, node):
         start = len(self.f.getvalue())
         node[0].parent = node
         self.last_finish = len(self.f.getvalue())
-        self.preorder(node[0])
+        yield node[0]
         self.write(' ')
         node[-1].parent = node
-        self.preorder(node[-1])
+        yield node[-1]
         self.write(' ')
         self.prec -= 1
         node[1].parent = node
-        self.preorder(node[1])
+        yield node[1]
         self.prec += 1
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune()
 
     def n_LOAD_CONST(self, node):
         start = len(self.f.getvalue())
@@ -341,32 +303,23 @@ class FragmentsWalker(pysource.SourceWalker, object):
         """
         start = len(self.f.getvalue()) + len(self.indent)
         self.write(self.indent, 'exec ')
-        self.preorder(node[0])
+        yield node[0]
         if node[1][0] != NONE:
             sep = ' in '
             for subnode in node[1]:
                 self.write(sep); sep = ", "
-                self.preorder(subnode)
+                yield subnode
         self.set_pos_info(node, start, len(self.f.getvalue()))
         self.println()
-        self.prune() # stop recursing
-
-    def n_ifelsestmtr(self, node):
-        if len(node[2]) != 2:
-            self.default(node)
-
-        if not (node[2][0][0][0] == 'ifstmt' and node[2][0][0][0][1][0] == 'return_if_stmts') \
-                and not (node[2][0][-1][0] == 'ifstmt' and node[2][0][-1][0][1][0] == 'return_if_stmts'):
-            self.default(node)
-            return
 
+    def ifelsestmtr_nodes(self, node):
         start = len(self.f.getvalue()) + len(self.indent)
         self.write(self.indent, 'if ')
-        self.preorder(node[0])
+        yield node[0]
         self.println(':')
         self.indentMore()
         node[1].parent = node
-        self.preorder(node[1])
+        yield node[1]
         self.indentLess()
 
         if_ret_at_end = False
@@ -389,46 +342,36 @@ class FragmentsWalker(pysource.SourceWalker, object):
                     self.indentMore()
                     past_else = True
             n.parent = node
-            self.preorder(n)
+            yield n
         if not past_else or if_ret_at_end:
             self.println(self.indent, 'else:')
             self.indentMore()
         node[2][1].parent = node
-        self.preorder(node[2][1])
+        yield node[2][1]
         self.set_pos_info(node, start, len(self.f.getvalue()))
         self.indentLess()
-        self.prune()
-
-    def n_elifelsestmtr(self, node):
-        if len(node[2]) != 2:
-            self.default(node)
-
-        for n in node[2][0]:
-            if not (n[0] == 'ifstmt' and n[0][1][0] == 'return_if_stmts'):
-                self.default(node)
-                return
 
+    def elifelsestmtr_nodes(self, node):
         start = len(self.f.getvalue() + self.indent)
         self.write(self.indent, 'elif ')
         node[0].parent = node
-        self.preorder(node[0])
+        yield node[0]
         self.println(':')
         self.indentMore()
         node[1].parent = node
-        self.preorder(node[1])
+        yield node[1]
         self.indentLess()
 
         for n in node[2][0]:
             n[0].type = 'elifstmt'
             n.parent = node
-            self.preorder(n)
+            yield n
         self.println(self.indent, 'else:')
         self.indentMore()
         node[2][1].parent = node
-        self.preorder(node[2][1])
+        yield node[2][1]
         self.indentLess()
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune()
 
     def n_import_as(self, node):
         start = len(self.f.getvalue())
@@ -519,19 +462,19 @@ class FragmentsWalker(pysource.SourceWalker, object):
             elif n == 'comp_ifnot': n = n[2]
         assert n == 'comp_body', ast
 
-        self.preorder(n[0])
+        yield n[0]
         self.write(' for ')
         start = len(self.f.getvalue())
         designator = ast[iter_index-1]
-        self.preorder(designator)
+        yield designator
         self.set_pos_info(ast[iter_index-1], start, len(self.f.getvalue()))
         self.write(' in ')
         start = len(self.f.getvalue())
         node[-3].parent = node
-        self.preorder(node[-3])
+        yield node[-3]
         self.set_pos_info(node[-3], start, len(self.f.getvalue()))
         start = len(self.f.getvalue())
-        self.preorder(ast[iter_index])
+        yield ast[iter_index]
         self.set_pos_info(iter_index, start, len(self.f.getvalue()))
         self.prec = p
 
@@ -572,15 +515,15 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 n = n[2]
         assert n == 'lc_body', ast
 
-        self.preorder(n[0])
+        yield n[0]
         self.write(' for ')
         start = len(self.f.getvalue())
-        self.preorder(designator)
+        yield designator
         self.set_pos_info(designator, start, len(self.f.getvalue()))
         self.write(' in ')
         start = len(self.f.getvalue())
         node[-3].parent = node
-        self.preorder(node[-3])
+        yield node[-3]
         self.set_pos_info(node[-3], start, len(self.f.getvalue()))
         # self.preorder(ast[iter_index])
         self.prec = p
@@ -621,19 +564,19 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
         assert n == 'lc_body', ast
 
-        self.preorder(n[0])
+        yield n[0]
         self.write(' for ')
         start = len(self.f.getvalue())
-        self.preorder(designator)
+        yield designator
         self.set_pos_info(designator, start, len(self.f.getvalue()))
         self.write(' in ')
         start = len(self.f.getvalue())
         node[-3].parent = node
-        self.preorder(collection)
+        yield collection
         self.set_pos_info(collection, start, len(self.f.getvalue()))
         if list_if:
             start = len(self.f.getvalue())
-            self.preorder(list_if)
+            yield list_if
             self.set_pos_info(list_if, start, len(self.f.getvalue()))
 
         self.prec = p
@@ -642,18 +585,18 @@ class FragmentsWalker(pysource.SourceWalker, object):
         start = len(self.f.getvalue())
         self.write('(')
         code_index = -6 if self.version > 3.0 else -5
-        self.comprehension_walk(node, iter_index=3, code_index=code_index)
+        for n in self.comprehension_walk(node, iter_index=3, code_index=code_index):
+            yield n
         self.write(')')
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune()
 
     def n_setcomp(self, node):
         start = len(self.f.getvalue())
         self.write('{')
-        self.comprehension_walk(node, 4)
+        for n in self.comprehension_walk(node, 4):
+            yield n
         self.write('}')
         self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.prune()
 
     def n_classdef(self, node):
         # class definition ('class X(A,B,C):')
@@ -785,26 +728,31 @@ class FragmentsWalker(pysource.SourceWalker, object):
     # we are interested in.
     def fixup_parents(self, node, parent):
         """Make sure each node has a parent"""
-        start, finish = 0, self.last_finish
-        # We assume anything with a start has a finish.
-        needs_range = not hasattr(node, 'start')
-
-        if not hasattr(node, 'parent'):
-            node.parent = parent
+        # Kept in a list rather than walked recursively, since trees can
+        # go deeper than the recursion limit
+        nodes = [(node, parent)]
+        while nodes:
+            node, parent = nodes.pop()
+            start, finish = 0, self.last_finish
+            # We assume anything with a start has a finish.
+            needs_range = not hasattr(node, 'start')
+
+            if not hasattr(node, 'parent'):
+                node.parent = parent
 
-        for n in node:
-            if needs_range and hasattr(n, 'start'):
-                if n.start < start: start = n.start
-                if n.finish > finish: finish = n.finish
+            for n in node:
+                if needs_range and hasattr(n, 'start'):
+                    if n.start < start: start = n.start
+                    if n.finish > finish: finish = n.finish
 
-            if hasattr(n, 'offset') and not hasattr(n, 'parent'):
-                n.parent = node
-            else:
-                self.fixup_parents(n, node)
+                if hasattr(n, 'offset') and not hasattr(n, 'parent'):
+                    n.parent = node
+                else:
+                    nodes.append((n, node))
+                    pass
                 pass
-            pass
-        if needs_range:
-            node.start, node.finish = start, finish
+            if needs_range:
+                node.start, node.finish = start, finish
 
         return
 
@@ -813,26 +761,29 @@ class FragmentsWalker(pysource.SourceWalker, object):
     # needs offset adjustment.
     def fixup_offsets(self, new_start, node):
         """Adjust all offsets under node"""
-        if hasattr(node, 'start'):
-            node.start += new_start
-            node.finish += new_start
-        for n in node:
-            if hasattr(n, 'offset'):
-                if hasattr(n, 'start'):
-                    n.start += new_start
-                    n.finish += new_start
-            else:
-                self.fixup_offsets(new_start, n)
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            if hasattr(node, 'start'):
+                node.start += new_start
+                node.finish += new_start
+            for n in node:
+                if hasattr(n, 'offset'):
+                    if hasattr(n, 'start'):
+                        n.start += new_start
+                        n.finish += new_start
+                else:
+                    nodes.append(n)
         return
 
     def set_pos_info_recurse(self, node, start, finish):
         """Set positions under node"""
-        self.set_pos_info(node, start, finish)
-        for n in node:
-            if hasattr(n, 'offset'):
-                self.set_pos_info(n, start, finish)
-            else:
-                self.set_pos_info_recurse(n, start, finish)
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            self.set_pos_info(node, start, finish)
+            if not hasattr(node, 'offset'):
+                nodes.extend(reversed(node))
         return
 
     def node_append(self, before_str, node_text, node):
@@ -842,30 +793,11 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.write(node_text)
         self.last_finish = len(self.f.getvalue())
 
-    # FIXME: duplicated from pysource, since we don't find self.params
-    def traverse(self, node, indent=None, isLambda=False):
-        '''Buulds up fragment which can be used inside a larger
+    def end_traverse(self):
+        '''Ends a fragment which can be used inside a larger
         block of code'''
-
-        self.param_stack.append(self.params)
-        if indent is None: indent = self.indent
-        p = self.pending_newlines
-        self.pending_newlines = 0
-        self.params = {
-            '_globals': {},
-            'f': StringIO(),
-            'indent': indent,
-            'isLambda': isLambda,
-            }
-        self.preorder(node)
-        self.f.write('\n'*self.pending_newlines)
-
-        text = self.f.getvalue()
+        text = pysource.SourceWalker.end_traverse(self)
         self.last_finish = len(text)
-
-        self.params = self.param_stack.pop()
-        self.pending_newlines = p
-
         return text
 
     def extract_node_info(self, nodeInfo):
@@ -1035,8 +967,12 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 while i < len(l):
                     l[1].parent = kv_node
                     l[i+1].parent = kv_node
-                    name = self.traverse(l[i], indent='')
-                    value = self.traverse(l[i+1], indent=self.indent+(len(name)+2)*' ')
+                    self.begin_traverse(indent='')
+                    yield l[i]
+                    name = self.end_traverse()
+                    self.begin_traverse(indent=self.indent+(len(name)+2)*' ')
+                    yield l[i+1]
+                    value = self.end_traverse()
                     self.write(sep, name, ': ', value)
                     sep = line_seperator
                     i += 2
@@ -1054,8 +990,12 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 while i < len(l):
                     l[1].parent = kv_node
                     l[i+1].parent = kv_node
-                    name = self.traverse(l[i+1], indent='')
-                    value = self.traverse(l[i], indent=self.indent+(len(name)+2)*' ')
+                    self.begin_traverse(indent='')
+                    yield l[i+1]
+                    name = self.end_traverse()
+                    self.begin_traverse(indent=self.indent+(len(name)+2)*' ')
+                    yield l[i]
+                    value = self.end_traverse()
                     self.write(sep, name, ': ', value)
                     sep = line_seperator
                     i += 3
@@ -1073,17 +1013,18 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 # kv2 ::= DUP_TOP expr expr ROT_THREE STORE_SUBSCR
                 # kv3 ::= expr expr STORE_MAP
                 if kv == 'kv':
-                    name = self.traverse(kv[-2], indent='')
-                    kv[1].parent = kv_node
-                    value = self.traverse(kv[1], indent=self.indent+(len(name)+2)*' ')
+                    name_node, value_node = kv[-2], kv[1]
                 elif kv == 'kv2':
-                    name = self.traverse(kv[1], indent='')
-                    kv[-3].parent = kv_node
-                    value = self.traverse(kv[-3], indent=self.indent+(len(name)+2)*' ')
+                    name_node, value_node = kv[1], kv[-3]
                 elif kv == 'kv3':
-                    name = self.traverse(kv[-2], indent='')
-                    kv[0].parent = kv_node
-                    value = self.traverse(kv[0], indent=self.indent+(len(name)+2)*' ')
+                    name_node, value_node = kv[-2], kv[0]
+                self.begin_traverse(indent='')
+                yield name_node
+                name = self.end_traverse()
+                value_node.parent = kv_node
+                self.begin_traverse(indent=self.indent+(len(name)+2)*' ')
+                yield value_node
+                value = self.end_traverse()
                 self.write(sep, name, ': ', value)
                 sep = line_seperator
         self.write('}')
@@ -1094,7 +1035,6 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.set_pos_info(node, start, finish)
         self.indentLess(INDENT_PER_LEVEL)
         self.prec = p
-        self.prune()
 
     def n_build_list(self, node):
         """
@@ -1143,7 +1083,9 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 continue
 
             assert elem == 'expr'
-            value = self.traverse(elem)
+            self.begin_traverse()
+            yield elem
+            value = self.end_traverse()
             self.node_append(sep, value, elem)
             sep = line_separator
         if len(node) == 1 and lastnode.startswith('BUILD_TUPLE'):
@@ -1155,7 +1097,6 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.set_pos_info(node, start, finish)
         self.indentLess(INDENT_PER_LEVEL)
         self.prec = p
-        self.prune()
 
     def engine(self, entry, startnode):
         """The format template interpetation engine.  See the comment at the
@@ -1204,7 +1145,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                     self.write(',')
             elif typ == 'c':
                 start = len(self.f.getvalue())
-                self.preorder(node[entry[arg]])
+                yield node[entry[arg]]
                 finish = len(self.f.getvalue())
 
                 # FIXME rocky: figure out how to get this to be table driven
@@ -1224,7 +1165,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 (index, self.prec) = entry[arg]
                 node[index].parent = node
                 start = len(self.f.getvalue())
-                self.preorder(node[index])
+                yield node[index]
                 self.set_pos_info(node, start, len(self.f.getvalue()))
                 self.prec = p
                 arg += 1
@@ -1233,7 +1174,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 lastC = remaining = len(node[low:high])
                 start = len(self.f.getvalue())
                 for subnode in node[low:high]:
-                    self.preorder(subnode)
+                    yield subnode
                     remaining -= 1
                     if remaining > 0:
                         self.write(sep)
@@ -1246,7 +1187,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 for subnode in node[low:high]:
                     remaining -= 1
                     if len(subnode) > 0:
-                        self.preorder(subnode)
+                        yield subnode
                         if remaining > 0:
                             self.write(sep)
                             pass
@@ -1270,7 +1211,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 lastC = remaining = len(node[low:high])
                 start = self.last_finish
                 for subnode in node[low:high]:
-                    self.preorder(subnode)
+                    yield subnode
                     remaining -= 1
                     if remaining > 0:
                         self.write(sep)
@@ -1316,7 +1257,6 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 last_node = startnode[-1]
                 # import traceback; traceback.print_stack()
                 self.set_pos_info(last_node, startnode_start, self.last_finish)
-        return
 
     def make_function(self, node, isLambda, nested=1, code_index=-2):
         """Dump function defintion, doc string, and function body."""
@@ -70,10 +70,11 @@ from __future__ import print_function
 import sys, re
 
 from uncompyle6 import PYTHON3
-from uncompyle6.code import iscode
+from uncompyle6.code import iscode, materialize, has_nested_code, structural_hash
 from uncompyle6.parser import get_python_parser
 from uncompyle6.parsers.astnode import AST
-from spark_parser import GenericASTTraversal, DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
+from spark_parser import GenericASTTraversal, GenericASTTraversalPruningException, \
+     DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 from uncompyle6.scanner import Code, get_scanner
 from uncompyle6.scanners.tok import Token, NoneToken
 import uncompyle6.parser as python_parser
@@ -124,6 +125,18 @@ NAME_MODULE = AST('stmt',
                       AST('designator', [ Token('STORE_NAME', pattr='__module__')])
                       ])])
 
+# Deparsed bodies of leaf functions (no nested code), keyed by their
+# structural hash plus the walker state the text depends on. Module level
+# so that a worker decompiling many files deparses a repeated function once.
+BODY_CACHE_SIZE = 20000
+body_cache = {}
+body_cache_stats = {'hits': 0, 'misses': 0}
+
+# Module code longer than this many tokens is parsed in runs of at least
+# as many, cut between top-level statements (see parser.parse_chunks).
+# 0 always parses it in one go.
+PARSE_CHUNK_TOKENS = 500
+
 # TAB = '\t'			# as God intended
 TAB = ' ' *4   # is less spacy than "\t"
 INDENT_PER_LEVEL = ' ' # additional intent per pretty-print level
@@ -373,6 +386,7 @@ MAP = {
 PRECEDENCE = {
     'build_list':           0,
     'mapexpr':              0,
+    'LOAD_LITERAL':         0,
     'unary_convert':        0,
     'dictcomp':             0,
     'setcomp':              0,
@@ -459,32 +473,44 @@ class ParserError(python_parser.ParserError):
         lines.extend( ['', str(self.error)] )
         return '\n'.join(lines)
 
-def find_globals(node, globs):
+# The tree walks below keep iterators over the nodes still to look at
+# in a list rather than recursing, since trees can get deeper than the
+# recursion limit.
+
+def find_globals(node, globs, types=('STORE_GLOBAL', 'DELETE_GLOBAL')):
     """Find globals in this statement."""
-    for n in node:
-        if isinstance(n, AST):
-            globs = find_globals(n, globs)
-        elif n.type in ('STORE_GLOBAL', 'DELETE_GLOBAL'):
-            globs.add(n.pattr)
+    nodes = [iter(node)]
+    while nodes:
+        for n in nodes[-1]:
+            if isinstance(n, AST):
+                nodes.append(iter(n))
+                break
+            elif n.type in types:
+                globs.add(n.pattr)
+        else:
+            nodes.pop()
     return globs
 
 def find_all_globals(node, globs):
     """Find globals in this statement."""
-    for n in node:
-        if isinstance(n, AST):
-            globs = find_all_globals(n, globs)
-        elif n.type in ('STORE_GLOBAL', 'DELETE_GLOBAL', 'LOAD_GLOBAL'):
-            globs.add(n.pattr)
-    return globs
+    return find_globals(node, globs,
+                        ('STORE_GLOBAL', 'DELETE_GLOBAL', 'LOAD_GLOBAL'))
 
 def find_none(node):
-    for n in node:
-        if isinstance(n, AST):
-            if not (n == 'return_stmt' or n == 'return_if_stmt'):
-                if find_none(n):
-                    return True
-        elif n.type == 'LOAD_CONST' and n.pattr is None:
-            return True
+    nodes = [iter(node)]
+    while nodes:
+        for n in nodes[-1]:
+            if isinstance(n, AST):
+                if not (n == 'return_stmt' or n == 'return_if_stmt'):
+                    nodes.append(iter(n))
+                    break
+            elif n.type == 'LOAD_CONST' and n.pattr is None:
+                return True
+            elif n.type == 'LOAD_LITERAL':
+                nodes.append(iter(n.attr[2]))
+                break
+        else:
+            nodes.pop()
     return False
 
 class SourceWalkerError(Exception):
@@ -521,6 +547,8 @@ class SourceWalker(GenericASTTraversal, object):
         self.classes = []
         self.pending_newlines = 0
         self.hide_internal = True
+        # the template default() left for visit() to walk
+        self.pending_template = None
 
         return
 
@@ -550,10 +578,77 @@ class SourceWalker(GenericASTTraversal, object):
     def indentLess(self, indent=TAB):
         self.indent = self.indent[:-len(indent)]
 
+    def preorder(self, node=None):
+        """
+        Walks the tree under node as GenericASTTraversal.preorder does,
+        but keeps its place on a stack of its own rather than in nested
+        calls, so that how deep the tree goes doesn't matter. Each entry
+        is an iterator over the nodes left to walk for a node (see
+        visit).
+        """
+        if node is None:
+            node = self.ast
+        visit = self.visit
+        stack = [visit(node)]
+        while stack:
+            for node in stack[-1]:
+                nodes = visit(node)
+                if nodes:
+                    stack.append(nodes)
+                break
+            else:
+                stack.pop()
+
+    def visit(self, node):
+        """
+        Calls the n_ method for node, or default(), and returns an
+        iterator over the nodes to walk after it: those its template
+        names if it has one (see engine), else its children unless
+        pruned.
+
+        An n_ method that walks parts of node itself is a generator, or
+        returns one: it yields each node to walk, as engine does, rather
+        than calling preorder, and visit() returns it. Its children are
+        not walked otherwise, as if pruned. The generator runs outside
+        visit(), so it can't prune or call default(). Methods that may
+        have to do either decide first, then return the generator (see
+        n_ifelsestmtr).
+        """
+        name = 'n_' + self.typestring(node)
+        try:
+            func = getattr(self, name, None)
+            if func is not None:
+                nodes = func(node)
+                if nodes is not None:
+                    return nodes
+            else:
+                self.default(node)
+        except GenericASTTraversalPruningException:
+            template, self.pending_template = self.pending_template, None
+            return template or ()
+
+        if hasattr(self, name + '_exit'):
+            return self.visit_exit(node, name + '_exit')
+        return iter(node)
+
+    def visit_exit(self, node, name):
+        for kid in node:
+            yield kid
+        getattr(self, name)(node)
+
     def traverse(self, node, indent=None, isLambda=False):
-        self.param_stack.append(self.params)
+        self.begin_traverse(indent, isLambda)
+        self.preorder(node)
+        return self.end_traverse()
+
+    def begin_traverse(self, indent=None, isLambda=False):
+        """
+        Starts writing to a new buffer, as traverse does. Generator n_
+        methods use it to get the text of a node they yield: what is
+        walked until end_traverse goes into the buffer.
+        """
+        self.param_stack.append((self.params, self.pending_newlines))
         if indent is None: indent = self.indent
-        p = self.pending_newlines
         self.pending_newlines = 0
         self.params = {
             '_globals': {},
@@ -561,11 +656,12 @@ class SourceWalker(GenericASTTraversal, object):
             'indent': indent,
             'isLambda': isLambda,
             }
-        self.preorder(node)
+
+    def end_traverse(self):
+        """Goes back to the buffer before begin_traverse and returns the text written"""
         self.f.write('\n'*self.pending_newlines)
         result = self.f.getvalue()
-        self.params = self.param_stack.pop()
-        self.pending_newlines = p
+        self.params, self.pending_newlines = self.param_stack.pop()
         return result
 
     def write(self, *data):
@@ -669,66 +765,58 @@ class SourceWalker(GenericASTTraversal, object):
 
     def n_return_stmt(self, node):
         if self.params['isLambda']:
-            self.preorder(node[0])
-            self.prune()
+            yield node[0]
         else:
             self.write(self.indent, 'return')
             if self.return_none or node != AST('return_stmt', [AST('ret_expr', [NONE]), Token('RETURN_VALUE')]):
                 self.write(' ')
-                self.preorder(node[0])
+                yield node[0]
             self.println()
-            self.prune() # stop recursing
 
     def n_return_if_stmt(self, node):
         if self.params['isLambda']:
-            self.preorder(node[0])
-            self.prune()
+            yield node[0]
         else:
             self.write(self.indent, 'return')
             if self.return_none or node != AST('return_stmt', [AST('ret_expr', [NONE]), Token('RETURN_END_IF')]):
                 self.write(' ')
-                self.preorder(node[0])
+                yield node[0]
             self.println()
-            self.prune() # stop recursing
 
     def n_yield(self, node):
         self.write('yield')
         if node != AST('yield', [NONE, Token('YIELD_VALUE')]):
             self.write(' ')
-            self.preorder(node[0])
-        self.prune() # stop recursing
+            yield node[0]
 
     # In Python 3.3+ only
     def n_yield_from(self, node):
         self.write('yield from')
         self.write(' ')
-        self.preorder(node[0][0][0][0])
-        self.prune() # stop recursing
+        yield node[0][0][0][0]
 
     def n_buildslice3(self, node):
         p = self.prec
         self.prec = 100
         if not node[0].isNone():
-            self.preorder(node[0])
+            yield node[0]
         self.write(':')
         if not node[1].isNone():
-            self.preorder(node[1])
+            yield node[1]
         self.write(':')
         if not node[2].isNone():
-            self.preorder(node[2])
+            yield node[2]
         self.prec = p
-        self.prune() # stop recursing
 
     def n_buildslice2(self, node):
         p = self.prec
         self.prec = 100
         if not node[0].isNone():
-            self.preorder(node[0])
+            yield node[0]
         self.write(':')
         if not node[1].isNone():
-            self.preorder(node[1])
+            yield node[1]
         self.prec = p
-        self.prune() # stop recursing
 
     def n_expr(self, node):
         p = self.prec
@@ -743,51 +831,99 @@ class SourceWalker(GenericASTTraversal, object):
 
         if p < self.prec:
             self.write('(')
-            self.preorder(node[0])
+            yield node[0]
             self.write(')')
         else:
-            self.preorder(node[0])
+            yield node[0]
         self.prec = p
-        self.prune()
 
     def n_ret_expr(self, node):
         if len(node) == 1 and node[0] == 'expr':
-            self.n_expr(node[0])
+            return self.n_expr(node[0])
         else:
-            self.n_expr(node)
+            return self.n_expr(node)
 
     n_ret_expr_or_cond = n_expr
 
     def n_binary_expr(self, node):
-        self.preorder(node[0])
+        yield node[0]
         self.write(' ')
-        self.preorder(node[-1])
+        yield node[-1]
         self.write(' ')
         self.prec -= 1
-        self.preorder(node[1])
+        yield node[1]
         self.prec += 1
-        self.prune()
 
     def n_LOAD_CONST(self, node):
-        data = node.pattr; datatype = type(data)
+        self.write(self.const_text(node.pattr))
+        # LOAD_CONST is a terminal, so stop processing/recursing early
+        self.prune()
+
+    def const_text(self, data):
+        datatype = type(data)
         if isinstance(datatype, int) and data == minint:
             # convert to hex, since decimal representation
             # would result in 'LOAD_CONST; UNARY_NEGATIVE'
             # change:hG/2002-02-07: this was done for all negative integers
             # todo: check whether this is necessary in Python 2.1
-            self.write( hex(data) )
+            return hex(data)
         elif datatype is type(Ellipsis):
-            self.write('...')
+            return '...'
         elif data is None:
             # LOAD_CONST 'None' only occurs, when None is
             # implicit eg. in 'return' w/o params
             # pass
-            self.write('None')
+            return 'None'
         else:
-            self.write(repr(data))
-        # LOAD_CONST is a terminal, so stop processing/recursing early
+            return repr(data)
+
+    def n_LOAD_LITERAL(self, node):
+        self.write(self.literal_text(node).replace('\n', '\n' + self.indent))
         self.prune()
 
+    def literal_text(self, token):
+        """
+        The text n_mapexpr or n_build_list would write for a
+        LOAD_LITERAL token (see Python2Parser.fold_literals) or one of
+        its items, with the lines after the first as if at indent ''.
+        """
+        if token.type == 'LOAD_CONST':
+            return self.const_text(token.pattr)
+        elif token.type == 'LOAD_NAME':
+            return token.pattr
+        elif token.type == 'LOAD_LITERAL':
+            build, items, _ = token.attr
+        else:
+            # an empty display
+            build, items = token, []
+        if build.type == 'BUILD_MAP':
+            entries = []
+            for key, value in items:
+                name = self.literal_text(key)
+                value = self.literal_text(value).replace(
+                    '\n', '\n' + INDENT_PER_LEVEL + (len(name)+2)*' ')
+                entries.append(name + ': ' + value)
+            return ('{' + INDENT_PER_LEVEL[:-1] +
+                    (',\n' + INDENT_PER_LEVEL).join(entries) + '}')
+
+        buildtype = build.type
+        if buildtype.startswith('BUILD_LIST'):
+            startchar, endchar = '[', ']'
+        elif buildtype.startswith('BUILD_TUPLE'):
+            startchar, endchar = '(', ')'
+        else:
+            startchar, endchar = '{', '}'
+        if build.attr > 3:
+            line_separator = ',\n' + INDENT_PER_LEVEL
+        else:
+            line_separator = ', '
+        elems = [self.literal_text(item).replace('\n', '\n' + INDENT_PER_LEVEL)
+                 for item in items]
+        if build.attr == 1 and buildtype.startswith('BUILD_TUPLE'):
+            endchar = ',' + endchar
+        return (startchar + INDENT_PER_LEVEL[:-1] +
+                line_separator.join(elems) + endchar)
+
     def n_delete_subscr(self, node):
         if node[-2][0] == 'build_list' and node[-2][0][-1].type.startswith('BUILD_TUPLE'):
             if node[-2][0][-1] != 'BUILD_TUPLE_0':
@@ -815,41 +951,47 @@ class SourceWalker(GenericASTTraversal, object):
         exec_stmt ::= expr exprlist EXEC_STMT
         """
         self.write(self.indent, 'exec ')
-        self.preorder(node[0])
+        yield node[0]
         if not node[1][0].isNone():
             sep = ' in '
             for subnode in node[1]:
                 self.write(sep); sep = ", "
-                self.preorder(subnode)
+                yield subnode
         self.println()
-        self.prune() # stop recursing
 
-    def n_ifelsestmt(self, node, preprocess=0):
-        n = node[3][0]
-        if len(n) == 1 == len(n[0]) and n[0] == '_stmts':
-            n = n[0][0][0]
-        elif n[0].type in ('lastc_stmt', 'lastl_stmt'):
-            n = n[0][0]
-        else:
-            if not preprocess:
-                self.default(node)
-            return
+    def n_ifelsestmt(self, node):
+        # Turn an else holding just an if into an elif, all the way
+        # down a chain of them
+        chain = []
+        parent = node
+        while True:
+            n = parent[3][0]
+            if len(n) == 1 == len(n[0]) and n[0] == '_stmts':
+                n = n[0][0][0]
+            elif n[0].type in ('lastc_stmt', 'lastl_stmt'):
+                n = n[0][0]
+            else:
+                break
+
+            if n.type in ('ifstmt', 'iflaststmt', 'iflaststmtl'):
+                parent.type = 'ifelifstmt'
+                n.type = 'elifstmt'
+            elif n.type in ('ifelsestmtr',):
+                parent.type = 'ifelifstmt'
+                n.type = 'elifelsestmtr'
+            elif n.type in ('ifelsestmt', 'ifelsestmtc', 'ifelsestmtl'):
+                parent.type = 'ifelifstmt'
+                chain.append(n)
+                parent = n
+                continue
+            break
 
-        if n.type in ('ifstmt', 'iflaststmt', 'iflaststmtl'):
-            node.type = 'ifelifstmt'
-            n.type = 'elifstmt'
-        elif n.type in ('ifelsestmtr',):
-            node.type = 'ifelifstmt'
-            n.type = 'elifelsestmtr'
-        elif n.type in ('ifelsestmt', 'ifelsestmtc', 'ifelsestmtl'):
-            node.type = 'ifelifstmt'
-            self.n_ifelsestmt(n, preprocess=1)
+        for n in reversed(chain):
             if n == 'ifelifstmt':
                 n.type = 'elifelifstmt'
             elif n.type in ('ifelsestmt', 'ifelsestmtc', 'ifelsestmtl'):
                 n.type = 'elifelsestmt'
-        if not preprocess:
-            self.default(node)
+        self.default(node)
 
     n_ifelsestmtc = n_ifelsestmtl = n_ifelsestmt
 
@@ -861,12 +1003,15 @@ class SourceWalker(GenericASTTraversal, object):
                 and not (node[2][0][-1][0] == 'ifstmt' and node[2][0][-1][0][1][0] == 'return_if_stmts'):
             self.default(node)
             return
+        return self.ifelsestmtr_nodes(node)
 
+    def ifelsestmtr_nodes(self, node):
+        """What n_ifelsestmtr walks when it writes the elifs itself"""
         self.write(self.indent, 'if ')
-        self.preorder(node[0])
+        yield node[0]
         self.println(':')
         self.indentMore()
-        self.preorder(node[1])
+        yield node[1]
         self.indentLess()
 
         if_ret_at_end = False
@@ -887,13 +1032,12 @@ class SourceWalker(GenericASTTraversal, object):
                     self.println(self.indent, 'else:')
                     self.indentMore()
                     past_else = True
-            self.preorder(n)
+            yield n
         if not past_else or if_ret_at_end:
             self.println(self.indent, 'else:')
             self.indentMore()
-        self.preorder(node[2][1])
+        yield node[2][1]
         self.indentLess()
-        self.prune()
 
     def n_elifelsestmtr(self, node):
         if len(node[2]) != 2:
@@ -903,22 +1047,24 @@ class SourceWalker(GenericASTTraversal, object):
             if not (n[0] == 'ifstmt' and n[0][1][0] == 'return_if_stmts'):
                 self.default(node)
                 return
+        return self.elifelsestmtr_nodes(node)
 
+    def elifelsestmtr_nodes(self, node):
+        """What n_elifelsestmtr walks when it writes the elifs itself"""
         self.write(self.indent, 'elif ')
-        self.preorder(node[0])
+        yield node[0]
         self.println(':')
         self.indentMore()
-        self.preorder(node[1])
+        yield node[1]
         self.indentLess()
 
         for n in node[2][0]:
             n[0].type = 'elifstmt'
-            self.preorder(n)
+            yield n
         self.println(self.indent, 'else:')
         self.indentMore()
-        self.preorder(node[2][1])
+        yield node[2][1]
         self.indentLess()
-        self.prune()
 
     def n_import_as(self, node):
         iname = node[0].pattr
@@ -983,11 +1129,10 @@ class SourceWalker(GenericASTTraversal, object):
             elif n == 'list_if_not': n= n[2]
         assert n == 'lc_body'
         self.write( '[ ')
-        self.preorder(n[0]) # lc_body
-        self.preorder(node[-1]) # for/if parts
+        yield n[0] # lc_body
+        yield node[-1] # for/if parts
         self.write( ' ]')
         self.prec = p
-        self.prune() # stop recursing
 
     def comprehension_walk(self, node, iter_index, code_index=-5):
         p = self.prec
@@ -1021,26 +1166,26 @@ class SourceWalker(GenericASTTraversal, object):
             elif n == 'comp_ifnot': n = n[2]
         assert n == 'comp_body', ast
 
-        self.preorder(n[0])
+        yield n[0]
         self.write(' for ')
-        self.preorder(ast[iter_index-1])
+        yield ast[iter_index-1]
         self.write(' in ')
-        self.preorder(node[-3])
-        self.preorder(ast[iter_index])
+        yield node[-3]
+        yield ast[iter_index]
         self.prec = p
 
     def n_genexpr(self, node):
         self.write('(')
         code_index = -6 if self.version > 3.0 else -5
-        self.comprehension_walk(node, iter_index=3, code_index=code_index)
+        for n in self.comprehension_walk(node, iter_index=3, code_index=code_index):
+            yield n
         self.write(')')
-        self.prune()
 
     def n_setcomp(self, node):
         self.write('{')
-        self.comprehension_walk(node, iter_index=4)
+        for n in self.comprehension_walk(node, iter_index=4):
+            yield n
         self.write('}')
-        self.prune()
 
     def listcomprehension_walk3(self, node, iter_index, code_index=-5):
         """
@@ -1079,11 +1224,11 @@ class SourceWalker(GenericASTTraversal, object):
             pass
         assert n == 'lc_body', ast
 
-        self.preorder(n[0])
+        yield n[0]
         self.write(' for ')
-        self.preorder(designator)
+        yield designator
         self.write(' in ')
-        self.preorder(node[-3])
+        yield node[-3]
         self.prec = p
 
     def listcomprehension_walk2(self, node):
@@ -1122,23 +1267,24 @@ class SourceWalker(GenericASTTraversal, object):
 
         assert n == 'lc_body', ast
 
-        self.preorder(n[0])
+        yield n[0]
         self.write(' for ')
-        self.preorder(designator)
+        yield designator
         self.write(' in ')
-        self.preorder(collection)
+        yield collection
         if list_if:
-            self.preorder(list_if)
+            yield list_if
         self.prec = p
 
     def n_listcomp(self, node):
         self.write('[')
         if node[0].type == 'load_closure':
-            self.listcomprehension_walk2(node)
+            nodes = self.listcomprehension_walk2(node)
         else:
-            self.listcomprehension_walk3(node, 1, 0)
+            nodes = self.listcomprehension_walk3(node, 1, 0)
+        for n in nodes:
+            yield n
         self.write(']')
-        self.prune()
 
     n_dictcomp = n_setcomp
 
@@ -1285,8 +1431,12 @@ class SourceWalker(GenericASTTraversal, object):
                 l = list(kv_node)
                 i = 0
                 while i < len(l):
-                    name = self.traverse(l[i], indent='')
-                    value = self.traverse(l[i+1], indent=self.indent+(len(name)+2)*' ')
+                    self.begin_traverse(indent='')
+                    yield l[i]
+                    name = self.end_traverse()
+                    self.begin_traverse(indent=self.indent+(len(name)+2)*' ')
+                    yield l[i+1]
+                    value = self.end_traverse()
                     self.write(sep, name, ': ', value)
                     sep = line_seperator
                     i += 2
@@ -1302,11 +1452,12 @@ class SourceWalker(GenericASTTraversal, object):
                     l = list(kv_node)
                 i = 0
                 while i < len(l):
-                    try:
-                        name = self.traverse(l[i+1], indent='')
-                    except:
-                        from trepan.api import debug; debug()
-                    value = self.traverse(l[i], indent=self.indent+(len(name)+2)*' ')
+                    self.begin_traverse(indent='')
+                    yield l[i+1]
+                    name = self.end_traverse()
+                    self.begin_traverse(indent=self.indent+(len(name)+2)*' ')
+                    yield l[i]
+                    value = self.end_traverse()
                     self.write(sep, name, ': ', value)
                     sep = line_seperator
                     i += 3
@@ -1324,20 +1475,23 @@ class SourceWalker(GenericASTTraversal, object):
                 # kv2 ::= DUP_TOP expr expr ROT_THREE STORE_SUBSCR
                 # kv3 ::= expr expr STORE_MAP
                 if kv == 'kv':
-                    name = self.traverse(kv[-2], indent='')
-                    value = self.traverse(kv[1], indent=self.indent+(len(name)+2)*' ')
+                    name_node, value_node = kv[-2], kv[1]
                 elif kv == 'kv2':
-                    name = self.traverse(kv[1], indent='')
-                    value = self.traverse(kv[-3], indent=self.indent+(len(name)+2)*' ')
+                    name_node, value_node = kv[1], kv[-3]
                 elif kv == 'kv3':
-                    name = self.traverse(kv[-2], indent='')
-                    value = self.traverse(kv[0], indent=self.indent+(len(name)+2)*' ')
+                    name_node, value_node = kv[-2], kv[0]
+                self.begin_traverse(indent='')
+                yield name_node
+                name = self.end_traverse()
+                self.begin_traverse(indent=self.indent+(len(name)+2)*' ')
+                yield value_node
+                value = self.end_traverse()
+                if kv == 'kv3':
                     self.write(sep, name, ': ', value)
                     sep = line_seperator
         self.write('}')
         self.indentLess(INDENT_PER_LEVEL)
         self.prec = p
-        self.prune()
 
     def n_build_list(self, node):
         """
@@ -1384,7 +1538,9 @@ class SourceWalker(GenericASTTraversal, object):
             if elem == 'ROT_THREE':
                 continue
             assert elem == 'expr'
-            value = self.traverse(elem)
+            self.begin_traverse()
+            yield elem
+            value = self.end_traverse()
             self.write(sep, value)
             sep = line_separator
         if lastnode.attr == 1 and lastnodetype.startswith('BUILD_TUPLE'):
@@ -1392,7 +1548,6 @@ class SourceWalker(GenericASTTraversal, object):
         self.write(endchar)
         self.indentLess(INDENT_PER_LEVEL)
         self.prec = p
-        self.prune()
 
     def n_unpack(self, node):
         for n in node[1:]:
@@ -1431,6 +1586,9 @@ class SourceWalker(GenericASTTraversal, object):
         """The format template interpetation engine.  See the comment at the
         beginning of this module for the how we interpret format specifications such as
         %c, %C, and so on.
+
+        This is a generator: it yields the nodes to walk where the
+        template has them, and the caller walks each before resuming it.
         """
 
         # self.println("-----")
@@ -1473,12 +1631,12 @@ class SourceWalker(GenericASTTraversal, object):
                 # Why? and
                 # Is there some sort of invalid bounds access going on?
                 if isinstance(entry[arg], int):
-                    self.preorder(node[entry[arg]])
+                    yield node[entry[arg]]
                 arg += 1
             elif typ == 'p':
                 p = self.prec
                 (index, self.prec) = entry[arg]
-                self.preorder(node[index])
+                yield node[index]
                 self.prec = p
                 arg += 1
             elif typ == 'C':
@@ -1486,7 +1644,7 @@ class SourceWalker(GenericASTTraversal, object):
                 remaining = len(node[low:high])
                 # remaining = len(node[low:high])
                 for subnode in node[low:high]:
-                    self.preorder(subnode)
+                    yield subnode
                     remaining -= 1
                     if remaining > 0:
                         self.write(sep)
@@ -1497,7 +1655,7 @@ class SourceWalker(GenericASTTraversal, object):
                 for subnode in node[low:high]:
                     remaining -= 1
                     if len(subnode) > 0:
-                        self.preorder(subnode)
+                        yield subnode
                         if remaining > 0:
                             self.write(sep)
                             pass
@@ -1514,7 +1672,7 @@ class SourceWalker(GenericASTTraversal, object):
                 remaining = len(node[low:high])
                 # remaining = len(node[low:high])
                 for subnode in node[low:high]:
-                    self.preorder(subnode)
+                    yield subnode
                     remaining -= 1
                     if remaining > 0:
                         self.write(sep)
@@ -1541,7 +1699,8 @@ class SourceWalker(GenericASTTraversal, object):
             pass
 
         if key.type in table:
-            self.engine(table[key.type], node)
+            # visit() walks the template once this prunes node
+            self.pending_template = self.engine(table[key.type], node)
             self.prune()
 
     def customize(self, customize):
@@ -1620,20 +1779,10 @@ class SourceWalker(GenericASTTraversal, object):
     def make_function(self, node, isLambda, nested=1, code_index=-2):
         """Dump function defintion, doc string, and function body."""
 
-        def build_param(ast, name, default):
+        def build_param(name, default):
             """build parameters:
                 - handle defaults
-                - handle format tuple parameters
             """
-            if self.version < 3.0:
-                # if formal parameter is a tuple, the paramater name
-                # starts with a dot (eg. '.1', '.2')
-                if name.startswith('.'):
-                    # replace the name with the tuple-string
-                    name = self.get_tuple_parameter(ast, name)
-                    pass
-                pass
-
             if default:
                 if self.showast:
                     print()
@@ -1665,28 +1814,48 @@ class SourceWalker(GenericASTTraversal, object):
             code = node[code_index].attr
 
         assert iscode(code)
-        code = Code(code, self.scanner, self.currentclass)
+        code = materialize(code)
+
+        # An identical function seen before (in this file or an earlier one)
+        # needs no disassembly, parse or traversal
+        cache_key = self.body_cache_key(code, isLambda)
+        cached = body_cache.get(cache_key) if cache_key else None
+        if cached:
+            body_cache_stats['hits'] += 1
+            paramnames, all_globals, globs, rn, text = cached
+            paramnames = list(paramnames)
+        else:
+            if cache_key:
+                body_cache_stats['misses'] += 1
+            code = Code(code, self.scanner, self.currentclass)
+            try:
+                ast = self.build_ast(code._tokens,
+                                     code._customize,
+                                     isLambda = isLambda,
+                                     noneInNames = ('None' in code.co_names))
+            except ParserError as p:
+                self.write(str(p))
+                self.ERROR = p
+                return
+
+            paramnames = list(code.co_varnames[:code.co_argcount])
+            if self.version < 3.0:
+                # if formal parameter is a tuple, the paramater name
+                # starts with a dot (eg. '.1', '.2'); replace the name
+                # with the tuple-string
+                for i in reversed(range(len(paramnames))):
+                    if paramnames[i].startswith('.'):
+                        paramnames[i] = self.get_tuple_parameter(ast, paramnames[i])
 
         # add defaults values to parameter names
         argc = code.co_argcount
-        paramnames = list(code.co_varnames[:argc])
 
         # defaults are for last n parameters, thus reverse
         paramnames.reverse(); defparams.reverse()
 
-        try:
-            ast = self.build_ast(code._tokens,
-                                 code._customize,
-                                 isLambda = isLambda,
-                                 noneInNames = ('None' in code.co_names))
-        except ParserError as p:
-            self.write(str(p))
-            self.ERROR = p
-            return
-
         # build parameters
 
-        params = [build_param(ast, name, default) for
+        params = [build_param(name, default) for
                   name, default in zip_longest(paramnames, defparams, fillvalue=None)]
 
         params.reverse() # back to correct order
@@ -1727,17 +1896,39 @@ class SourceWalker(GenericASTTraversal, object):
             # docstring exists, dump it
             self.print_docstring(indent, code.co_consts[0])
 
-        code._tokens = None # save memory
-        assert ast == 'stmts'
+        if not cached:
+            code._tokens = None # save memory
+            assert ast == 'stmts'
+            all_globals = find_all_globals(ast, set())
+            globs = find_globals(ast, set())
+            rn = ('None' in code.co_names) and not find_none(ast)
 
-        all_globals = find_all_globals(ast, set())
-        for g in ((all_globals & self.mod_globs) | find_globals(ast, set())):
+        for g in ((all_globals & self.mod_globs) | globs):
             self.println(self.indent, 'global ', g)
         self.mod_globs -= all_globals
-        rn = ('None' in code.co_names) and not find_none(ast)
-        self.gen_source(ast, code.co_name, code._customize, isLambda=isLambda,
-                            returnNone=rn)
-        code._tokens = None; code._customize = None # save memory
+
+        if not cached:
+            text = self.deparse_body(ast, code.co_name, code._customize,
+                                     isLambda=isLambda, returnNone=rn)
+            code._tokens = None; code._customize = None # save memory
+            if cache_key:
+                if len(body_cache) >= BODY_CACHE_SIZE:
+                    body_cache.clear()
+                body_cache[cache_key] = (tuple(reversed(paramnames)), all_globals,
+                                         globs, rn, text)
+        self.write_body(text, isLambda)
+
+    def body_cache_key(self, code, isLambda):
+        """Key for code's deparsed body in body_cache, or None if it can't be shared.
+
+        Only leaf functions are shared: the text of a function with nested
+        definitions also depends on mod_globs, which those definitions change.
+        """
+        if self.showast or has_nested_code(code):
+            return None
+        return (structural_hash(code), self.__class__, self.version,
+                self.currentclass, self.indent, self.prec, self.hide_internal,
+                isLambda)
 
     def build_class(self, code):
         """Dump class definition, doc string and class body."""
@@ -1808,28 +1999,42 @@ class SourceWalker(GenericASTTraversal, object):
     def gen_source(self, ast, name, customize, isLambda=False, returnNone=False):
         """convert AST to source code"""
 
+        self.write_body(self.deparse_body(ast, name, customize, isLambda=isLambda,
+                                          returnNone=returnNone), isLambda)
+
+    def deparse_body(self, ast, name, customize, isLambda=False, returnNone=False):
+        """Source text for ast, or None if the body is empty"""
+
+        self.name = name
+        if len(ast) == 0:
+            return None
         rn = self.return_none
         self.return_none = returnNone
-        self.name = name
+        self.customize(customize)
+        text = self.traverse(ast, isLambda=isLambda)
+        self.return_none = rn
+        return text
+
+    def write_body(self, text, isLambda=False):
+        """Write text from deparse_body at the current position"""
+
         # if code would be empty, append 'pass'
-        if len(ast) == 0:
+        if text is None:
             self.println(self.indent, 'pass')
+        elif isLambda:
+            self.write(text)
         else:
-            self.customize(customize)
-            if isLambda:
-                self.write(self.traverse(ast, isLambda=isLambda))
-            else:
-                self.text = self.traverse(ast, isLambda=isLambda)
-                self.println(self.text)
-        self.return_none = rn
+            self.text = text
+            self.println(text)
 
     def build_ast(self, tokens, customize, isLambda=False,
-                  noneInNames=False, isTopLevel=False):
+                  noneInNames=False, isTopLevel=False, stmt_breaks=None):
 
         # assert isinstance(tokens[0], Token)
 
         if isLambda:
             tokens.append(Token('LAMBDA_MARKER'))
+            tokens, customize = self.p.fold_literals(tokens, customize)
             try:
                 ast = python_parser.parse(self.p, tokens, customize)
             except (python_parser.ParserError, AssertionError) as e:
@@ -1857,8 +2062,16 @@ class SourceWalker(GenericASTTraversal, object):
                 return PASS
 
         # Build AST from disassembly.
+        tokens, customize = self.p.fold_literals(tokens, customize)
+        breaks = None
+        if (isTopLevel and stmt_breaks and PARSE_CHUNK_TOKENS
+            and len(tokens) > PARSE_CHUNK_TOKENS):
+            breaks = self.chunk_breaks(tokens, stmt_breaks)
         try:
-            ast = python_parser.parse(self.p, tokens, customize)
+            if breaks:
+                ast = python_parser.parse_chunks(self.p, tokens, customize, breaks)
+            else:
+                ast = python_parser.parse(self.p, tokens, customize)
         except (python_parser.ParserError, AssertionError) as e:
             raise ParserError(e, tokens)
 
@@ -1868,6 +2081,27 @@ class SourceWalker(GenericASTTraversal, object):
 
         return ast
 
+    def chunk_breaks(self, tokens, stmt_breaks):
+        """
+        Indexes in tokens to cut them at for parse_chunks: the statement
+        breaks the scanner returned with them (see
+        Scanner.disassemble_with_breaks), keeping the runs
+        PARSE_CHUNK_TOKENS long or more.
+        """
+        first_token = {}
+        for i, token in enumerate(tokens):
+            first_token.setdefault(token.offset, i)
+
+        breaks = []
+        last = 0
+        for offset in stmt_breaks:
+            i = first_token.get(offset)
+            if (i is not None and i - last >= PARSE_CHUNK_TOKENS
+                and len(tokens) - i >= PARSE_CHUNK_TOKENS):
+                breaks.append(i)
+                last = i
+        return breaks
+
 def deparse_code(version, co, out=sys.stdout, showasm=False, showast=False,
                  showgrammar=False, code_objects={}, compile_mode='exec'):
     """
@@ -1878,7 +2112,8 @@ def deparse_code(version, co, out=sys.stdout, showasm=False, showast=False,
     # store final output stream for case of error
     scanner = get_scanner(version)
 
-    tokens, customize = scanner.disassemble(co, code_objects=code_objects, showast=showast)
+    tokens, customize, stmt_breaks = scanner.disassemble_with_breaks(
+        co, code_objects=code_objects, showast=showast)
     if showasm:
         print('\n--- Disassembled and modified code: ---\n')
         for t in tokens:
@@ -1895,7 +2130,8 @@ def deparse_code(version, co, out=sys.stdout, showasm=False, showast=False,
                             debug_parser=debug_parser, compile_mode=compile_mode)
 
     isTopLevel = co.co_name == '<module>'
-    deparsed.ast = deparsed.build_ast(tokens, customize, isTopLevel=isTopLevel)
+    deparsed.ast = deparsed.build_ast(tokens, customize, isTopLevel=isTopLevel,
+                                      stmt_breaks=stmt_breaks)
 
     assert deparsed.ast == 'stmts', 'Should have parsed grammar start'
 
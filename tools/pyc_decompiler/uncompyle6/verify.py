@@ -8,10 +8,11 @@ byte-code verification
 
 from __future__ import print_function
 
-import dis, operator
+import dis, operator, sys
 
 import uncompyle6
 import uncompyle6.scanner as scanner
+from uncompyle6.scanner import get_scanner
 from uncompyle6 import PYTHON3
 from uncompyle6.code import iscode
 from uncompyle6.magics import PYTHON_MAGIC_INT
@@ -180,27 +181,8 @@ def cmp_code_objects(version, code_obj1, code_obj2, name=''):
         if member in __IGNORE_CODE_MEMBERS__:
             pass
         elif member == 'co_code':
-            if version == 2.5:
-                import uncompyle6.scanners.scanner25 as scan
-                scanner = scan.Scanner25()
-            elif version == 2.6:
-                import uncompyle6.scanners.scanner26 as scan
-                scanner = scan.Scanner26()
-            elif version == 2.7:
-                import uncompyle6.scanners.scanner27 as scan
-                scanner = scan.Scanner27()
-            elif version == 3.2:
-                import uncompyle6.scanners.scanner32 as scan
-                scanner = scan.Scanner32()
-            elif version == 3.3:
-                import uncompyle6.scanners.scanner33 as scan
-                scanner = scan.Scanner33()
-            elif version == 3.4:
-                import uncompyle6.scanners.scanner34 as scan
-                scanner = scan.Scanner34()
-            elif version == 3.5:
-                import uncompyle6.scanners.scanner35 as scan
-                scanner = scan.Scanner35()
+            scanner = get_scanner(version)
+            scan = sys.modules[scanner.__module__]
 
             global JUMP_OPs
             JUMP_OPs = list(scan.JUMP_OPs) + ['JUMP_BACK']
@@ -328,6 +310,8 @@ def cmp_code_objects(version, code_obj1, code_obj2, name=''):
 class Token(scanner.Token):
     """Token class with changed semantics for 'cmp()'."""
 
+    __slots__ = ()
+
     def __cmp__(self, o):
         t = self.type # shortcut
         loads = ('LOAD_NAME', 'LOAD_GLOBAL', 'LOAD_CONST')
@@ -3,63 +3,188 @@
 Worker module for parallel decompilation
 """
 
+import collections
 import subprocess
 import json
+import queue
+import sys
+import threading
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 
+# Add parent directory to path to import helper
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from helper.trace import now_us
 
-def decompile_worker(args: Tuple[str, str]) -> Tuple[str, bool, str]:
+# Seconds one file may take before its Python 2.7 process is killed
+TIMEOUT = 30
+
+# Lines of the Python 2.7 process's stderr kept for the error of a file it dies on
+STDERR_LINES = 50
+
+# Progress event queue shared with the parent's ProgressDisplay (set by init_worker)
+_progress_queue = None
+
+# This pool process's persistent worker_py2.py (started on first use)
+_server = None
+
+
+def init_worker(progress_queue):
+    """Pool initializer: remember the queue progress lane events go to"""
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _trace_events(pyc_file: Path, start_us: int, end_us: int, child_trace: Optional[Dict]) -> List[Dict]:
+    """Build this worker's lane events for one file from its own timing and the child's phases"""
+    import os
+    tid = os.getpid()
+    events = [{
+        'name': f"decompile {pyc_file.name}", 'ph': 'X', 'ts': start_us,
+        'dur': max(0, end_us - start_us), 'tid': tid, 'cat': 'decompile',
+        'args': {'file': str(pyc_file)}
+    }]
+    if child_trace:
+        child_start = child_trace.get('start', start_us)
+        events.append({
+            'name': 'spawn', 'ph': 'X', 'ts': start_us,
+            'dur': max(0, child_start - start_us), 'tid': tid, 'cat': 'decompile'
+        })
+        for phase in child_trace.get('phases', []):
+            events.append({
+                'name': phase['name'], 'ph': 'X', 'ts': phase['ts'],
+                'dur': phase['dur'], 'tid': tid, 'cat': 'decompile'
+            })
+    return events
+
+
+class Python2Server:
+    """
+    A worker_py2.py --serve process kept alive for every file this pool
+    process handles, so Python 2.7 starts and imports uncompyle6 once and
+    identical functions are deparsed once per worker
+    """
+
+    def __init__(self, python2_exe: str, trace: bool):
+        import os
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        cmd = [python2_exe, os.path.join(script_dir, "worker_py2.py"), '--serve']
+        if trace:
+            cmd.append('--trace')
+        self.key = (python2_exe, trace)
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=script_dir
+        )
+        # Replies are read on a thread so a hung file can time out
+        self.replies = queue.Queue()
+        threading.Thread(target=self._read_replies, daemon=True).start()
+        # stderr is drained on another so the process never blocks on it;
+        # its last lines explain a crash
+        self.stderr_tail = collections.deque(maxlen=STDERR_LINES)
+        self.stderr_reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self.stderr_reader.start()
+
+    def _read_replies(self):
+        for line in self.process.stdout:
+            self.replies.put(line)
+        self.replies.put(None)
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self.stderr_tail.append(line)
+
+    def request(self, pyc_file: Path, timeout: float) -> Dict:
+        """Decompile one file; raises queue.Empty on timeout and EOFError if the process died"""
+        # keep only what this file's run writes
+        self.stderr_tail.clear()
+        self.process.stdin.write(str(pyc_file.absolute()) + '\n')
+        self.process.stdin.flush()
+        line = self.replies.get(timeout=timeout)
+        if line is None:
+            code = self.process.wait()
+            raise EOFError(self.stderr() or f"Python 2.7 worker exited with code {code}")
+        return json.loads(line)
+
+    def stderr(self) -> str:
+        """What the process wrote to stderr during the last request, once it has exited"""
+        self.stderr_reader.join(timeout=1)
+        return ''.join(self.stderr_tail).strip()
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def decompile_worker(args: Tuple) -> Tuple[str, bool, str, List[Dict], Dict]:
     """
     Worker function for decompiling a single file
 
     Args:
-        args: Tuple of (python2_exe, pyc_file_path)
+        args: Tuple of (python2_exe, pyc_file_path[, trace])
 
     Returns:
-        Tuple of (pyc_file_path, success, result_message)
+        Tuple of (pyc_file_path, success, result_message, trace_events, dedup);
+        trace_events is empty unless trace was requested, dedup holds the
+        function body cache hits and misses for this file
     """
     import os
-    python2_exe, pyc_file_path = args
-    pyc_file = Path(pyc_file_path)
+    python2_exe, pyc_file_path = args[:2]
+    trace = len(args) > 2 and bool(args[2])
 
-    # Create the Python 2 decompilation script
-    # Use absolute path for the script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    decompile_script = os.path.join(script_dir, "worker_py2.py")
+    if _progress_queue is not None:
+        _progress_queue.put_nowait(('start', os.getpid(), Path(pyc_file_path).name, 0))
 
-    # Prepare the command - use absolute paths
-    cmd = [python2_exe, decompile_script, str(pyc_file.absolute())]
+    start_us = now_us()
+    success, message, response = _run_python2(python2_exe, Path(pyc_file_path), trace)
+    dedup = (response or {}).get("dedup") or {}
 
-    try:
-        # Run Python 2.7 to decompile
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            cwd=script_dir
-        )
+    if _progress_queue is not None:
+        try:
+            nbytes = os.path.getsize(pyc_file_path)
+        except OSError:
+            nbytes = 0
+        _progress_queue.put_nowait(('end', os.getpid(), "", nbytes))
 
-        if result.returncode == 0:
-            # Parse the JSON result
-            try:
-                response = json.loads(result.stdout)
-                if response["success"]:
-                    return pyc_file_path, True, response["output_file"]
-                else:
-                    return pyc_file_path, False, response.get("error", "Unknown error")
-            except json.JSONDecodeError:
-                # Fallback: check if .py file was created
-                py_file = pyc_file.with_suffix('.py')
-                if py_file.exists():
-                    return pyc_file_path, True, str(py_file)
-                return pyc_file_path, False, "Failed to parse response"
-        else:
-            error_msg = result.stderr.strip() if result.stderr else "Decompilation failed"
-            return pyc_file_path, False, error_msg
+    if not trace:
+        return pyc_file_path, success, message, [], dedup
+
+    child_trace = response.get("trace") if response else None
+    events = _trace_events(Path(pyc_file_path), start_us, now_us(), child_trace)
+    return pyc_file_path, success, message, events, dedup
+
+
+def _run_python2(python2_exe: str, pyc_file: Path, trace: bool) -> Tuple[bool, str, Optional[Dict]]:
+    """Decompile one file in this process's Python2Server; returns (success, result_message, response)"""
+    global _server
 
-    except subprocess.TimeoutExpired:
-        return pyc_file_path, False, "Decompilation timed out"
+    if _server is not None and _server.key != (python2_exe, trace):
+        _server.close()
+        _server = None
+
+    try:
+        if _server is None:
+            _server = Python2Server(python2_exe, trace)
+        response = _server.request(pyc_file, TIMEOUT)
     except Exception as e:
-        return pyc_file_path, False, str(e)
\ No newline at end of file
+        # A timeout, a crash or a garbled reply: start a fresh process for the next file
+        stderr = ''
+        if _server is not None:
+            _server.close()
+            stderr = _server.stderr()
+            _server = None
+        if isinstance(e, queue.Empty):
+            message = "Decompilation timed out"
+        else:
+            message = str(e)
+        if stderr and stderr not in message:
+            message += '\n' + stderr
+        return False, message, None
+
+    if response["success"]:
+        return True, response["output_file"], response
+    return False, response.get("error") or "Unknown error", response
@@ -9,11 +9,28 @@ from __future__ import print_function
 import sys
 import os
 import json
+import time
+
+# Process start, reported back so the parent can draw the spawn cost
+PROCESS_START = time.time()
 
 # Add the current directory to path to use the local custom uncompyle6
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-def decompile_file(pyc_file):
+def _trace_us(seconds):
+    """time.time() seconds to integer microseconds (trace-event timestamps)"""
+    return int(seconds * 1000000)
+
+
+def _dedup_counts():
+    """(hits, misses) of the deparser's function body cache so far"""
+    pysource = sys.modules.get('uncompyle6.semantics.pysource')
+    if pysource is None:
+        return 0, 0
+    return pysource.body_cache_stats['hits'], pysource.body_cache_stats['misses']
+
+
+def decompile_file(pyc_file, trace=False, start_time=PROCESS_START):
     """Decompile a single .pyc file and return JSON result"""
 
     result = {
@@ -21,16 +38,24 @@ def decompile_file(pyc_file):
         "output_file": None,
         "error": None
     }
+    phases = []
+    hits, misses = _dedup_counts()
+
+    def phase(name, start):
+        phases.append({"name": name, "ts": _trace_us(start), "dur": _trace_us(time.time() - start)})
 
     try:
+        start = time.time()
         from uncompyle6.main import uncompyle_file
+        if trace:
+            phase("import", start)
 
         # Determine output file
         output_file = pyc_file[:-1] if pyc_file.endswith('.pyc') else pyc_file + '.py'
 
         # Decompile
         with open(output_file, 'w') as f:
-            uncompyle_file(pyc_file, f)
+            uncompyle_file(pyc_file, f, phase=phase if trace else None)
 
         # Verify file was created
         if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
@@ -49,13 +74,94 @@ def decompile_file(pyc_file):
         except:
             pass
 
+    new_hits, new_misses = _dedup_counts()
+    result["dedup"] = {"hits": new_hits - hits, "misses": new_misses - misses}
+
+    if trace:
+        result["trace"] = {"start": _trace_us(start_time), "phases": phases}
     return result
 
 
+def serve(trace=False):
+    """Persistent mode: decompile each path read from stdin, one JSON line per file
+
+    uncompyle6 stays imported and its function body cache stays warm from
+    one file to the next.
+    """
+    replies = sys.stdout
+    # anything the decompiler prints must not end up between the replies
+    sys.stdout = sys.stderr
+
+    served = 0
+    for line in iter(sys.stdin.readline, ''):
+        pyc_file = line.rstrip('\r\n')
+        if not pyc_file:
+            continue
+        # the first file also pays for starting this process
+        start_time = PROCESS_START if not served else time.time()
+        served += 1
+        if os.path.exists(pyc_file):
+            result = decompile_file(pyc_file, trace=trace, start_time=start_time)
+        else:
+            result = {
+                "success": False,
+                "error": "File not found: {}".format(pyc_file)
+            }
+        replies.write(json.dumps(result) + '\n')
+        replies.flush()
+
+
+def _text(value):
+    """Byte strings from the marshal stream as JSON-safe text"""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def probe_files(pyc_files):
+    """Header and top-level info for each file (see uncompyle6.load.probe_module)"""
+    from uncompyle6.load import probe_module
+
+    results = []
+    for pyc_file in pyc_files:
+        result = {"file": pyc_file, "error": None, "bad_magic": False}
+        try:
+            probe = probe_module(pyc_file)
+            probe['co_filename'] = _text(probe['co_filename'])
+            probe['co_name'] = _text(probe['co_name'])
+            probe['co_names'] = [_text(name) for name in probe['co_names']]
+            result.update(probe)
+        except ImportError as e:
+            # unknown or bad magic number: load_module would fail the same way
+            result["error"] = str(e)
+            result["bad_magic"] = True
+        except Exception as e:
+            result["error"] = str(e)
+        results.append(result)
+    return results
+
+
 def main():
     """Main entry point"""
 
-    if len(sys.argv) < 2:
+    # The deparser walks statements and expressions on a stack of its own,
+    # but still recurses once per nested function, class or lambda body:
+    # make_function, build_class and gen_source walk each body with a
+    # traverse() of its own, as do print_super_classes and the lambda
+    # defaults in make_function.
+    sys.setrecursionlimit(5000)
+
+    if sys.argv[1:] == ['--probe']:
+        # Batch mode: file paths on stdin, one per line
+        pyc_files = [line.rstrip('\r\n') for line in sys.stdin if line.strip()]
+        print(json.dumps(probe_files(pyc_files)))
+        sys.exit(0)
+
+    if '--serve' in sys.argv[1:]:
+        serve(trace='--trace' in sys.argv[1:])
+        sys.exit(0)
+
+    if len([arg for arg in sys.argv[1:] if arg != '--trace']) < 1:
         result = {
             "success": False,
             "error": "No input file specified"
@@ -63,7 +169,11 @@ def main():
         print(json.dumps(result))
         sys.exit(1)
 
-    pyc_file = sys.argv[1]
+    args = sys.argv[1:]
+    trace = '--trace' in args
+    if trace:
+        args.remove('--trace')
+    pyc_file = args[0]
 
     if not os.path.exists(pyc_file):
         result = {
@@ -74,7 +184,7 @@ def main():
         sys.exit(1)
 
     # Decompile the file
-    result = decompile_file(pyc_file)
+    result = decompile_file(pyc_file, trace=trace)
 
     # Output JSON result
     print(json.dumps(result))
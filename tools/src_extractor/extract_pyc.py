@@ -12,7 +12,7 @@ from pathlib import Path
 
 # Add parent directory to path to import helper
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from helper import ProgressDisplay
+from helper import ProgressDisplay, TraceRecorder, NullTraceRecorder
 
 # Add current directory to path for pkg_handler
 sys.path.insert(0, str(Path(__file__).parent))
@@ -38,6 +38,12 @@ def parse_arguments():
         action='store_true',
         help='Extract only .pyc files (default: extract both .py and .pyc)'
     )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Write a Chrome trace-event timeline of the run to FILE (e.g. out.json)',
+        default=None
+    )
     return parser.parse_args()
 
 
@@ -73,16 +79,27 @@ def main():
     # Prepare output directory
     output_dir = prepare_output_directory()
 
+    trace = TraceRecorder(args.trace, process_name='extract_pyc') if args.trace else NullTraceRecorder()
+    try:
+        run_extraction(args, packages_dir, output_dir, trace)
+    finally:
+        if args.trace:
+            trace.save()
+            print(f"Trace written to: {args.trace}")
+
+
+def run_extraction(args, packages_dir: Path, output_dir: Path, trace):
+    """Scan the packages and extract their Python files"""
     # Initialize handler
-    handler = PKGHandler(packages_dir, output_dir, verbose=args.verbose)
+    handler = PKGHandler(packages_dir, output_dir, verbose=args.verbose, trace=trace)
 
     # Find PKG files with Python content
     if args.pyc_only:
         print("\nScanning for PKG files containing .pyc files...")
-        pkg_files = handler.find_pkg_with_python(pyc_only=True)
     else:
         print("\nScanning for PKG files containing Python files (.py and .pyc)...")
-        pkg_files = handler.find_pkg_with_python(pyc_only=False)
+    with trace.span("scan packages", cat='scan'):
+        pkg_files = handler.find_pkg_with_python(pyc_only=args.pyc_only)
 
     if not pkg_files:
         print("No PKG files with Python content found.")
@@ -92,7 +109,8 @@ def main():
 
     # Get full list of Python files for progress tracking
     print("\nAnalyzing PKG contents...")
-    python_files = handler.get_all_python_files(pkg_files, pyc_only=args.pyc_only)
+    with trace.span("analyze packages", cat='scan'):
+        python_files = handler.get_all_python_files(pkg_files, pyc_only=args.pyc_only)
     total_file_count = sum(len(files) for files in python_files.values())
 
     if args.pyc_only:
@@ -110,7 +128,8 @@ def main():
 
     # Extract Python files
     print("\nStarting extraction...")
-    extracted_count = handler.extract_python_files(pkg_files, progress, pyc_only=args.pyc_only)
+    with trace.span("extract packages", cat='extract'):
+        extracted_count = handler.extract_python_files(pkg_files, progress, pyc_only=args.pyc_only)
 
     print(f"\n[DONE] Extraction complete!")
     if args.pyc_only:
@@ -7,17 +7,23 @@ import os
 import zipfile
 import tempfile
 import shutil
+import sys
 from pathlib import Path
 from typing import List, Dict, Set
 
+# Add parent directory to path to import helper
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from helper import NullTraceRecorder
+
 
 class PKGHandler:
     """Handles PKG file operations"""
 
-    def __init__(self, packages_dir: Path, output_dir: Path, verbose: bool = False):
+    def __init__(self, packages_dir: Path, output_dir: Path, verbose: bool = False, trace=None):
         self.packages_dir = packages_dir
         self.output_dir = output_dir
         self.verbose = verbose
+        self.trace = trace if trace is not None else NullTraceRecorder()
 
     def find_pkg_with_python(self, pyc_only: bool = False) -> List[Path]:
         """Find all PKG files that contain Python files"""
@@ -32,7 +38,7 @@ class PKGHandler:
         for pkg_file in pkg_files:
             try:
                 # PKG files are ZIP archives
-                with zipfile.ZipFile(pkg_file, 'r') as zf:
+                with self.trace.span(f"scan {pkg_file.name}", cat='scan'), zipfile.ZipFile(pkg_file, 'r') as zf:
                     # Check if it contains Python files
                     if pyc_only:
                         python_files = [f for f in zf.namelist() if f.endswith('.pyc')]
@@ -67,7 +73,7 @@ class PKGHandler:
 
         for pkg_file in pkg_files:
             try:
-                with zipfile.ZipFile(pkg_file, 'r') as zf:
+                with self.trace.span(f"list {pkg_file.name}", cat='scan'), zipfile.ZipFile(pkg_file, 'r') as zf:
                     if pyc_only:
                         python_files = [f for f in zf.namelist() if f.endswith('.pyc')]
                     else:
@@ -93,7 +99,8 @@ class PKGHandler:
             progress.update_current_pkg(pkg_file.name)
 
             try:
-                with zipfile.ZipFile(pkg_file, 'r') as zf:
+                with self.trace.span(f"extract {pkg_file.name}", cat='extract') as span_args, \
+                        zipfile.ZipFile(pkg_file, 'r') as zf:
                     # Get list of Python files
                     if pyc_only:
                         python_files = [f for f in zf.namelist() if f.endswith('.pyc')]
@@ -125,12 +132,14 @@ class PKGHandler:
                                     shutil.copyfileobj(source, target)
 
                             total_extracted += 1
-                            progress.update(clean_path)
+                            progress.update(clean_path, nbytes=zf.getinfo(python_file).file_size)
 
                         except Exception as e:
                             if self.verbose:
                                 print(f"\nError extracting {python_file}: {e}")
 
+                    span_args['files'] = len(python_files)
+
             except Exception as e:
                 if self.verbose:
                     print(f"\nError processing {pkg_file.name}: {e}")